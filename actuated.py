@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+感應式（actuated）號誌邏輯：最短 / 最長綠燈 + gap-out，每秒評估一次
+
+- 階段（stage）= 相位計畫中的綠燈 phase；階段服務哪些車道由 webster.stage_lane_mask 推導
+- 綠燈中：服務車道停止線前 STOPBAR_ZONE 公尺內都沒有車的時間連續達 GAP 秒 → gap-out；
+  綠燈達 max_green → max-out；未達 min_green 不結束（ActuatedPhase）。
+  e2 有 150 m 長，整條偵測器上任何一台車都算需求的話綠燈幾乎不會 gap-out，
+  所以只看停止線前的短區段（StopBarZone，只對目前綠燈服務的車道逐車查位置）
+- 其他階段都沒有車時不結束綠燈（rest in green）
+- 黃燈跑完計畫中的秒數後，依序找下一個有車的階段（都沒車就照順序）；
+  也可傳入 choose_next(vehicles) 由外部策略（例如 Max-Pressure）決定下一個綠燈
+
+控制器以 update(occupied, vehicles, dt) 驅動，回傳要切換的新 phase（或 None），
+本身不呼叫 TraCI；traci_actuated.py 每秒以 subscription 讀一次偵測器後呼叫。
+ActuatedPhase 也可單獨使用：Max-Pressure / PPO 的綠燈長度改為每秒判斷延長或結束
+（TRACI_MP_ACTUATED=1 / TRACI_PPO_ACTUATED=1），黃燈與下一個綠燈的選擇仍由各控制器決定。
+
+參數可用環境變數覆寫：TRACI_ACT_MIN_GREEN / TRACI_ACT_MAX_FACTOR / TRACI_ACT_GAP / TRACI_ACT_ZONE
+"""
+
+import os
+
+import numpy as np
+
+from webster import stage_lane_mask, stage_phases
+
+MIN_GREEN = 5.0          # s
+MAX_GREEN_FACTOR = 2.0   # max green = 計畫綠燈 × 此倍數
+GAP = 3.0                # s，停止線區段連續無車多久後結束綠燈
+STOPBAR_ZONE = 30.0      # m，停止線前多長的範圍內有車才算需求（約 2 s 的自由車流行駛距離）
+
+ACT_MIN_GREEN = float(os.environ.get("TRACI_ACT_MIN_GREEN", MIN_GREEN))
+ACT_MAX_FACTOR = float(os.environ.get("TRACI_ACT_MAX_FACTOR", MAX_GREEN_FACTOR))
+ACT_GAP = float(os.environ.get("TRACI_ACT_GAP", GAP))
+ACT_ZONE = float(os.environ.get("TRACI_ACT_ZONE", STOPBAR_ZONE))
+
+
+class StopBarZone:
+    """
+    停止線前 zone 公尺內有沒有車：每條車道的 e2 終點往回 zone 公尺，
+    車輛 lane position 落在其中即算有車。只查被問到的車道，找到一台就停止。
+    """
+
+    def __init__(self, traci, index, zone=ACT_ZONE):
+        self.traci = traci
+        self.zone = zone
+        self.detectors = index.detector_ids
+        self.begin = [traci.lanearea.getPosition(d) + traci.lanearea.getLength(d) - zone if d else None
+                      for d in self.detectors]
+
+    def occupied(self, lanes, vehicle_ids=None):
+        """
+        lanes: 車道 index（對齊 NetworkIndex.lanes）；任一條車道的區段內有車即為 True。
+        vehicle_ids(det) → e2 上的車輛 id（已 subscribe 時傳入，預設呼叫 getLastStepVehicleIDs）。
+        """
+        vehicle_ids = vehicle_ids or self.traci.lanearea.getLastStepVehicleIDs
+        for k in lanes:
+            det = self.detectors[k]
+            if det is None:
+                continue
+            begin = self.begin[k]
+            for vid in vehicle_ids(det):
+                if self.traci.vehicle.getLanePosition(vid) >= begin:
+                    return True
+        return False
+
+
+class ActuatedPhase:
+    """
+    綠燈的延長 / 結束判斷（每秒呼叫一次 update）：
+    未達 min_green 一律延長；停止線區段連續無車 gap 秒 → "gap"；達 max_green → "max"。
+    非綠燈 phase（黃燈等）不處理，由呼叫端照計畫秒數。
+    """
+
+    def __init__(self, plan, index, step_length=0.1, min_green=ACT_MIN_GREEN,
+                 max_green_factor=ACT_MAX_FACTOR, gap=ACT_GAP):
+        self.stages = stage_phases(plan)
+        self.mask = stage_lane_mask(plan, index)          # (S, N_lane)
+        self.stage_of = {int(p): s for s, p in enumerate(self.stages)}
+        seconds = plan.durations * step_length
+        self.min_green = np.minimum(min_green, seconds[self.stages] * max_green_factor)
+        self.max_green = seconds[self.stages] * max_green_factor
+        self.gap = gap
+        self.lanes_of = [tuple(int(k) for k in np.flatnonzero(row)) for row in self.mask]
+        self.decision_steps = max(1, int(round(1.0 / step_length)))     # 每秒評估一次
+        self.step_length = step_length
+
+        self.phase = None
+        self.elapsed = 0.0
+        self.gap_timer = 0.0
+        self.gap_outs = 0
+        self.max_outs = 0
+        self.green_seconds = []    # 最近的綠燈長度（只留最後 256 筆）
+
+    def is_green(self, phase):
+        return phase in self.stage_of
+
+    def lanes(self, phase):
+        """phase 服務的車道 index（非綠燈為空）。"""
+        stage = self.stage_of.get(phase)
+        return () if stage is None else self.lanes_of[stage]
+
+    def update(self, phase, occupied, dt=1.0):
+        """綠燈 phase 又過了 dt 秒；回傳可以結束的原因（"gap" / "max"）或 None（延長）。"""
+        if phase != self.phase:
+            self.phase = phase
+            self.elapsed = 0.0
+            self.gap_timer = 0.0
+        stage = self.stage_of[phase]
+        self.elapsed += dt
+        self.gap_timer = 0.0 if occupied else self.gap_timer + dt
+        if self.elapsed < self.min_green[stage]:
+            return None
+        if self.gap_timer >= self.gap:
+            return "gap"
+        if self.elapsed >= self.max_green[stage]:
+            return "max"
+        return None
+
+    def poll(self, phase, steps_in_phase, zone):
+        """
+        控制器每步呼叫（phase 為綠燈時）：綠燈每滿 1 秒讀一次停止線區段並判斷，
+        可以結束時計數並回傳 True，其餘步數只是一個整數比較。
+        """
+        if steps_in_phase % self.decision_steps:
+            return False
+        reason = self.update(phase, zone.occupied(self.lanes(phase)), self.decision_steps * self.step_length)
+        if reason is None:
+            return False
+        self.ended(reason)
+        return True
+
+    def ended(self, reason):
+        """呼叫端確定結束（或重新開始）這個綠燈：計數並重設計時。"""
+        if reason == "gap":
+            self.gap_outs += 1
+        else:
+            self.max_outs += 1
+        self.green_seconds = (self.green_seconds + [self.elapsed])[-256:]
+        self.phase = None
+
+
+class ActuatedController:
+    """單一路口的感應式控制狀態機（時間單位：秒）。"""
+
+    def __init__(self, plan, index, step_length=0.1, min_green=ACT_MIN_GREEN,
+                 max_green_factor=ACT_MAX_FACTOR, gap=ACT_GAP, choose_next=None):
+        self.plan = plan
+        self.step_length = step_length
+        self.green = ActuatedPhase(plan, index, step_length, min_green, max_green_factor, gap)
+        self.stages = self.green.stages
+        self.mask = self.green.mask
+        self.stage_of = self.green.stage_of
+        self.phase_seconds = plan.durations * step_length
+        self.choose_next = choose_next
+
+        self.phase = int(self.stages[0])
+        self.elapsed = 0.0
+        self.next_stage = None
+
+    @property
+    def gap_outs(self):
+        return self.green.gap_outs
+
+    @property
+    def max_outs(self):
+        return self.green.max_outs
+
+    @property
+    def green_seconds(self):
+        return self.green.green_seconds
+
+    def green_lanes(self):
+        """目前綠燈服務的車道 index（黃燈為空），呼叫端據此讀停止線區段。"""
+        return self.green.lanes(self.phase)
+
+    def _has_demand(self, vehicles, exclude=None):
+        """(S,) bool：各階段服務車道上是否有車。"""
+        demand = (self.mask & (vehicles > 0)[None, :]).any(axis=1)
+        if exclude is not None:
+            demand[exclude] = False
+        return demand
+
+    def _pick_next(self, vehicles, current):
+        if self.choose_next is not None:
+            phase = int(self.choose_next(vehicles))
+            if phase in self.stage_of:
+                return self.stage_of[phase]
+        demand = self._has_demand(vehicles)
+        n = len(self.stages)
+        for k in range(1, n + 1):
+            s = (current + k) % n
+            if demand[s]:
+                return s
+        return (current + 1) % n
+
+    def update(self, occupied, vehicles, dt=1.0):
+        """
+        occupied: 目前綠燈的停止線區段是否有車（green_lanes() 的車道）；
+        vehicles: (N_lane,) 與 NetworkIndex.lanes 對齊。
+        回傳新的 phase index（需要切換時）或 None。
+        """
+        self.elapsed += dt
+        stage = self.stage_of.get(self.phase)
+        if stage is not None:
+            reason = self.green.update(self.phase, occupied, dt)
+            if reason is None:
+                return None
+            if not self._has_demand(vehicles, exclude=stage).any():
+                return None                     # rest in green
+            self.green.ended(reason)
+            self.next_stage = self._pick_next(vehicles, stage)
+            nxt = int(self.plan.next_phase[self.phase])
+            self.phase = nxt if self.plan.is_yellow[nxt] else int(self.stages[self.next_stage])
+        else:
+            # 黃燈（或其他過渡 phase）照計畫秒數
+            if self.elapsed + 1e-9 < self.phase_seconds[self.phase]:
+                return None
+            if self.next_stage is None:
+                self.next_stage = self._pick_next(vehicles, -1)
+            self.phase = int(self.stages[self.next_stage])
+            self.next_stage = None
+        self.elapsed = 0.0
+        return self.phase
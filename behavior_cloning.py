@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior cloning：記錄基準控制器的 (state, action)，離線擬合 PPO policy 作為起點
+
+記錄（TRACI_BC_LOG=<資料夾>）：
+- traci.maxpreesure.py（group 模式）在每個 group 結尾的決策點，
+  寫入與 traci_ppo_signal_control.get_state 相同的 25 維 state 與 action（0 = 保持、1 = 切換）。
+  Webster 是固定週期，group 結尾永遠是「切換」、與 state 無關，不能當 keep / switch 的示範，不記錄
+- traci.LLM.RAP.compare.py 在 movement 結尾記錄選擇的 movement index（0–3，供 policy_table.py 蒸餾，
+  action 意義不同）；每個 shard 記錄 source，train 只讀 KEEP_SWITCH_SOURCES，同資料夾也不會混用
+- 以 np.lib.format.open_memmap 預先配置固定大小的 .npy shard（states / actions 各一檔），
+  寫滿換下一個；每個 writer 有自己的 meta-<writer>.json 記錄各 shard 實際筆數
+  （多個控制器同時寫同一個資料夾也不會互相覆蓋）。讀取時以 mmap 開啟，不整批載入
+
+訓練：
+- 線性 softmax policy（與 PPO 相同的 policy_W / policy_b），mini-batch cross-entropy
+- 先標準化 state 再訓練，結束時把平均 / 標準差折回權重，輸出可直接給 TRACI_PPO_WEIGHTS
+
+用法：
+    TRACI_BC_LOG=runs/bc/mp python traci.maxpreesure.py
+    python behavior_cloning.py train runs/bc/mp --out runs/ppo_bc.npz
+    TRACI_PPO_WEIGHTS=runs/ppo_bc.npz python traci_ppo_signal_control.py
+"""
+
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+STATE_DIM = 25
+ACTION_DIM = 2
+STATE_APPROACHES = ("EB", "SB", "WB", "NB")   # get_state 的 approach 順序
+SHARD_SIZE = 16384                           # 每個 shard 的筆數
+
+BC_LOG = os.environ.get("TRACI_BC_LOG", "")
+
+# shard source（open_writer 的名稱，可用萬用字元）：action 為 0 = 保持 / 1 = 切換 的記錄者
+KEEP_SWITCH_SOURCES = ("max_pressure",)
+MOVEMENT_SOURCES = ("llm",)                  # action 為 movement index（policy_table.py --decisions）
+
+
+def read_state(traci, detectors, phase_idx):
+    """與 traci_ppo_signal_control.get_state 相同的 25 維 state（逐車道 queue、halting、phase）。"""
+    dets = [d for a in STATE_APPROACHES for d in detectors[a]]
+    q = [traci.lanearea.getLastStepVehicleNumber(d) for d in dets]
+    h = [traci.lanearea.getLastStepHaltingNumber(d) for d in dets]
+    return q + h + [phase_idx]
+
+
+# -------------------------
+# 記錄：memmap shard
+# -------------------------
+
+class ShardWriter:
+    """
+    (state, action) 依序寫入 out_dir/states-<writer>-XXXXX.npy、actions-<writer>-XXXXX.npy，
+    shard 清單寫在自己的 meta-<writer>.json（writer = source-時間-pid），不讀寫其他 writer 的檔案。
+    """
+
+    def __init__(self, out_dir, source, shard_size=SHARD_SIZE, state_dim=STATE_DIM):
+        self.out_dir = out_dir
+        self.source = source
+        self.shard_size = shard_size
+        self.state_dim = state_dim
+        os.makedirs(out_dir, exist_ok=True)
+        self.writer = f"{source}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.meta_path = os.path.join(out_dir, f"meta-{self.writer}.json")
+        self.meta = {"state_dim": state_dim, "source": source, "shards": []}
+        self._states = self._actions = None
+        self._n = 0
+        self.total = 0
+
+    def _open_shard(self):
+        tag = f"{self.writer}-{len(self.meta['shards']):05d}"
+        self._names = (f"states-{tag}.npy", f"actions-{tag}.npy")
+        self._states = np.lib.format.open_memmap(
+            os.path.join(self.out_dir, self._names[0]), mode="w+", dtype=np.float32,
+            shape=(self.shard_size, self.state_dim))
+        self._actions = np.lib.format.open_memmap(
+            os.path.join(self.out_dir, self._names[1]), mode="w+", dtype=np.int8,
+            shape=(self.shard_size,))
+        self._n = 0
+        self.meta["shards"].append({"states": self._names[0], "actions": self._names[1],
+                                    "n": 0, "source": self.source})
+
+    def _flush_meta(self):
+        self.meta["shards"][-1]["n"] = self._n
+        self._states.flush()
+        self._actions.flush()
+        tmp = f"{self.meta_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, self.meta_path)
+
+    def append(self, state, action):
+        if self._states is None or self._n == self.shard_size:
+            if self._states is not None:
+                self._flush_meta()
+            self._open_shard()
+        self._states[self._n] = state
+        self._actions[self._n] = action
+        self._n += 1
+        self.total += 1
+
+    def close(self):
+        if self._states is not None:
+            self._flush_meta()
+            self._states = self._actions = None
+
+
+def open_writer(source):
+    """TRACI_BC_LOG 有設定時回傳 ShardWriter，否則 None（控制器預設不記錄）。"""
+    return ShardWriter(BC_LOG, source) if BC_LOG else None
+
+
+def load_shards(dirs, sources=None):
+    """
+    讀取一或多個記錄資料夾（所有 meta*.json），回傳 (states, actions, sources)。
+    sources 為 source 名稱或萬用字元（None = 全部），不符合的 shard 略過。
+    各 shard 以 mmap 開啟，只複製有效的前 n 筆。
+    """
+    states, actions, shard_sources = [], [], []
+    for d in dirs:
+        meta_paths = sorted(glob.glob(os.path.join(d, "meta*.json")))
+        if not meta_paths:
+            raise FileNotFoundError(f"no meta*.json in {d}")
+        for meta_path in meta_paths:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            for shard in meta["shards"]:
+                n = shard["n"]
+                if n == 0:
+                    continue
+                if sources is not None and not any(fnmatch.fnmatchcase(shard["source"], s) for s in sources):
+                    continue
+                states.append(np.load(os.path.join(d, shard["states"]), mmap_mode="r")[:n])
+                actions.append(np.load(os.path.join(d, shard["actions"]), mmap_mode="r")[:n])
+                shard_sources += [shard["source"]] * n
+    if not states:
+        return np.empty((0, STATE_DIM), np.float32), np.empty(0, np.int64), []
+    return np.concatenate(states), np.concatenate(actions).astype(np.int64), shard_sources
+
+
+# -------------------------
+# 離線訓練
+# -------------------------
+
+def train(states, actions, epochs=50, batch_size=256, lr=0.05, seed=0, balance=True):
+    """
+    mini-batch softmax cross-entropy，回傳 (policy_W, policy_b, 訓練準確率)。
+    balance=True 時依 action 頻率反比加權（MP 多數決策是「保持」）。
+    """
+    y = np.asarray(actions)
+    if len(y) and (y.min() < 0 or y.max() >= ACTION_DIM):
+        bad = sorted(set(np.unique(y[(y < 0) | (y >= ACTION_DIM)]).tolist()))
+        raise ValueError(f"actions must be in [0, {ACTION_DIM}) (keep / switch), got {bad}; "
+                         f"movement-index shards (sources {MOVEMENT_SOURCES}) belong to policy_table.py")
+    rng = np.random.default_rng(seed)
+    X = states.astype(np.float64)
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std < 1e-6] = 1.0
+    Z = (X - mean) / std
+    counts = np.bincount(y, minlength=ACTION_DIM).astype(np.float64)
+    weight = np.ones(ACTION_DIM)
+    if balance and (counts > 0).all():
+        weight = counts.sum() / (ACTION_DIM * counts)
+    W = np.zeros((X.shape[1], ACTION_DIM))
+    b = np.zeros(ACTION_DIM)
+    onehot = np.eye(ACTION_DIM)[y]
+    sample_w = weight[y]
+
+    for _ in range(epochs):
+        order = rng.permutation(len(Z))
+        for start in range(0, len(Z), batch_size):
+            idx = order[start:start + batch_size]
+            logits = Z[idx] @ W + b
+            logits -= logits.max(axis=1, keepdims=True)
+            p = np.exp(logits)
+            p /= p.sum(axis=1, keepdims=True)
+            g = (p - onehot[idx]) * sample_w[idx, None] / len(idx)
+            W -= lr * (Z[idx].T @ g)
+            b -= lr * g.sum(axis=0)
+
+    # 把標準化折回原始 state 空間：z·W + b = s·(W/σ) + (b − (μ/σ)·W)
+    W_raw = W / std[:, None]
+    b_raw = b - (mean / std) @ W
+    acc = float(((X @ W_raw + b_raw).argmax(axis=1) == y).mean())
+    return W_raw.astype(np.float32), b_raw.astype(np.float32), acc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Behavior cloning warm start for PPO")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("train")
+    p.add_argument("dirs", nargs="+", help="TRACI_BC_LOG 記錄資料夾")
+    p.add_argument("--out", default=os.path.join("runs", "ppo_bc.npz"))
+    p.add_argument("--epochs", type=int, default=50)
+    p.add_argument("--batch-size", type=int, default=256)
+    p.add_argument("--lr", type=float, default=0.05)
+    p.add_argument("--no-balance", action="store_true")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--source", action="append", default=None,
+                   help=f"只讀這些 source 的 shard（可用萬用字元、可重複），預設 {' '.join(KEEP_SWITCH_SOURCES)}")
+    p = sub.add_parser("info")
+    p.add_argument("dirs", nargs="+")
+    args = parser.parse_args()
+
+    # 展開萬用字元（Windows shell 不會展開）
+    dirs = [d for pattern in args.dirs for d in (sorted(glob.glob(pattern)) or [pattern])]
+    wanted = None if args.cmd == "info" else (args.source or KEEP_SWITCH_SOURCES)
+    states, actions, sources = load_shards(dirs, wanted)
+    counts = {s: sources.count(s) for s in dict.fromkeys(sources)}
+    print(f"{len(actions)} pairs from {len(dirs)} dirs {counts}; "
+          f"switch ratio {actions.mean() if len(actions) else 0:.2f}")
+    if args.cmd == "info" or len(actions) == 0:
+        return
+    if actions.max() >= ACTION_DIM:
+        raise SystemExit(f"actions >= {ACTION_DIM} in the selected shards; "
+                         f"train takes keep / switch recorders only ({' '.join(KEEP_SWITCH_SOURCES)})")
+    if len(np.unique(actions)) < ACTION_DIM:
+        raise SystemExit(f"only action {actions[0]} in the selected shards; "
+                         "a single-class dataset would train a constant policy")
+
+    t0 = time.perf_counter()
+    W, b, acc = train(states, actions, args.epochs, args.batch_size, args.lr, args.seed,
+                      balance=not args.no_balance)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    # value 網路沒有監督訊號，從 0 開始由 PPO 學
+    np.savez(args.out, policy_W=W, policy_b=b,
+             value_W=np.zeros(STATE_DIM, dtype=np.float32), value_b=0.0)
+    print(f"trained in {time.perf_counter() - t0:.2f} s, train accuracy {acc * 100:.1f}%")
+    print(f"weights → {args.out}  (TRACI_PPO_WEIGHTS={args.out} python traci_ppo_signal_control.py)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Sequential-testing benchmark：結果顯著就停
+
+兩個控制器（例如 max_pressure vs webster）以相同 seed 成對執行（common random
+numbers），持續平行啟動新的 seed，直到「平均 delay 差」的 95% 信賴區間寬度
+小於 --target-width，或用完 --budget（每個控制器最多幾次 run）。
+
+每個 run 都是獨立的 headless SUMO 子程序，結果由 results store 讀回；
+e2 偵測器輸出寫在 runs/<run_id>/（可用 detector_outputs.load_e2_runs 讀取）。
+最後輸出實際用了幾次 run，以及相較固定 --fixed-runs 次省下多少計算。
+
+用法：
+    python benchmark.py max_pressure webster --target-width 1.0 --parallel 4
+"""
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import results_store
+from results_report import mean_ci, welch_diff_ci
+from traci_run import CONTROLLERS
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+POLL_INTERVAL = 0.2  # 秒
+RUNS_DIR = "runs"
+
+
+def launch_run(controller, seed, db_path, sumo_binary="sumo", log_dir=None, route_file=None,
+               sim_time=None, extra_env=None, run_id=None):
+    """以子程序啟動一次 run，回傳 (run_id, Popen)。extra_env 會覆寫在其他環境變數之後。"""
+    run_id = run_id or f"bench-{controller}-s{seed}-{uuid.uuid4().hex[:6]}"
+    # 每個 run 的 e2 輸出放在 runs/<run_id>/（SUMO 不會自己建資料夾）
+    os.makedirs(os.path.join(SCRIPT_DIR, RUNS_DIR, run_id), exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        "TRACI_SEED": str(seed),
+        "TRACI_RUN_ID": run_id,
+        "TRACI_RESULTS_DB": db_path,
+        "TRACI_SUMO_BINARY": sumo_binary,
+        "TRACI_RECORD": "1",
+        "TRACI_OUTPUT_PREFIX": f"{RUNS_DIR}/{run_id}/",
+    })
+    if route_file:
+        env["TRACI_ROUTE_FILE"] = os.path.abspath(route_file)
+    if sim_time:
+        env["TRACI_SIM_TIME"] = str(sim_time)
+    if extra_env:
+        env.update({k: str(v) for k, v in extra_env.items()})
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        out = open(os.path.join(log_dir, run_id + ".log"), "w", encoding="utf-8")
+    else:
+        out = subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, "-m", "traci_run", controller],
+                            cwd=SCRIPT_DIR, env=env,
+                            stdout=out, stderr=subprocess.STDOUT)
+    if out is not subprocess.DEVNULL:
+        out.close()
+    return run_id, proc
+
+
+def diff_interval(values_a, values_b, paired=True):
+    """回傳 (平均差 a-b, 95% CI 半寬, 有效樣本數)。"""
+    if paired:
+        seeds = sorted(set(values_a) & set(values_b))
+        diffs = [values_a[s] - values_b[s] for s in seeds]
+        mean, half = mean_ci(diffs)
+        return mean, half, len(diffs)
+    mean, half = welch_diff_ci(list(values_a.values()), list(values_b.values()))
+    return mean, half, min(len(values_a), len(values_b))
+
+
+def run_sequential(controller_a, controller_b, metric="avg_delay_time",
+                   target_width=1.0, budget=30, min_runs=3, parallel=4,
+                   first_seed=1, paired=True, db_path=results_store.DEFAULT_DB,
+                   sumo_binary="sumo", log_dir=None, max_failures=3, route_file=None):
+    """
+    持續啟動成對 seed，直到 CI 寬度（2 × 半寬）<= target_width 或達到 budget。
+    回傳結果 dict（values、runs_used、stop_reason 等）。
+    """
+    controllers = (controller_a, controller_b)
+    values = {controller_a: {}, controller_b: {}}
+    wall = {controller_a: [], controller_b: []}
+    active = {}                # run_id -> (controller, seed, Popen)
+    next_seed = first_seed
+    launched = {c: 0 for c in controllers}
+    failures = 0
+    stop_reason = None
+    t0 = time.perf_counter()
+
+    def width_now():
+        _, half, n = diff_interval(values[controller_a], values[controller_b], paired)
+        return 2.0 * half, n
+
+    while True:
+        # 補滿 worker（每個 seed 兩個控制器都要跑）
+        while stop_reason is None and len(active) + 2 <= max(parallel, 2) \
+                and launched[controller_a] < budget and launched[controller_b] < budget:
+            for c in controllers:
+                run_id, proc = launch_run(c, next_seed, db_path, sumo_binary, log_dir, route_file)
+                active[run_id] = (c, next_seed, proc)
+                launched[c] += 1
+            next_seed += 1
+
+        if not active:
+            if stop_reason is None:
+                stop_reason = "budget"
+            break
+
+        time.sleep(POLL_INTERVAL)
+
+        finished = [rid for rid, (_, _, p) in active.items() if p.poll() is not None]
+        if not finished:
+            continue
+
+        ok_ids = []
+        for rid in finished:
+            c, seed, proc = active.pop(rid)
+            if proc.returncode != 0:
+                failures += 1
+                print(f"  ! {c} seed={seed} failed (exit {proc.returncode})")
+            else:
+                ok_ids.append(rid)
+        if failures > max_failures:
+            stop_reason = "failures"
+
+        # 多 episode 的 run（TRACI_PPO_EPISODES > 1）存成 <run_id>-ep<n>，取最後一個 episode
+        for run in results_store.load_final_runs(ok_ids, db_path=db_path):
+            if run.get(metric) is None:
+                continue
+            values[run["controller"]][run["seed"]] = float(run[metric])
+            wall[run["controller"]].append(run["wall_time"])
+
+        width, n = width_now()
+        print(f"  n={n:3d}  CI width={width:8.3f}  (target {target_width})")
+        if stop_reason is None and n >= min_runs and width <= target_width:
+            stop_reason = "converged"
+
+        # 已達停止條件：結束仍在跑的 run
+        if stop_reason is not None:
+            for rid, (_, _, proc) in list(active.items()):
+                proc.terminate()
+            for rid, (_, _, proc) in list(active.items()):
+                proc.wait()
+            active.clear()
+            break
+
+    diff, half, n = diff_interval(values[controller_a], values[controller_b], paired)
+    return {
+        "controllers": controllers,
+        "metric": metric,
+        "values": values,
+        "diff": diff,
+        "half_width": half,
+        "pairs": n,
+        "runs_used": {c: launched[c] for c in controllers},
+        "mean_wall_time": {c: (sum(w) / len(w) if w else float("nan")) for c, w in wall.items()},
+        "elapsed": time.perf_counter() - t0,
+        "stop_reason": stop_reason,
+    }
+
+
+def print_report(result, fixed_runs):
+    a, b = result["controllers"]
+    print("\n========== Sequential Benchmark ==========")
+    print(f"Metric              = {result['metric']}")
+    for c in (a, b):
+        vals = list(result["values"][c].values())
+        mean, half = mean_ci(vals)
+        half_txt = "inf" if math.isinf(half) else f"{half:.3f}"
+        print(f"{c:20s}= {mean:.3f} ± {half_txt}  ({len(vals)} runs)")
+    half = result["half_width"]
+    half_txt = "inf" if math.isinf(half) else f"{half:.3f}"
+    print(f"Diff ({a} - {b}) = {result['diff']:.3f} ± {half_txt}  ({result['pairs']} pairs)")
+    print(f"Stop reason         = {result['stop_reason']}")
+    print("")
+
+    used = sum(result["runs_used"].values())
+    fixed = fixed_runs * len(result["controllers"])
+    saved_runs = fixed - used
+    saved_sec = sum(
+        (fixed_runs - result["runs_used"][c]) * result["mean_wall_time"][c]
+        for c in result["controllers"]
+        if not math.isnan(result["mean_wall_time"][c])
+    )
+    print(f"Runs used           = {used} ({', '.join(f'{c}: {n}' for c, n in result['runs_used'].items())})")
+    print(f"Fixed-count runs    = {fixed} ({fixed_runs} per controller)")
+    print(f"Runs saved          = {saved_runs} ({saved_runs / fixed * 100:.1f}%)")
+    print(f"Compute saved       = {saved_sec:.1f} s (sum of per-run wall time)")
+    print(f"Elapsed             = {result['elapsed']:.1f} s")
+    print("==========================================\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential-testing controller benchmark")
+    parser.add_argument("controller_a", choices=sorted(CONTROLLERS))
+    parser.add_argument("controller_b", choices=sorted(CONTROLLERS))
+    parser.add_argument("--metric", default="avg_delay_time")
+    parser.add_argument("--target-width", type=float, default=1.0,
+                        help="平均差 95%% CI 的目標寬度（metric 單位）")
+    parser.add_argument("--budget", type=int, default=30, help="每個控制器最多幾次 run")
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--fixed-runs", type=int, default=10,
+                        help="對照用的固定 run 次數（計算省下多少）")
+    parser.add_argument("--parallel", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--unpaired", action="store_true", help="用 Welch t 而非成對差")
+    parser.add_argument("--db", default=results_store.DEFAULT_DB)
+    parser.add_argument("--sumo-binary", default="sumo")
+    parser.add_argument("--log-dir", default=None)
+    parser.add_argument("--route-file", default=None, help="scenario_gen.py 產生的 route 檔")
+    args = parser.parse_args()
+
+    if args.controller_a == args.controller_b:
+        parser.error("controller_a and controller_b must differ")
+
+    print(f"\n=== Sequential benchmark: {args.controller_a} vs {args.controller_b} ===\n")
+    result = run_sequential(
+        args.controller_a, args.controller_b, metric=args.metric,
+        target_width=args.target_width, budget=args.budget, min_runs=args.min_runs,
+        parallel=args.parallel, first_seed=args.first_seed, paired=not args.unpaired,
+        db_path=args.db, sumo_binary=args.sumo_binary, log_dir=args.log_dir,
+        route_file=args.route_file,
+    )
+    print_report(result, args.fixed_runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Lane-area (e2) 偵測器輸出：版面產生器 + 快速讀取器
+
+- write_detector_layout(): 重新產生 Traci.add.xml，每個偵測器寫到自己的檔案
+  （原本多個偵測器共用 e2_0.xml / e2_3.xml，輸出會互相交錯覆蓋）
+  可選 XML 或 SUMO 原生 CSV 輸出，period 可調
+- load_e2_run(): 把一次模擬的所有 e2_* 輸出讀成一張 NumPy 表
+  （以 detector + interval begin 排序，可轉 pandas）
+- load_e2_runs(): 多個 run 資料夾平行讀取，合併成一張表（多一欄 run）
+
+用法：
+    python detector_outputs.py layout --period 60 --format csv --output-dir runs/r001
+    python detector_outputs.py ingest runs/r001
+"""
+
+import argparse
+import csv
+import glob
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ADD_PATH = os.path.join(SCRIPT_DIR, "Traci.add.xml")
+
+DEFAULT_PERIOD = 300.0
+OUTPUT_PREFIX = "e2_"
+
+# e2 interval 中要讀的數值欄位（其餘欄位忽略）
+E2_FIELDS = (
+    "sampledSeconds", "nVehEntered", "nVehLeft", "nVehSeen",
+    "meanSpeed", "meanTimeLoss", "meanOccupancy", "maxOccupancy",
+    "meanMaxJamLengthInVehicles", "meanMaxJamLengthInMeters",
+    "maxJamLengthInVehicles", "maxJamLengthInMeters",
+    "jamLengthInVehiclesSum", "jamLengthInMetersSum",
+    "meanHaltingDuration", "maxHaltingDuration", "haltingDurationSum",
+    "startedHalts", "meanVehicleNumber", "maxVehicleNumber",
+)
+
+E2_DTYPE = np.dtype(
+    [("detector", "U64"), ("begin", "f8"), ("end", "f8")]
+    + [(name, "f8") for name in E2_FIELDS]
+)
+
+_INTERVAL_RE = re.compile(rb"<interval\s([^>]*?)/?>")
+_ATTR_RE = re.compile(rb'(\w+)="([^"]*)"')
+
+
+# -------------------------
+# 版面產生器
+# -------------------------
+
+def read_detectors(add_path=ADD_PATH):
+    """讀出 add.xml 中所有 laneAreaDetector 的屬性（list of dict）。"""
+    root = ET.parse(add_path).getroot()
+    return [dict(det.attrib) for det in root.iter("laneAreaDetector")]
+
+
+def detector_output_file(det_id, fmt="xml", output_dir=""):
+    """偵測器 det_id 的輸出檔名（相對於 add.xml 所在資料夾）。"""
+    name = f"{OUTPUT_PREFIX}{det_id}.{fmt}"
+    return os.path.join(output_dir, name).replace(os.sep, "/") if output_dir else name
+
+
+def write_detector_layout(add_path=ADD_PATH, out_path=None, period=DEFAULT_PERIOD,
+                          fmt="xml", output_dir=""):
+    """
+    以 add_path 的偵測器為基礎，重新寫出 additional 檔：
+    - 每個偵測器一個輸出檔 e2_<id>.<fmt>（fmt = xml / csv）
+    - 所有偵測器使用同一個 period（秒）
+    output_dir 相對於 out_path 所在資料夾，會自動建立（SUMO 不會幫忙建資料夾）。
+    回傳 {detector_id: 輸出檔路徑}。
+    """
+    if fmt not in ("xml", "csv"):
+        raise ValueError(f"unsupported detector output format: {fmt}")
+    if period <= 0:
+        raise ValueError("period must be positive")
+
+    out_path = out_path or add_path
+    detectors = read_detectors(add_path)
+
+    ids = [d["id"] for d in detectors]
+    dup = {i for i in ids if ids.count(i) > 1}
+    if dup:
+        raise ValueError(f"duplicate detector ids in {add_path}: {sorted(dup)}")
+
+    base_dir = os.path.dirname(os.path.abspath(out_path))
+    if output_dir:
+        os.makedirs(os.path.join(base_dir, output_dir), exist_ok=True)
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        "",
+        "<!-- generated by detector_outputs.py: one output file per detector -->",
+        "",
+        '<additional xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/additional_file.xsd">',
+        "    <!-- Detectors -->",
+    ]
+    files = {}
+    for det in detectors:
+        out_file = detector_output_file(det["id"], fmt, output_dir)
+        files[det["id"]] = os.path.join(base_dir, out_file)
+        lines.append(
+            f'    <laneAreaDetector id="{det["id"]}" lane="{det["lane"]}" '
+            f'pos="{float(det["pos"]):.2f}" length="{float(det["length"]):.2f}" '
+            f'period="{period:.2f}" file="{out_file}"/>'
+        )
+    lines.append("</additional>")
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return files
+
+
+# -------------------------
+# 快速讀取器
+# -------------------------
+
+def _parse_xml_intervals(data):
+    """以 regex 掃描 <interval .../>，比 ElementTree 快很多。"""
+    rows = []
+    for m in _INTERVAL_RE.finditer(data):
+        attrs = dict(_ATTR_RE.findall(m.group(1)))
+        rows.append((
+            attrs.get(b"id", b"").decode(),
+            float(attrs.get(b"begin", b"nan")),
+            float(attrs.get(b"end", b"nan")),
+            *(float(attrs.get(name.encode(), b"nan")) for name in E2_FIELDS),
+        ))
+    return rows
+
+
+def _parse_csv_intervals(data):
+    """SUMO 原生 CSV 輸出（欄名如 interval_begin，分隔符號通常是 ';'）。"""
+    text = data.decode("utf-8")
+    first = text.split("\n", 1)[0]
+    delimiter = ";" if first.count(";") >= first.count(",") else ","
+    rows = []
+    for rec in csv.DictReader(io.StringIO(text), delimiter=delimiter):
+        rec = {k.split("_", 1)[1] if k.startswith("interval_") else k: v
+               for k, v in rec.items() if k}
+        rows.append((
+            rec.get("id", ""),
+            float(rec.get("begin") or "nan"),
+            float(rec.get("end") or "nan"),
+            *(float(rec.get(name) or "nan") for name in E2_FIELDS),
+        ))
+    return rows
+
+
+def read_e2_file(path):
+    """讀單一 e2 輸出檔（.xml / .csv），回傳 E2_DTYPE 結構陣列。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".csv"):
+        rows = _parse_csv_intervals(data)
+    else:
+        rows = _parse_xml_intervals(data)
+    return np.array(rows, dtype=E2_DTYPE)
+
+
+def load_e2_run(run_dir=SCRIPT_DIR, pattern=OUTPUT_PREFIX + "*"):
+    """
+    讀取 run_dir 中所有 e2_* 輸出，合併成一張表。
+    以 (detector, begin) 排序；同一 (detector, begin) 只保留最後讀到的那筆
+    （避免舊版共用檔案造成的重複 interval）。
+    """
+    paths = sorted(
+        p for p in glob.glob(os.path.join(run_dir, pattern))
+        if p.endswith((".xml", ".csv"))
+    )
+    parts = [read_e2_file(p) for p in paths]
+    if not parts:
+        return np.empty(0, dtype=E2_DTYPE)
+
+    table = np.concatenate(parts)
+    order = np.lexsort((table["begin"], table["detector"]))
+    table = table[order]
+
+    # 去除重複 key（保留最後一筆）
+    key_change = np.ones(len(table), dtype=bool)
+    key_change[:-1] = (table["detector"][1:] != table["detector"][:-1]) | \
+                      (table["begin"][1:] != table["begin"][:-1])
+    return table[key_change]
+
+
+def _load_run_with_name(args):
+    run_dir, pattern = args
+    return os.path.basename(os.path.normpath(run_dir)), load_e2_run(run_dir, pattern)
+
+
+def load_e2_runs(run_dirs, pattern=OUTPUT_PREFIX + "*", processes=None):
+    """
+    平行讀取多個 run 資料夾，回傳一張表，第一欄為 run（資料夾名稱）。
+    processes=1 時不開 process pool。
+    """
+    run_dirs = list(run_dirs)
+    jobs = [(d, pattern) for d in run_dirs]
+    if processes == 1 or len(run_dirs) <= 1:
+        results = [_load_run_with_name(j) for j in jobs]
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(_load_run_with_name, jobs)
+
+    run_width = max([len(name) for name, _ in results] + [1])
+    dtype = np.dtype([("run", f"U{run_width}")] + E2_DTYPE.descr)
+    total = sum(len(t) for _, t in results)
+    out = np.empty(total, dtype=dtype)
+
+    offset = 0
+    for name, table in results:
+        n = len(table)
+        out["run"][offset:offset + n] = name
+        for field in E2_DTYPE.names:
+            out[field][offset:offset + n] = table[field]
+        offset += n
+    return out
+
+
+def to_dataframe(table):
+    """轉成 pandas DataFrame，index = (run,) detector, begin。需安裝 pandas。"""
+    import pandas as pd
+
+    df = pd.DataFrame(table)
+    keys = [k for k in ("run", "detector", "begin") if k in df.columns]
+    return df.set_index(keys).sort_index()
+
+
+# -------------------------
+# CLI
+# -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="e2 detector output layout / ingest")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_layout = sub.add_parser("layout", help="重新產生 additional 檔（每個偵測器獨立輸出）")
+    p_layout.add_argument("--add", default=ADD_PATH)
+    p_layout.add_argument("--out", default=None, help="輸出路徑（預設覆寫 --add）")
+    p_layout.add_argument("--period", type=float, default=DEFAULT_PERIOD)
+    p_layout.add_argument("--format", choices=["xml", "csv"], default="xml")
+    p_layout.add_argument("--output-dir", default="")
+
+    p_ingest = sub.add_parser("ingest", help="讀取 run 資料夾的 e2 輸出並印出摘要")
+    p_ingest.add_argument("run_dirs", nargs="+")
+    p_ingest.add_argument("--processes", type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.cmd == "layout":
+        files = write_detector_layout(args.add, args.out, args.period,
+                                      args.format, args.output_dir)
+        for det_id, path in files.items():
+            print(f"{det_id:16s} -> {path}")
+    else:
+        table = load_e2_runs(args.run_dirs, processes=args.processes)
+        print(f"Loaded {len(table)} intervals from {len(args.run_dirs)} run(s)")
+        for det in np.unique(table["detector"]):
+            rows = table[table["detector"] == det]
+            print(f"  {det:16s} intervals={len(rows):4d} "
+                  f"entered={rows['nVehEntered'].sum():8.0f} "
+                  f"meanOcc={np.nanmean(rows['meanOccupancy']):6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+全天（24 h）長時間執行 benchmark：吞吐量 + 記憶體是否持平
+
+1. 以 scenario_gen 產生全天需求（S1 流量 × am_pm 時段曲線，15 分鐘一段 flow）
+2. 每個控制器以子程序跑 --sim-time 秒（0.1 s 步長 → 24 h = 864000 步）
+3. 控制器內的 metrics.RunMonitor 每模擬小時記錄一次 RSS，寫入 results store；
+   這裡讀回來列出 steps/s 與 RSS 成長量（第 1 小時之後 → 結束），
+   成長超過 --tolerance MB 判定為不持平
+
+RSS 是 Python 控制器 process 的記憶體（SUMO 本身隨路網車輛數變化，不在此列）。
+
+用法：
+    python longrun_bench.py                                  # fixed_4phase / webster / max_pressure
+    python longrun_bench.py ppo --sim-time 21600 --jobs 2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import results_store
+import scenario_gen
+from benchmark import POLL_INTERVAL, launch_run
+from traci_run import CONTROLLERS
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DAY_SECONDS = 86400.0
+DEFAULT_CONTROLLERS = ["fixed_4phase", "webster", "max_pressure"]
+DEFAULT_TOLERANCE_MB = 20.0
+
+
+def day_scenario(duration=DAY_SECONDS, profile="am_pm", volume=None):
+    """產生（或沿用）全天情境，回傳 (scenario id, route 檔路徑)。"""
+    params = {"profile": profile, "duration": duration, "bin": 900.0}
+    if volume is not None:
+        params["volumes"] = {a: volume for a in scenario_gen.APPROACHES}
+    return scenario_gen.generate(params)
+
+
+def run_all(controllers, route_file, sim_time, db_path, jobs=1, sumo_binary="sumo",
+            log_dir=None, seed=1):
+    """最多 jobs 個控制器同時執行，回傳 {controller: (run_id, return code)}。"""
+    pending = list(controllers)
+    running = {}
+    done = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            c = pending.pop(0)
+            run_id, proc = launch_run(c, seed, db_path, sumo_binary, log_dir,
+                                      route_file, sim_time=sim_time)
+            running[c] = (run_id, proc)
+            print(f"[longrun] started {c} ({run_id})", file=sys.stderr)
+        for c, (run_id, proc) in list(running.items()):
+            rc = proc.poll()
+            if rc is not None:
+                done[c] = (run_id, rc)
+                del running[c]
+                print(f"[longrun] {c} finished (exit {rc})", file=sys.stderr)
+        time.sleep(POLL_INTERVAL)
+    return done
+
+
+def format_table(runs, tolerance):
+    lines = [
+        "| controller | sim h | wall s | steps/s | min steps/s | RSS start MB | RSS end MB "
+        "| RSS max MB | growth MB | flat |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|---:|:---:|",
+    ]
+    for r in runs:
+        growth = r.get("rss_growth_mb")
+        flat = "-" if growth is None else ("yes" if growth <= tolerance else "NO")
+
+        def mb(key):
+            v = r.get(key)
+            return "-" if v is None else f"{v:.1f}"
+
+        lines.append(
+            f"| {r['controller']} | {r['config'].get('sim_time', 0.0) / 3600:.1f} | {r['wall_time']:.0f} "
+            f"| {r['steps_per_sec']:.0f} | {r.get('steps_per_sec_min', 0.0):.0f} "
+            f"| {mb('rss_start_mb')} | {mb('rss_end_mb')} | {mb('rss_max_mb')} "
+            f"| {mb('rss_growth_mb')} | {flat} |"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="24 h memory / throughput benchmark")
+    parser.add_argument("controllers", nargs="*", default=DEFAULT_CONTROLLERS,
+                        help=f"預設 {' '.join(DEFAULT_CONTROLLERS)}；可選 {' '.join(sorted(CONTROLLERS))}")
+    parser.add_argument("--sim-time", type=float, default=DAY_SECONDS, help="模擬秒數")
+    parser.add_argument("--profile", default="am_pm", choices=sorted(scenario_gen.PROFILES))
+    parser.add_argument("--volume", type=float, default=None, help="四向基準流量 veh/h（預設同 S1）")
+    parser.add_argument("--route-file", default=None, help="直接指定 route 檔（不產生情境）")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE_MB,
+                        help="RSS 成長容許值 (MB)")
+    parser.add_argument("--sumo-binary", default="sumo")
+    parser.add_argument("--db", default=results_store.DEFAULT_DB)
+    parser.add_argument("--log-dir", default=os.path.join(SCRIPT_DIR, "runs", "longrun_logs"))
+    parser.add_argument("--series", action="store_true", help="另外列出每小時 RSS")
+    args = parser.parse_args()
+    unknown = [c for c in args.controllers if c not in CONTROLLERS]
+    if unknown:
+        parser.error(f"unknown controller(s): {', '.join(unknown)}")
+
+    route_file = args.route_file
+    if route_file is None:
+        sid, route_file = day_scenario(args.sim_time, args.profile, args.volume)
+        print(f"[longrun] scenario {sid}: {route_file}", file=sys.stderr)
+
+    done = run_all(args.controllers, route_file, args.sim_time, args.db, args.jobs,
+                   args.sumo_binary, args.log_dir, args.seed)
+    ok = [run_id for run_id, rc in done.values() if rc == 0]
+    failed = [c for c, (_, rc) in done.items() if rc != 0]
+    if failed:
+        print(f"[longrun] failed: {', '.join(failed)} (logs in {args.log_dir})", file=sys.stderr)
+
+    runs = results_store.load_final_runs(ok, db_path=args.db)
+    print(format_table(runs, args.tolerance))
+    if args.series:
+        for r in runs:
+            series = ", ".join(f"{t / 3600:.0f}h={mb:.1f}" for t, mb in r.get("rss_samples", []))
+            print(f"\n{r['controller']}: {series}")
+    grew = [r["controller"] for r in runs
+            if r.get("rss_growth_mb") is not None and r["rss_growth_mb"] > args.tolerance]
+    return 1 if failed or grew else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
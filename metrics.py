@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+長時間模擬用的串流統計與執行監控（記憶體固定，不隨步數成長）
+
+- RunningStats : Welford 平均 / 變異數 / 最小 / 最大，O(1) 記憶體
+- RunMonitor   : 每隔 sample_every 模擬秒記錄一次 RSS 與吞吐量（固定長度 deque），
+                 同時在 stderr 印一行進度（模擬時間、steps/s、RSS、預估剩餘時間）；
+                 summary() 回傳可直接併入 results store 的欄位
+- rss_mb()     : 目前 process 的 RSS（Linux 讀 /proc，其他平台用 psutil / resource）
+"""
+
+import math
+import os
+import sys
+import time
+from collections import deque
+
+# RSS 取樣最多保留幾筆（24 h / 每小時一筆 = 25 筆，留足餘裕）
+MAX_SAMPLES = 512
+
+
+def rss_mb():
+    """目前 RSS（MB）；無法取得時回傳 None。"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 單位是 bytes，Linux 是 KB（此時取到的是峰值）
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+    except ImportError:
+        return None
+
+
+class RunningStats:
+    """Welford 串流統計。"""
+
+    __slots__ = ("n", "mean", "_m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self._m2 += d * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def var(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+
+def _fmt_hms(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class RunMonitor:
+    """
+    每 sample_every 模擬秒取樣一次（在控制迴圈每步呼叫 tick(step)，平常只是一個整數比較）。
+    """
+
+    def __init__(self, total_steps, step_length, sample_every=3600.0, stream=sys.stderr):
+        self.total_steps = int(total_steps)
+        self.step_length = float(step_length)
+        self.every_steps = max(1, int(round(sample_every / step_length)))
+        self.stream = stream
+        self.samples = deque(maxlen=MAX_SAMPLES)    # (sim 秒, wall 秒, RSS MB)
+        self.throughput = RunningStats()            # 各區間 steps/s
+        self._next = 0
+        self._wall0 = time.perf_counter()
+        self._last = (0, self._wall0)
+
+    def tick(self, step):
+        if step < self._next:
+            return
+        self._next = step + self.every_steps
+        self._sample(step)
+
+    def _sample(self, step):
+        now = time.perf_counter()
+        last_step, last_wall = self._last
+        if step > last_step and now > last_wall:
+            self.throughput.add((step - last_step) / (now - last_wall))
+        self._last = (step, now)
+        rss = rss_mb()
+        self.samples.append((step * self.step_length, now - self._wall0, rss))
+        if self.stream is not None and step > 0:
+            frac = step / self.total_steps if self.total_steps else 1.0
+            rate = self.throughput.mean if self.throughput.n else 0.0
+            eta = (self.total_steps - step) / rate if rate > 0 else float("nan")
+            rss_txt = f"{rss:.1f} MB" if rss is not None else "n/a"
+            eta_txt = _fmt_hms(eta) if eta == eta else "--:--:--"
+            print(f"[progress] sim {_fmt_hms(step * self.step_length)} ({frac * 100:5.1f}%) | "
+                  f"{rate:7.0f} steps/s | RSS {rss_txt} | ETA {eta_txt}",
+                  file=self.stream, flush=True)
+
+    def finish(self, step=None):
+        """迴圈結束時呼叫：補最後一筆取樣。"""
+        self._sample(self.total_steps if step is None else step)
+
+    def summary(self):
+        rss = [s[2] for s in self.samples if s[2] is not None]
+        out = {
+            "rss_samples": [[round(t, 1), round(r, 2)] for t, _, r in self.samples if r is not None],
+            "steps_per_sec_mean": self.throughput.mean,
+            "steps_per_sec_min": self.throughput.min if self.throughput.n else 0.0,
+        }
+        if rss:
+            # 第一筆在 SUMO 剛啟動時，成長量以第二筆（第一個區間之後）為基準
+            base = rss[1] if len(rss) > 2 else rss[0]
+            out.update({
+                "rss_start_mb": rss[0],
+                "rss_end_mb": rss[-1],
+                "rss_max_mb": max(rss),
+                "rss_growth_mb": rss[-1] - base,
+            })
+        return out
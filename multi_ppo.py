@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+多路口共用參數 PPO（parameter sharing）：所有路口同一組 policy / value，transition 寫入同一個 buffer
+
+- 路網 / 偵測器 / 相位結構沿用 multi_tls.MultiTLSNetwork；state 與 traci_ppo_signal_control 相同的 25 維
+  （--neighbors 時再附上各 approach 上游路口駛向本路口的 queue、halting，共 33 維）
+- 決策只在 group 結尾（與 multi_tls 的 ppo 推論相同）：到期的路口一起組成 (k, dim) 矩陣，
+  一次 matmul + softmax 取樣 keep / switch
+- transition = 一個路口兩次決策之間；reward = 期間該路口偵測器平均每步的 −halting
+  （與單路口每步 reward 同尺度）
+- 更新：每個 episode 結束時，buffer 依路口排成 (T, K) 矩陣，GAE 沿時間倒推、所有路口同時計算；
+  之後攤平成一批，以與 traci_ppo_signal_control.ppo_update 相同的 policy gradient / value 回歸更新
+- 超參數沿用 TRACI_PPO_GAMMA / TRACI_PPO_LAMBDA / TRACI_PPO_POLICY_LR 等環境變數
+- 權重 npz 與單路口相同格式；--init 可用單路口（25 維）權重，鄰居特徵的列補 0；
+  訓練好的權重可直接給 multi_tls.py run --controller ppo --ppo-weights
+
+用法：
+    python multi_ppo.py networks/grid_3x3/grid_3x3.sumocfg --episodes 10 --neighbors --out runs/multi_ppo.npz
+    python multi_ppo.py networks/corridor_1x4/corridor_1x4.sumocfg --init runs/ppo_pretrained.npz
+    python multi_tls.py run networks/grid_3x3/grid_3x3.sumocfg --controller ppo --ppo-weights runs/multi_ppo.npz
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import multi_tls
+import results_store
+import traci_ppo_signal_control as ppo
+from multi_tls import ACTION_DIM, NEIGHBOR_DIM, STATE_DIM, STEP_LENGTH, MultiTLSNetwork, read_sumocfg
+from run_config import RUN_ID, SEED, load_traci
+
+traci = None
+
+
+# -------------------------
+# 共用參數網路
+# -------------------------
+
+class SharedPolicy:
+    """所有路口共用的線性 policy / value（與 traci_ppo_signal_control 相同的參數化）。"""
+
+    def __init__(self, state_dim, rng, weights_path=None):
+        self.state_dim = state_dim
+        self.policy_W = rng.standard_normal((state_dim, ACTION_DIM)).astype(np.float32) * 0.01
+        self.policy_b = np.zeros(ACTION_DIM, dtype=np.float32)
+        self.value_W = rng.standard_normal(state_dim).astype(np.float32) * 0.01
+        self.value_b = 0.0
+        if weights_path:
+            data = np.load(weights_path)
+            n = min(state_dim, len(data["policy_W"]))      # 25 維權重放進 33 維：鄰居列維持 0
+            self.policy_W[:] = 0.0
+            self.value_W[:] = 0.0
+            self.policy_W[:n] = data["policy_W"][:n]
+            self.policy_b[:] = data["policy_b"]
+            self.value_W[:n] = data["value_W"][:n]
+            self.value_b = float(data["value_b"])
+
+    def probs(self, S):
+        logits = S @ self.policy_W + self.policy_b
+        logits -= logits.max(axis=1, keepdims=True)
+        p = np.exp(logits)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def act(self, S, rng):
+        """(k, dim) → (action, logprob, value)，各為 (k,)。"""
+        p = self.probs(S)
+        a = (rng.random(len(S)) >= p[:, 0]).astype(np.int64)
+        return a, np.log(p[np.arange(len(S)), a] + 1e-8), S @ self.value_W + self.value_b
+
+    def save(self, path):
+        np.savez(path, policy_W=self.policy_W, policy_b=self.policy_b,
+                 value_W=self.value_W, value_b=self.value_b)
+
+
+class SharedBuffer:
+    """所有路口的 transition；reward 在該路口下一次決策（或 episode 結束）時補上。"""
+
+    def __init__(self, T):
+        self.T = T
+        self.states, self.actions, self.logprobs, self.values = [], [], [], []
+        self.agents, self.rewards = [], []
+        self.pending = np.full(T, -1, dtype=np.int64)    # 各路口尚未有 reward 的 transition 位置
+        self.n = 0
+
+    def close(self, tls, rewards):
+        """tls 的上一筆 transition 補上 reward。"""
+        idx = self.pending[tls]
+        for i, r in zip(idx[idx >= 0], rewards[idx >= 0]):
+            self.rewards[i] = float(r)
+
+    def add(self, tls, S, a, logp, v):
+        k = len(tls)
+        self.states.append(S)
+        self.actions.append(a)
+        self.logprobs.append(logp)
+        self.values.append(v)
+        self.agents.append(tls.copy())
+        self.rewards.extend([0.0] * k)
+        self.pending[tls] = np.arange(self.n, self.n + k)
+        self.n += k
+
+    def arrays(self):
+        return (np.concatenate(self.states), np.concatenate(self.actions),
+                np.asarray(self.rewards, dtype=np.float32), np.concatenate(self.logprobs).astype(np.float32),
+                np.concatenate(self.values).astype(np.float32), np.concatenate(self.agents))
+
+
+def batched_gae(rewards, values, agents, T, gamma, lam):
+    """
+    依路口排成 (T, K) 後沿時間倒推 GAE（每步都是 T 個路口的向量運算），回傳與輸入對齊的 advantages。
+    每個路口最後一筆 transition 的下一個 value 視為 0（與單路口 episode 結尾相同）。
+    """
+    order = np.argsort(agents, kind="stable")
+    counts = np.bincount(agents, minlength=T)
+    K = int(counts.max())
+    pos = np.arange(len(agents)) - np.repeat(np.cumsum(counts) - counts, counts)
+    R = np.zeros((T, K), dtype=np.float32)
+    V = np.zeros((T, K + 1), dtype=np.float32)
+    R[agents[order], pos] = rewards[order]
+    V[agents[order], pos] = values[order]
+    valid = np.zeros((T, K), dtype=bool)
+    valid[agents[order], pos] = True
+
+    A = np.zeros((T, K), dtype=np.float32)
+    gae = np.zeros(T, dtype=np.float32)
+    for k in range(K - 1, -1, -1):
+        delta = R[:, k] + gamma * V[:, k + 1] - V[:, k]
+        gae = np.where(valid[:, k], delta + gamma * lam * gae, 0.0)
+        A[:, k] = gae
+    adv = np.empty(len(agents), dtype=np.float32)
+    adv[order] = A[agents[order], pos]
+    return adv
+
+
+def shared_update(net, buffer, rng):
+    """整個 buffer 一次更新（演算法同 traci_ppo_signal_control.ppo_update，批次 softmax）。"""
+    states, actions, rewards, _, values, agents = buffer.arrays()
+    advantages = batched_gae(rewards, values, agents, buffer.T, ppo.GAMMA, ppo.LAMBDA)
+    returns = advantages + values
+    adv_norm = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+    N = len(states)
+    for _ in range(ppo.PPO_EPOCHS):
+        idx = rng.permutation(N)
+        for start in range(0, N, ppo.PPO_BATCH_SIZE):
+            batch = idx[start:start + ppo.PPO_BATCH_SIZE]
+            b_states = states[batch]
+            probs = net.probs(b_states)
+            one_hot = np.zeros_like(probs)
+            one_hot[np.arange(len(batch)), actions[batch]] = 1
+            diff = (one_hot - probs) * adv_norm[batch, None]
+            net.policy_W += ppo.POLICY_LR * (b_states.T @ diff) / len(batch)
+            net.policy_b += ppo.POLICY_LR * diff.mean(axis=0)
+
+            err = b_states @ net.value_W + net.value_b - returns[batch]
+            net.value_W -= ppo.VALUE_LR * (2.0 / len(batch)) * (b_states.T @ err)
+            net.value_b -= ppo.VALUE_LR * 2.0 * float(err.mean())
+    return N
+
+
+# -------------------------
+# 訓練
+# -------------------------
+
+def run_episode(cfg_path, mnet, net, sim_time, sumo_binary, neighbors, rng, seed):
+    """跑一個 episode 並收集 transition，回傳 (summary, buffer, wall_time, sim_steps)。"""
+    tc = traci.constants
+    T, D = mnet.T, mnet.D
+    det_tls = mnet.det_tg // 2
+    traci.start([sumo_binary, "-c", cfg_path, "--step-length", f"{STEP_LENGTH:.2f}",
+                 "--no-step-log", "true", "--seed", str(seed)])
+    vars_ = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER)
+    for det in mnet.det_ids:
+        traci.lanearea.subscribe(det, vars_)
+
+    arange = np.arange(T)
+    group = np.zeros(T, dtype=np.int64)
+    phase = mnet.group_start[group].copy()
+    steps_in_phase = np.zeros(T, dtype=np.int64)
+    for t in range(T):
+        traci.trafficlight.setRedYellowGreenState(mnet.tls_ids[t], mnet.states[t][phase[t]])
+
+    buffer = SharedBuffer(T)
+    halt_acc = np.zeros(T)               # 各路口自上次決策以來的 halting 累計
+    steps_acc = np.zeros(T)
+    total_steps = int(sim_time / STEP_LENGTH)
+    sum_halting = sum_queue = 0.0
+    total_arrived = 0
+    qh = np.zeros(2 * D + 1)
+
+    wall_start = time.perf_counter()
+    for step in range(total_steps):
+        traci.simulationStep()
+        res = traci.lanearea.getAllSubscriptionResults()
+        qh[:D] = [res[d][vars_[0]] for d in mnet.det_ids]
+        qh[D:2 * D] = [res[d][vars_[1]] for d in mnet.det_ids]
+        q, h = qh[:D], qh[D:2 * D]
+        sum_queue += q.sum()
+        sum_halting += h.sum()
+        total_arrived += traci.simulation.getArrivedNumber()
+        halt_acc += np.bincount(det_tls, weights=h, minlength=T)
+        steps_acc += 1
+
+        steps_in_phase += 1
+        due = np.flatnonzero(steps_in_phase >= mnet.durations[arange, phase])
+        if due.size == 0:
+            continue
+        steps_in_phase[due] = 0
+        at_end = mnet.group_end[phase[due]]
+        inner, dec = due[~at_end], due[at_end]
+        phase[inner] = mnet.group_next[phase[inner]]
+        if dec.size:
+            buffer.close(dec, -halt_acc[dec] / steps_acc[dec])
+            halt_acc[dec] = 0.0
+            steps_acc[dec] = 0.0
+            S = np.empty((dec.size, net.state_dim), dtype=np.float32)
+            S[:, :STATE_DIM - 1] = qh[mnet.feature_index[dec]]
+            S[:, STATE_DIM - 1] = phase[dec]
+            if neighbors:
+                S[:, STATE_DIM:] = mnet.neighbor_features(dec, q, h)
+            a, logp, v = net.act(S, rng)
+            buffer.add(dec, S, a, logp, v)
+            group[dec] = np.where(a == 1, 1 - group[dec], group[dec])
+            phase[dec] = mnet.group_start[group[dec]]
+        for t in due:
+            traci.trafficlight.setRedYellowGreenState(mnet.tls_ids[t], mnet.states[t][phase[t]])
+
+    # episode 結束：各路口最後一筆以剩餘期間的平均 halting 作 reward
+    buffer.close(arange, -halt_acc / np.maximum(steps_acc, 1))
+    wall_time = time.perf_counter() - wall_start
+    traci.close()
+
+    total_waiting_time = float(sum_halting) * STEP_LENGTH
+    summary = {
+        "n_tls": T,
+        "avg_queue_total": float(sum_queue) / max(total_steps, 1),
+        "avg_halting_total": float(sum_halting) / max(total_steps, 1),
+        "total_waiting_time": total_waiting_time,
+        "total_arrived": total_arrived,
+        "avg_delay_time": total_waiting_time / total_arrived if total_arrived else 0.0,
+        "cumulative_reward": -float(sum_halting),
+        "decisions": buffer.n,
+    }
+    return summary, buffer, wall_time, total_steps
+
+
+def train(cfg_path, episodes=1, sim_time=multi_tls.DEFAULT_SIM_TIME, sumo_binary="sumo", neighbors=False,
+          init=None, seed=SEED, db_path=None, record=True):
+    global traci
+    if traci is None:
+        traci = load_traci()
+    net_path, add_path = read_sumocfg(cfg_path)
+    mnet = MultiTLSNetwork(net_path, add_path)
+    rng = np.random.default_rng(seed)
+    net = SharedPolicy(STATE_DIM + (NEIGHBOR_DIM if neighbors else 0), rng, init)
+    print(f"=== Shared PPO: {mnet.T} TLS, state dim {net.state_dim}, {episodes} episode(s) ===")
+
+    for ep in range(1, episodes + 1):
+        summary, buffer, wall_time, steps = run_episode(cfg_path, mnet, net, sim_time, sumo_binary,
+                                                        neighbors, rng, seed)
+        t0 = time.perf_counter()
+        n = shared_update(net, buffer, rng) if buffer.n else 0
+        update_ms = (time.perf_counter() - t0) * 1000.0
+        summary["update_ms"] = update_ms
+        print(f"[ep {ep}/{episodes}] avg delay {summary['avg_delay_time']:.2f} s/veh | "
+              f"{n} transitions from {mnet.T} TLS | update {update_ms:.1f} ms | sim {wall_time:.1f} s")
+        if record:
+            config = {"sim_time": sim_time, "episodes": episodes, "neighbors": neighbors,
+                      "state_dim": net.state_dim, "init_weights": init,
+                      "gamma": ppo.GAMMA, "lambda": ppo.LAMBDA,
+                      "policy_lr": ppo.POLICY_LR, "value_lr": ppo.VALUE_LR,
+                      "ppo_epochs": ppo.PPO_EPOCHS, "ppo_batch_size": ppo.PPO_BATCH_SIZE}
+            scenario = os.path.splitext(os.path.basename(cfg_path))[0]
+            results_store.record_run(
+                controller="multi_ppo_shared", summary=summary, config=config, seed=seed,
+                wall_time=wall_time, sim_steps=steps, run_id=f"{RUN_ID}-{scenario}-shared-ep{ep}",
+                scenario=scenario, db_path=db_path or results_store.DEFAULT_DB,
+            )
+    return net
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-parameter multi-agent PPO over all TLS")
+    parser.add_argument("cfg", help="sumocfg 路徑（例如 networks/grid_3x3/grid_3x3.sumocfg）")
+    parser.add_argument("--episodes", type=int, default=ppo.EPISODES)
+    parser.add_argument("--sim-time", type=float, default=multi_tls.DEFAULT_SIM_TIME)
+    parser.add_argument("--neighbors", action="store_true", help="state 附上上游路口的 queue / halting")
+    parser.add_argument("--init", default=None, help="起始權重 npz（單路口 25 維亦可）")
+    parser.add_argument("--out", default=os.path.join("runs", "multi_ppo.npz"))
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--sumo-binary", default=os.environ.get("TRACI_SUMO_BINARY", "sumo"))
+    parser.add_argument("--db", default=results_store.DEFAULT_DB)
+    parser.add_argument("--no-record", action="store_true", help="不寫入 results store")
+    args = parser.parse_args()
+    if not os.path.exists(args.cfg):
+        sys.exit(f"找不到 SUMO 設定檔: {args.cfg}")
+
+    net = train(args.cfg, args.episodes, args.sim_time, args.sumo_binary, args.neighbors, args.init,
+                args.seed, args.db, record=not args.no_record)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    net.save(args.out)
+    print(f"weights → {args.out}  (python multi_tls.py run {args.cfg} --controller ppo --ppo-weights {args.out})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+多路口批次控制：一個迴圈控制路網中所有 traffic_light
+
+- 每個 TLS 的保護左轉 8 相位由 network_index 自動產生（與 Node2 相同的結構），
+  啟動前逐一用 phase_conflicts 檢查
+- 偵測器讀取：所有 e2 一次 subscribe，每步只呼叫一次 getAllSubscriptionResults()
+- 決策：所有路口的 phase / 計時 / 壓力都是 (T,) 或 (T, 2) 陣列，
+  到期的路口一起用陣列運算決定下一個 phase；只有 phase 變動的路口才 setRedYellowGreenState
+- 控制器：
+    max_pressure : 與 traci.maxpreesure.py 相同（group 結尾比較 NS / EW queue，門檻內維持）
+    webster      : 與 traci_Webster.py 相同的固定時制循環
+    ppo          : 與 traci_ppo_signal_control.py 相同的線性 policy（所有路口共用參數），
+                   只做推論；權重可由 --ppo-weights (npz: policy_W, policy_b) 載入
+- 產生的路網沒有 Node2 的 enforce_lane_discipline，車道由 netconvert 的 connection 限制
+
+用法：
+    python multi_tls.py run networks/grid_3x3/grid_3x3.sumocfg --controller max_pressure
+    python multi_tls.py bench --layout corridor grid --sizes 1 2 4 --sim-time 600
+"""
+
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import net_gen
+import results_store
+from network_index import MOVEMENTS, list_tls, load_index
+from phase_conflicts import load_conflicts, validate_plan
+from phase_plan import PROTECTED_LEFT_8, compile_plan
+from run_config import RUN_ID, SEED, load_traci
+
+traci = None
+
+STEP_LENGTH = 0.10
+DEFAULT_SIM_TIME = 1800.0
+CONTROLLER_NAMES = ("max_pressure", "webster", "ppo")
+PRESSURE_DIFF_THRESHOLD = 10  # vehicles（與 traci.maxpreesure.py 相同）
+
+# 保護左轉 movement → (approach, 轉向)
+MOVEMENT_LINKS = {
+    "NS_STRAIGHT": (("SB", "NB"), ("right", "straight")),
+    "NS_LEFT": (("SB", "NB"), ("left",)),
+    "EW_STRAIGHT": (("WB", "EB"), ("right", "straight")),
+    "EW_LEFT": (("WB", "EB"), ("left",)),
+}
+GROUPS = ("NS", "EW")
+GROUP_APPROACHES = {"NS": ("SB", "NB"), "EW": ("WB", "EB")}
+
+# PPO state 的車道順序（與 traci_ppo_signal_control.get_state 相同）
+PPO_APPROACH_ORDER = ("EB", "SB", "WB", "NB")
+PPO_LANES_PER_APPROACH = 3
+STATE_DIM = 2 * len(PPO_APPROACH_ORDER) * PPO_LANES_PER_APPROACH + 1
+NEIGHBOR_DIM = 2 * len(PPO_APPROACH_ORDER)   # 各 approach 上游路口的 queue、halting
+ACTION_DIM = 2
+
+
+# -------------------------
+# 相位計畫
+# -------------------------
+
+def plan_from_index(index, template=PROTECTED_LEFT_8):
+    """
+    依 template 的 movement 標籤，為任一 TLS 產生同結構的 RYG state：
+    movement 內的 link 取 template 該 phase 的燈色（G / y），其餘 r。
+    """
+    phases = []
+    for p in template:
+        approaches, turns = MOVEMENT_LINKS[p["movement"]]
+        turn_ids = {MOVEMENTS.index(t) for t in turns}
+        links = {
+            i for a in approaches if a in index.approach_links
+            for i in index.approach_links[a] if int(index.link_movement[i]) in turn_ids
+        }
+        color = next(c for c in p["state"] if c not in "rR")
+        state = "".join(color if i in links else "r" for i in range(index.n_links))
+        phases.append(dict(p, state=state))
+    return compile_plan(phases, approach_links=index.approach_links)
+
+
+def read_sumocfg(cfg_path):
+    """sumocfg → (net 路徑, add 路徑 or None)。"""
+    root = ET.parse(cfg_path).getroot()
+    base = os.path.dirname(os.path.abspath(cfg_path))
+
+    def value(tag):
+        elem = root.find(f"./input/{tag}")
+        if elem is None:
+            return None
+        first = elem.get("value").split(",")[0].strip()
+        return os.path.join(base, first)
+
+    return value("net-file"), value("additional-files")
+
+
+class MultiTLSNetwork:
+    """路網中所有 TLS 的堆疊查表。"""
+
+    def __init__(self, net_path, add_path=None, tls_ids=None):
+        self.net_path = net_path
+        self.tls_ids = tuple(tls_ids or list_tls(net_path))
+        self.indices = [load_index(t, net_path, add_path) for t in self.tls_ids]
+        self.plans = []
+        for index in self.indices:
+            plan = plan_from_index(index)
+            validate_plan(plan, matrix=load_conflicts(net_path, index.junction_id))
+            self.plans.append(plan)
+
+        ref = self.plans[0]
+        for tls, plan in zip(self.tls_ids, self.plans):
+            if plan.names != ref.names or plan.movements != ref.movements:
+                raise ValueError(f"TLS {tls}: phase structure differs from {self.tls_ids[0]}")
+
+        # 共用的相位結構（所有路口同一組 8 相位）
+        self.T = len(self.tls_ids)
+        self.names = ref.names
+        self.durations = np.stack([p.durations for p in self.plans])     # (T, P)
+        self.next_phase = ref.next_phase
+        self.group_start = np.array([ref.group_start[ref.group_index(g)] for g in GROUPS])
+        self.group_next = ref.group_next
+        self.group_end = ref.group_end
+        self.is_yellow = ref.is_yellow
+        self.states = [p.states for p in self.plans]
+
+        # 偵測器：依路口、approach、車道展開
+        det_ids, det_tg, lane_pos = [], [], []
+        for t, index in enumerate(self.indices):
+            pos = {}
+            for g, group in enumerate(GROUPS):
+                for a in GROUP_APPROACHES[group]:
+                    for det in index.approach_detectors.get(a, ()):
+                        if det is None:
+                            continue
+                        pos[det] = len(det_ids)
+                        det_ids.append(det)
+                        det_tg.append(t * len(GROUPS) + g)
+            # PPO state 的車道 → 偵測器位置（沒有偵測器為 -1）
+            row = []
+            for a in PPO_APPROACH_ORDER:
+                dets = tuple(index.approach_detectors.get(a, ()))[:PPO_LANES_PER_APPROACH]
+                dets += (None,) * (PPO_LANES_PER_APPROACH - len(dets))
+                row.extend(pos.get(det, -1) for det in dets)
+            lane_pos.append(row)
+        self.det_ids = tuple(det_ids)
+        self.D = len(det_ids)
+        self.det_tg = np.array(det_tg, dtype=np.int64)
+        # 狀態特徵 = qh[feature_index]，qh = [queue (D), halting (D), 0]；缺少的車道指向最後的 0
+        lane_pos = np.array(lane_pos, dtype=np.int64).reshape(self.T, -1)
+        missing = lane_pos < 0
+        feat = np.concatenate([lane_pos, lane_pos + self.D], axis=1)
+        feat[np.concatenate([missing, missing], axis=1)] = 2 * self.D
+        self.feature_index = feat
+
+        # 鄰居特徵：上游路口中，link 駛入本路口進入 edge 的車道偵測器（依 PPO approach 順序）
+        det_pos = {det: i for i, det in enumerate(self.det_ids)}
+        feeders = {}                                      # 離開 edge → {偵測器位置}
+        for index in self.indices:
+            for i in range(index.n_links):
+                det = index.detector_ids[index.link_lane[i]]
+                if det in det_pos:
+                    feeders.setdefault(index.link_to_edge[i], set()).add(det_pos[det])
+        nbr = np.zeros((self.T, len(PPO_APPROACH_ORDER), self.D), dtype=np.float32)
+        for t, index in enumerate(self.indices):
+            for k, a in enumerate(PPO_APPROACH_ORDER):
+                for d in feeders.get(index.approach_edge.get(a), ()):
+                    nbr[t, k, d] = 1.0
+        self.neighbor_matrix = nbr                        # (T, 4, D)
+
+    def neighbor_features(self, tls, q, h):
+        """(k,) 路口 → (k, NEIGHBOR_DIM)：各 approach 上游駛向本路口的 queue、halting（沒有上游為 0）。"""
+        M = self.neighbor_matrix[tls]
+        return np.concatenate([M @ q, M @ h], axis=1)
+
+
+# -------------------------
+# 控制器
+# -------------------------
+
+def init_policy(rng, weights_path=None):
+    if weights_path:
+        data = np.load(weights_path)
+        return data["policy_W"].astype(np.float32), data["policy_b"].astype(np.float32)
+    W = rng.standard_normal((STATE_DIM, ACTION_DIM)).astype(np.float32) * 0.01
+    return W, np.zeros(ACTION_DIM, dtype=np.float32)
+
+
+def run(cfg_path, controller="max_pressure", sim_time=DEFAULT_SIM_TIME, sumo_binary="sumo",
+        threshold=PRESSURE_DIFF_THRESHOLD, ppo_weights=None, seed=SEED, verbose=True):
+    """在 cfg_path 的路網上跑一次，回傳 (summary dict, wall_time, sim_steps)。"""
+    global traci
+    if traci is None:
+        traci = load_traci()
+    tc = traci.constants
+    net_path, add_path = read_sumocfg(cfg_path)
+    net = MultiTLSNetwork(net_path, add_path)
+    T, D = net.T, net.D
+    rng = np.random.default_rng(seed)
+    if controller == "ppo":
+        policy_W, policy_b = init_policy(rng, ppo_weights)
+
+    traci.start([sumo_binary, "-c", cfg_path, "--step-length", f"{STEP_LENGTH:.2f}",
+                 "--no-step-log", "true", "--seed", str(seed)])
+    vars_ = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER)
+    for det in net.det_ids:
+        traci.lanearea.subscribe(det, vars_)
+
+    arange = np.arange(T)
+    group = np.zeros(T, dtype=np.int64)                  # 先跑 NS
+    phase = net.group_start[group].copy()
+    steps_in_phase = np.zeros(T, dtype=np.int64)
+    for t in range(T):
+        traci.trafficlight.setRedYellowGreenState(net.tls_ids[t], net.states[t][phase[t]])
+
+    total_steps = int(sim_time / STEP_LENGTH)
+    sum_queue = sum_halting = 0.0
+    total_arrived = 0
+    n_decisions = n_set_calls = 0
+    qh = np.zeros(2 * D + 1)
+
+    wall_start = time.perf_counter()
+    for step in range(total_steps):
+        traci.simulationStep()
+
+        # ---- 觀測：一次取回所有偵測器 ----
+        res = traci.lanearea.getAllSubscriptionResults()
+        qh[:D] = [res[d][vars_[0]] for d in net.det_ids]
+        qh[D:2 * D] = [res[d][vars_[1]] for d in net.det_ids]
+        q, h = qh[:D], qh[D:2 * D]
+        sum_queue += q.sum()
+        sum_halting += h.sum()
+        total_arrived += traci.simulation.getArrivedNumber()
+
+        # ---- 相位計時 ----
+        steps_in_phase += 1
+        due = np.flatnonzero(steps_in_phase >= net.durations[arange, phase])
+        if due.size == 0:
+            continue
+        steps_in_phase[due] = 0
+
+        if controller == "webster":
+            phase[due] = net.next_phase[phase[due]]
+        else:
+            at_end = net.group_end[phase[due]]
+            inner, dec = due[~at_end], due[at_end]
+            phase[inner] = net.group_next[phase[inner]]
+            if dec.size:
+                n_decisions += dec.size
+                if controller == "max_pressure":
+                    qg = np.bincount(net.det_tg, weights=q, minlength=T * 2).reshape(T, 2)[dec]
+                    diff = qg[:, 0] - qg[:, 1]
+                    new_group = np.where(diff > threshold, 0,
+                                         np.where(-diff > threshold, 1, group[dec]))
+                else:  # ppo：共用參數的批次推論
+                    # 權重多出 NEIGHBOR_DIM 列時（multi_ppo.py --neighbors 訓練）附上鄰居特徵
+                    S = np.empty((dec.size, policy_W.shape[0]), dtype=np.float32)
+                    S[:, :STATE_DIM - 1] = qh[net.feature_index[dec]]
+                    S[:, STATE_DIM - 1] = phase[dec]
+                    if policy_W.shape[0] > STATE_DIM:
+                        S[:, STATE_DIM:] = net.neighbor_features(dec, q, h)
+                    logits = S @ policy_W + policy_b
+                    logits -= logits.max(axis=1, keepdims=True)
+                    probs = np.exp(logits)
+                    probs /= probs.sum(axis=1, keepdims=True)
+                    switch = rng.random(dec.size) >= probs[:, 0]      # action 1 → 切換
+                    new_group = np.where(switch, 1 - group[dec], group[dec])
+                group[dec] = new_group
+                phase[dec] = net.group_start[new_group]
+
+        # ---- 下發：只送 phase 有變的路口 ----
+        for t in due:
+            traci.trafficlight.setRedYellowGreenState(net.tls_ids[t], net.states[t][phase[t]])
+        n_set_calls += due.size
+
+        if verbose and step % 3000 == 0:
+            print(f"[t={step * STEP_LENGTH:7.1f}s] queue={q.sum():6.0f} halting={h.sum():6.0f}")
+
+    wall_time = time.perf_counter() - wall_start
+    traci.close()
+
+    total_waiting_time = float(sum_halting) * STEP_LENGTH
+    summary = {
+        "n_tls": T,
+        "n_detectors": D,
+        "avg_queue_total": float(sum_queue) / max(total_steps, 1),
+        "avg_halting_total": float(sum_halting) / max(total_steps, 1),
+        "total_waiting_time": total_waiting_time,
+        "total_arrived": total_arrived,
+        "avg_delay_time": total_waiting_time / total_arrived if total_arrived else 0.0,
+        "cumulative_reward": -float(sum_halting),
+        "decisions": n_decisions,
+        "set_state_calls": n_set_calls,
+    }
+    return summary, wall_time, total_steps
+
+
+# -------------------------
+# CLI
+# -------------------------
+
+def _record(summary, wall_time, sim_steps, cfg_path, controller, args_config, db_path, run_id=None):
+    scenario = os.path.splitext(os.path.basename(cfg_path))[0]
+    return results_store.record_run(
+        controller=f"multi_{controller}", summary=summary, config=args_config,
+        seed=SEED, wall_time=wall_time, sim_steps=sim_steps,
+        run_id=run_id or f"{RUN_ID}-{scenario}-{controller}", scenario=scenario, db_path=db_path,
+    )
+
+
+def cmd_run(args):
+    summary, wall_time, steps = run(
+        args.cfg, args.controller, args.sim_time, args.sumo_binary,
+        args.threshold, args.ppo_weights)
+    print(f"\n========== Multi-TLS {args.controller} Summary ==========")
+    for key, value in summary.items():
+        print(f"{key:20s}= {value:.2f}" if isinstance(value, float) else f"{key:20s}= {value}")
+    print(f"Wall time           = {wall_time:.2f} s "
+          f"({wall_time * 3600.0 / args.sim_time:.1f} s per simulated hour)")
+    if not args.no_record:
+        _record(summary, wall_time, steps, args.cfg, args.controller,
+                {"sim_time": args.sim_time, "threshold": args.threshold,
+                 "ppo_weights": args.ppo_weights}, args.db)
+
+
+def cmd_bench(args):
+    rows = []
+    for layout in args.layout:
+        for n in args.sizes:
+            cfg = net_gen.generate(layout, n, volume=args.volume)
+            for controller in args.controller:
+                summary, wall_time, steps = run(cfg, controller, args.sim_time,
+                                                args.sumo_binary, verbose=False)
+                per_hour = wall_time * 3600.0 / args.sim_time
+                rows.append((net_gen.network_name(layout, n), summary["n_tls"], controller,
+                             per_hour, per_hour / summary["n_tls"], summary["avg_delay_time"]))
+                print(f"  {rows[-1][0]:14s} {controller:13s} {per_hour:8.1f} s/sim-h")
+                if not args.no_record:
+                    _record(summary, wall_time, steps, cfg, controller,
+                            {"sim_time": args.sim_time, "bench": True}, args.db,
+                            run_id=f"{RUN_ID}-bench-{rows[-1][0]}-{controller}")
+
+    lines = [
+        "| Network | TLS | Controller | Wall s / sim hour | per TLS | Avg Delay (s/veh) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name, n_tls, controller, per_hour, per_tls, delay in rows:
+        lines.append(f"| {name} | {n_tls} | {controller} | {per_hour:.1f} | {per_tls:.2f} | {delay:.2f} |")
+    report = "\n".join(lines)
+    print("\n" + report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write("# Multi-TLS scaling benchmark\n\n" + report + "\n")
+        print(f"\nReport written to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched multi-intersection control")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def common(p, sim_time):
+        p.add_argument("--sim-time", type=float, default=sim_time, help="模擬秒數")
+        p.add_argument("--sumo-binary", default=os.environ.get("TRACI_SUMO_BINARY", "sumo"))
+        p.add_argument("--db", default=results_store.DEFAULT_DB)
+        p.add_argument("--no-record", action="store_true", help="不寫入 results store")
+
+    p_run = sub.add_parser("run", help="在一個路網上執行控制器")
+    p_run.add_argument("cfg", help="sumocfg 路徑（例如 networks/grid_3x3/grid_3x3.sumocfg）")
+    p_run.add_argument("--controller", choices=CONTROLLER_NAMES, default="max_pressure")
+    p_run.add_argument("--threshold", type=float, default=PRESSURE_DIFF_THRESHOLD)
+    p_run.add_argument("--ppo-weights", default=None)
+    common(p_run, DEFAULT_SIM_TIME)
+
+    p_bench = sub.add_parser("bench", help="走廊 / 格狀路網的規模測試")
+    p_bench.add_argument("--layout", nargs="+", choices=["corridor", "grid"],
+                         default=["corridor", "grid"])
+    p_bench.add_argument("--sizes", nargs="+", type=int, default=[1, 2, 4, 8])
+    p_bench.add_argument("--controller", nargs="+", choices=CONTROLLER_NAMES,
+                         default=list(CONTROLLER_NAMES))
+    p_bench.add_argument("--volume", type=float, default=net_gen.DEFAULT_VOLUME)
+    p_bench.add_argument("--out", default=None, help="輸出 Markdown 表格")
+    common(p_bench, 600.0)
+
+    args = parser.parse_args()
+    if args.cmd == "run" and not os.path.exists(args.cfg):
+        sys.exit(f"找不到 SUMO 設定檔: {args.cfg}")
+    {"run": cmd_run, "bench": cmd_bench}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+多路口測試路網產生器：1×N 走廊 / N×N 格狀
+
+- 每個路口都是四岔 traffic_light，每向 3 車道（與 Node2 相同：
+  lane 0 右轉+直行、lane 1 直行、lane 2 直行+左轉，由 netconvert 推導）
+- 外圍補上 stub 節點，讓每個路口都有 4 個 approach
+- edge id 結尾是行駛方向（..._EB / _WB / _NB / _SB），network_index 以此命名 approach
+- 每條受控進入車道一個 e2 偵測器（長度 DETECTOR_LENGTH，貼齊停止線，
+  每個偵測器一個輸出檔 e2/e2_<id>.xml，同 detector_outputs.py）
+- 需求：每個外圍入口 --volume veh/h，直行穿越比例 --through，其餘平均分到其他出口
+
+輸出到 networks/<name>/：<name>.nod.xml / .edg.xml（plain XML）→ netconvert →
+<name>.net.xml、<name>.add.xml、<name>.rou.xml、<name>.sumocfg；
+產生參數（含 GENERATOR_VERSION）寫在 params.json，參數不同或舊版產生的路網會重新產生
+
+用法：
+    python net_gen.py corridor 4            # networks/corridor_1x4/
+    python net_gen.py grid 3 --volume 600   # networks/grid_3x3/
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+from network_index import list_tls, load_index
+from detector_outputs import detector_output_file
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NETWORKS_DIR = os.path.join(SCRIPT_DIR, "networks")
+
+SPACING = 300.0          # 路口間距 (m)
+LANES = 3
+SPEED = 13.89            # 50 km/h
+DETECTOR_LENGTH = 150.0  # 與 Traci.add.xml 相同
+DEFAULT_VOLUME = 600     # veh/h per 外圍入口
+DEFAULT_THROUGH = 0.75
+DEFAULT_END = 3600.0
+
+# 產生方式改變（輸出格式、偵測器配置等）時遞增，舊的路網會自動重新產生
+# 2：每個偵測器一個輸出檔（原本共用 e2_all.xml）
+GENERATOR_VERSION = 2
+PARAMS_FILE = "params.json"
+
+
+def network_name(layout, n):
+    return f"corridor_1x{n}" if layout == "corridor" else f"grid_{n}x{n}"
+
+
+def _heading(x1, y1, x2, y2):
+    if x2 > x1:
+        return "EB"
+    if x2 < x1:
+        return "WB"
+    return "NB" if y2 > y1 else "SB"
+
+
+def layout_graph(rows, cols, spacing=SPACING):
+    """
+    回傳 (nodes, edges)：
+    nodes = {id: (x, y, type)}；edges = [(id, from, to)]，雙向。
+    """
+    nodes = {}
+    for r in range(rows):
+        for c in range(cols):
+            nodes[f"J{r}_{c}"] = (c * spacing, r * spacing, "traffic_light")
+
+    def neighbor(r, c, dr, dc):
+        rr, cc = r + dr, c + dc
+        if 0 <= rr < rows and 0 <= cc < cols:
+            return f"J{rr}_{cc}"
+        stub = f"S{rr}_{cc}".replace("-", "m")
+        nodes.setdefault(stub, (cc * spacing, rr * spacing, "priority"))
+        return stub
+
+    pairs = set()
+    for r in range(rows):
+        for c in range(cols):
+            for dr, dc in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+                other = neighbor(r, c, dr, dc)
+                pairs.add((f"J{r}_{c}", other))
+                pairs.add((other, f"J{r}_{c}"))
+
+    edges = []
+    for a, b in sorted(pairs):
+        (x1, y1, _), (x2, y2, _) = nodes[a], nodes[b]
+        edges.append((f"{a}_{b}_{_heading(x1, y1, x2, y2)}", a, b))
+    return nodes, edges
+
+
+def write_plain_xml(nodes, edges, nod_path, edg_path):
+    with open(nod_path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<nodes>\n')
+        for nid, (x, y, ntype) in sorted(nodes.items()):
+            f.write(f'    <node id="{nid}" x="{x:.2f}" y="{y:.2f}" type="{ntype}"/>\n')
+        f.write("</nodes>\n")
+    with open(edg_path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<edges>\n')
+        for eid, a, b in edges:
+            f.write(f'    <edge id="{eid}" from="{a}" to="{b}" numLanes="{LANES}" speed="{SPEED}"/>\n')
+        f.write("</edges>\n")
+
+
+def find_netconvert():
+    if "SUMO_HOME" in os.environ:
+        path = os.path.join(os.environ["SUMO_HOME"], "bin", "netconvert")
+        if os.path.exists(path) or os.path.exists(path + ".exe"):
+            return path
+    path = shutil.which("netconvert")
+    if path is None:
+        sys.exit("netconvert not found (set SUMO_HOME or add SUMO bin to PATH)")
+    return path
+
+
+def run_netconvert(nod_path, edg_path, net_path):
+    cmd = [
+        find_netconvert(),
+        "--node-files", nod_path,
+        "--edge-files", edg_path,
+        "--output-file", net_path,
+        "--no-turnarounds", "true",
+        "--tls.default-type", "static",
+        "--junctions.corner-detail", "0",
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def lane_lengths(net_path):
+    lengths = {}
+    for _, elem in ET.iterparse(net_path):
+        if elem.tag == "lane":
+            lengths[elem.get("id")] = float(elem.get("length"))
+        elem.clear()
+    return lengths
+
+
+def write_detectors(net_path, add_path, period=300.0, output_dir="e2"):
+    """
+    每個 TLS 的每條受控進入車道放一個 e2（id = 車道 id），回傳偵測器數。
+    每個偵測器寫自己的輸出檔 <output_dir>/e2_<id>.xml（共用一個檔案時各偵測器的
+    interval 會交錯寫入），output_dir 相對於 add.xml 所在資料夾，會自動建立；
+    讀取用 detector_outputs.load_e2_run(<output_dir>)。
+    """
+    if output_dir:
+        os.makedirs(os.path.join(os.path.dirname(os.path.abspath(add_path)), output_dir), exist_ok=True)
+    lengths = lane_lengths(net_path)
+    lanes = []
+    for tls in list_tls(net_path):
+        index = load_index(tls, net_path, add_path=None, cache_dir=None)
+        lanes.extend(index.lanes)
+    with open(add_path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<!-- generated by net_gen.py -->\n\n<additional>\n')
+        for lane in lanes:
+            length = min(DETECTOR_LENGTH, lengths[lane] - 1.0)
+            pos = lengths[lane] - length - 0.1
+            out_file = detector_output_file(lane, "xml", output_dir)
+            f.write(f'    <laneAreaDetector id="{lane}" lane="{lane}" pos="{pos:.2f}" '
+                    f'length="{length:.2f}" period="{period:.2f}" file="{out_file}"/>\n')
+        f.write("</additional>\n")
+    return len(lanes)
+
+
+def write_routes(edges, rou_path, volume=DEFAULT_VOLUME, through=DEFAULT_THROUGH,
+                 end=DEFAULT_END):
+    """外圍入口 → 外圍出口的 flow（路徑由 SUMO 以最短路計算）。"""
+    entries = [(eid, a, b) for eid, a, b in edges if a.startswith("S")]
+    exits = [(eid, a, b) for eid, a, b in edges if b.startswith("S")]
+    count = 0
+    with open(rou_path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<!-- generated by net_gen.py -->\n\n<routes>\n')
+        for eid, stub, _ in entries:
+            heading = eid.rsplit("_", 1)[1]
+            others = [x for x in exits if x[2] != stub]
+            # 直行：同方向、最遠的出口
+            same = [x for x in others if x[0].endswith("_" + heading)]
+            straight = None
+            if same:
+                x0, y0 = _stub_xy(stub)
+                straight = max(same, key=lambda x: _dist2(_stub_xy(x[2]), (x0, y0)))
+            rest = [x for x in others if x is not straight]
+            shares = []
+            if straight is not None:
+                shares.append((straight[0], volume * through))
+                rest_share = volume * (1.0 - through) / max(len(rest), 1)
+            else:
+                rest_share = volume / max(len(rest), 1)
+            shares += [(x[0], rest_share) for x in rest]
+            for to_edge, vph in shares:
+                if vph <= 0:
+                    continue
+                f.write(f'    <flow id="f{count}" begin="0.00" end="{end:.2f}" from="{eid}" '
+                        f'to="{to_edge}" vehsPerHour="{vph:.1f}" departLane="best" departSpeed="max"/>\n')
+                count += 1
+        f.write("</routes>\n")
+    return count
+
+
+def _stub_xy(stub):
+    r, c = stub[1:].replace("m", "-").split("_")
+    return int(c), int(r)
+
+
+def _dist2(p, q):
+    return (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+
+
+def write_sumocfg(cfg_path, name):
+    with open(cfg_path, "w", encoding="utf-8") as f:
+        f.write(f"""<?xml version="1.0" encoding="UTF-8"?>
+
+<configuration>
+    <input>
+        <net-file value="{name}.net.xml"/>
+        <route-files value="{name}.rou.xml"/>
+        <additional-files value="{name}.add.xml"/>
+    </input>
+    <time>
+        <step-length value="0.1"/>
+    </time>
+</configuration>
+""")
+
+
+def read_params(path):
+    """params.json 的內容（不存在或無法解析時 None）。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def generate(layout, n, volume=DEFAULT_VOLUME, through=DEFAULT_THROUGH,
+             end=DEFAULT_END, out_root=NETWORKS_DIR, force=False):
+    """
+    產生（或沿用已存在的）路網，回傳 sumocfg 路徑。
+    只有檔案齊全且 params.json 與這次的參數（含 GENERATOR_VERSION）相同時才沿用。
+    """
+    rows, cols = (1, n) if layout == "corridor" else (n, n)
+    name = network_name(layout, n)
+    out_dir = os.path.join(out_root, name)
+    paths = {ext: os.path.join(out_dir, f"{name}.{ext}")
+             for ext in ("nod.xml", "edg.xml", "net.xml", "add.xml", "rou.xml", "sumocfg")}
+    params = {"version": GENERATOR_VERSION, "layout": layout, "n": int(n),
+              "volume": float(volume), "through": float(through), "end": float(end)}
+    params_path = os.path.join(out_dir, PARAMS_FILE)
+    if not force and all(os.path.exists(p) for p in paths.values()) and read_params(params_path) == params:
+        return paths["sumocfg"]
+
+    os.makedirs(out_dir, exist_ok=True)
+    if os.path.exists(params_path):
+        os.remove(params_path)          # 產生到一半中斷時不會被當成完整的路網
+    nodes, edges = layout_graph(rows, cols)
+    write_plain_xml(nodes, edges, paths["nod.xml"], paths["edg.xml"])
+    run_netconvert(paths["nod.xml"], paths["edg.xml"], paths["net.xml"])
+    n_det = write_detectors(paths["net.xml"], paths["add.xml"])
+    n_flows = write_routes(edges, paths["rou.xml"], volume, through, end)
+    write_sumocfg(paths["sumocfg"], name)
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=1, sort_keys=True)
+    print(f"{name}: {rows * cols} TLS, {len(edges)} edges, {n_det} detectors, {n_flows} flows")
+    return paths["sumocfg"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate corridor / grid test networks")
+    parser.add_argument("layout", choices=["corridor", "grid"])
+    parser.add_argument("n", type=int, help="corridor: 路口數；grid: 每邊路口數")
+    parser.add_argument("--volume", type=float, default=DEFAULT_VOLUME, help="每個外圍入口 veh/h")
+    parser.add_argument("--through", type=float, default=DEFAULT_THROUGH, help="直行穿越比例")
+    parser.add_argument("--end", type=float, default=DEFAULT_END, help="flow 結束時間 (s)")
+    parser.add_argument("--out", default=NETWORKS_DIR)
+    parser.add_argument("--force", action="store_true", help="已存在也重新產生")
+    args = parser.parse_args()
+
+    cfg = generate(args.layout, args.n, args.volume, args.through, args.end,
+                   out_root=args.out, force=args.force)
+    print(cfg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+路網索引：從 Traci.net.xml + Traci.add.xml 推導號誌 / 車道 / 偵測器對應
+
+解析一次，得到指定 TLS 的：
+- link（linkIndex）→ 進入車道、離開車道、進入 / 離開 edge、轉向（r / s / l / t）
+- approach（進入 edge）→ link index、車道、每條車道的 e2 偵測器
+- 直行 / 左轉的下一條 edge（車道紀律用）、左轉車道 index
+- NumPy 查表：lane_link (車道, link)、link_movement、lane_approach、link_lane
+
+結果以 pickle 存在 .cache/（檔名含 net.xml、add.xml 內容的 sha1），
+檔案沒改就直接讀快取，不再解析 XML。
+
+用法：
+    python network_index.py                 # 印出 Node2 的索引
+    python network_index.py --tls Node2 --rebuild
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NET_FILE = os.path.join(SCRIPT_DIR, "Traci.net.xml")
+ADD_FILE = os.path.join(SCRIPT_DIR, "Traci.add.xml")
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache")
+DEFAULT_TLS = "Node2"
+
+# 快取格式版本（NetworkIndex 欄位有變動時要加 1）
+CACHE_VERSION = 1
+
+# SUMO connection dir → movement
+MOVEMENTS = ("right", "straight", "left", "uturn")
+_DIR_TO_MOVEMENT = {
+    "r": "right", "R": "right",
+    "s": "straight",
+    "l": "left", "L": "left",
+    "t": "uturn",
+}
+# edge id 結尾的方向代號（例如 Node1_2_EB → EB）
+_COMPASS = ("EB", "WB", "NB", "SB")
+
+
+@dataclass(frozen=True, eq=False)
+class NetworkIndex:
+    """單一 TLS 的路網索引（陣列皆唯讀）。"""
+
+    tls_id: str
+    junction_id: str
+    n_links: int
+    link_from_lane: tuple    # (L,) 進入車道 id
+    link_to_lane: tuple      # (L,) 離開車道 id
+    link_from_edge: tuple    # (L,)
+    link_to_edge: tuple      # (L,)
+    link_dir: tuple          # (L,) SUMO dir 字元
+    approaches: tuple        # approach 名稱，依最小 link index 排序（SB, WB, NB, EB）
+    approach_edge: dict      # approach → 進入 edge
+    approach_links: dict     # approach → (link, ...)
+    approach_lanes: dict     # approach → (lane id, ...) 依車道 index 排序
+    approach_detectors: dict  # approach → (detector id, ...) 每條車道一個
+    lane_detectors: dict     # lane id → (detector id, ...) 該車道上所有 e2
+    in_edges: tuple          # 受控進入 edge
+    straight_next: dict      # 進入 edge → 直行離開 edge
+    left_next: dict          # 進入 edge → 左轉離開 edge
+    left_lane: dict          # 進入 edge → 左轉車道 index
+    lanes: tuple             # 所有受控進入車道（依 approach、車道 index）
+    detector_ids: tuple      # 與 lanes 對齊的主要偵測器（沒有則為 None）
+    lane_link: np.ndarray    # (N_lane, L) bool
+    lane_approach: np.ndarray  # (N_lane,) int
+    link_lane: np.ndarray    # (L,) int，link 的進入車道在 lanes 中的位置
+    link_movement: np.ndarray  # (L,) int，MOVEMENTS 的 index
+    link_approach: np.ndarray  # (L,) int
+    source: str              # 快取 key
+
+    def approach_of_edge(self, edge):
+        for name, e in self.approach_edge.items():
+            if e == edge:
+                return name
+        raise KeyError(edge)
+
+    def movement_links(self, approach, movement):
+        """某 approach 某轉向的 link index。"""
+        m = MOVEMENTS.index(movement)
+        return tuple(i for i in self.approach_links[approach] if self.link_movement[i] == m)
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def _approach_name(edge_id):
+    suffix = edge_id.rsplit("_", 1)[-1]
+    return suffix if suffix in _COMPASS else edge_id
+
+
+def _lane_index(lane_id):
+    return int(lane_id.rsplit("_", 1)[1])
+
+
+def _file_hash(*paths):
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def list_tls(net_path=NET_FILE):
+    """net.xml 中所有 tlLogic 的 id（依出現順序，不重複）。"""
+    ids = []
+    for _, elem in ET.iterparse(net_path):
+        if elem.tag == "tlLogic" and elem.get("id") not in ids:
+            ids.append(elem.get("id"))
+        elem.clear()
+    return ids
+
+
+def parse_detectors(add_path=ADD_FILE):
+    """add.xml → {lane id: (detector id, ...)}（laneAreaDetector / e2Detector）。"""
+    lane_detectors = {}
+    if not add_path or not os.path.exists(add_path):
+        return lane_detectors
+    for _, elem in ET.iterparse(add_path):
+        if elem.tag in ("laneAreaDetector", "e2Detector") and elem.get("lane"):
+            lane_detectors.setdefault(elem.get("lane"), []).append(elem.get("id"))
+        elem.clear()
+    return {lane: tuple(ids) for lane, ids in lane_detectors.items()}
+
+
+def build_index(tls_id=DEFAULT_TLS, net_path=NET_FILE, add_path=ADD_FILE, source=""):
+    """解析 XML，建立 NetworkIndex（不經過快取）。"""
+    conns = []
+    edge_to = {}
+    for _, elem in ET.iterparse(net_path):
+        if elem.tag == "connection" and elem.get("tl") == tls_id and elem.get("linkIndex") is not None:
+            conns.append((
+                int(elem.get("linkIndex")),
+                elem.get("from"), int(elem.get("fromLane")),
+                elem.get("to"), int(elem.get("toLane")),
+                elem.get("dir", "s"),
+            ))
+        elif elem.tag == "edge" and elem.get("function") != "internal":
+            edge_to[elem.get("id")] = elem.get("to")
+        if elem.tag != "net":
+            elem.clear()
+    if not conns:
+        raise ValueError(f"no connections controlled by TLS '{tls_id}' in {net_path}")
+
+    conns.sort()
+    n_links = conns[-1][0] + 1
+    if [c[0] for c in conns] != list(range(n_links)):
+        raise ValueError(f"TLS '{tls_id}': linkIndex must be unique and contiguous")
+
+    link_from_edge = tuple(c[1] for c in conns)
+    link_from_lane = tuple(f"{c[1]}_{c[2]}" for c in conns)
+    link_to_edge = tuple(c[3] for c in conns)
+    link_to_lane = tuple(f"{c[3]}_{c[4]}" for c in conns)
+    link_dir = tuple(c[5] for c in conns)
+    junction_id = edge_to.get(link_from_edge[0], tls_id)
+
+    # approach 依第一個 link index 排序（與號誌字串順序一致）
+    in_edges = []
+    for edge in link_from_edge:
+        if edge not in in_edges:
+            in_edges.append(edge)
+    approaches = tuple(_approach_name(e) for e in in_edges)
+    if len(set(approaches)) != len(approaches):
+        approaches = tuple(in_edges)
+    approach_edge = dict(zip(approaches, in_edges))
+    approach_links = {
+        a: tuple(i for i in range(n_links) if link_from_edge[i] == approach_edge[a])
+        for a in approaches
+    }
+    approach_lanes = {
+        a: tuple(sorted({link_from_lane[i] for i in approach_links[a]}, key=_lane_index))
+        for a in approaches
+    }
+
+    lane_detectors = parse_detectors(add_path)
+
+    def main_detector(lane):
+        ids = lane_detectors.get(lane, ())
+        if lane in ids:          # 偵測器 id 與車道同名者優先
+            return lane
+        return ids[0] if ids else None
+
+    approach_detectors = {
+        a: tuple(main_detector(lane) for lane in approach_lanes[a]) for a in approaches
+    }
+
+    straight_next, left_next, left_lane = {}, {}, {}
+    for i in range(n_links):
+        mv = _DIR_TO_MOVEMENT.get(link_dir[i], "straight")
+        edge = link_from_edge[i]
+        if mv == "straight":
+            straight_next.setdefault(edge, link_to_edge[i])
+        elif mv == "left":
+            left_next.setdefault(edge, link_to_edge[i])
+            left_lane[edge] = max(left_lane.get(edge, 0), _lane_index(link_from_lane[i]))
+
+    lanes = tuple(lane for a in approaches for lane in approach_lanes[a])
+    lane_pos = {lane: k for k, lane in enumerate(lanes)}
+    lane_link = np.zeros((len(lanes), n_links), dtype=bool)
+    for i, lane in enumerate(link_from_lane):
+        lane_link[lane_pos[lane], i] = True
+    lane_approach = np.array(
+        [approaches.index(a) for a in approaches for _ in approach_lanes[a]], dtype=np.int64)
+    link_lane = np.array([lane_pos[lane] for lane in link_from_lane], dtype=np.int64)
+    link_movement = np.array(
+        [MOVEMENTS.index(_DIR_TO_MOVEMENT.get(d, "straight")) for d in link_dir], dtype=np.int64)
+    link_approach = np.array([in_edges.index(e) for e in link_from_edge], dtype=np.int64)
+
+    return NetworkIndex(
+        tls_id=tls_id,
+        junction_id=junction_id,
+        n_links=n_links,
+        link_from_lane=link_from_lane,
+        link_to_lane=link_to_lane,
+        link_from_edge=link_from_edge,
+        link_to_edge=link_to_edge,
+        link_dir=link_dir,
+        approaches=approaches,
+        approach_edge=approach_edge,
+        approach_links=approach_links,
+        approach_lanes=approach_lanes,
+        approach_detectors=approach_detectors,
+        lane_detectors=lane_detectors,
+        in_edges=tuple(in_edges),
+        straight_next=straight_next,
+        left_next=left_next,
+        left_lane=left_lane,
+        lanes=lanes,
+        detector_ids=tuple(main_detector(lane) for lane in lanes),
+        lane_link=_readonly(lane_link),
+        lane_approach=_readonly(lane_approach),
+        link_lane=_readonly(link_lane),
+        link_movement=_readonly(link_movement),
+        link_approach=_readonly(link_approach),
+        source=source,
+    )
+
+
+_MEMO = {}
+
+
+def load_index(tls_id=DEFAULT_TLS, net_path=NET_FILE, add_path=ADD_FILE,
+               cache_dir=CACHE_DIR, rebuild=False):
+    """
+    取得 NetworkIndex：同一 process 內 memo，跨 process 讀 .cache/ 的 pickle；
+    net.xml / add.xml 內容改變（sha1 不同）才重新解析。
+    """
+    paths = [net_path] + ([add_path] if add_path and os.path.exists(add_path) else [])
+    key = f"{tls_id}-{_file_hash(*paths)}-v{CACHE_VERSION}"
+    if not rebuild and key in _MEMO:
+        return _MEMO[key]
+
+    cache_path = os.path.join(cache_dir, f"netindex_{key}.pkl") if cache_dir else None
+    index = None
+    if cache_path and not rebuild and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            index = None
+        else:
+            for value in vars(index).values():
+                if isinstance(value, np.ndarray):
+                    _readonly(value)
+    if index is None:
+        index = build_index(tls_id, net_path, add_path, source=key)
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_path)
+
+    _MEMO[key] = index
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / inspect the TLS network index")
+    parser.add_argument("--tls", default=DEFAULT_TLS)
+    parser.add_argument("--net", default=NET_FILE)
+    parser.add_argument("--add", default=ADD_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="忽略快取重新解析")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    index = load_index(args.tls, args.net, args.add, rebuild=args.rebuild)
+    t_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    build_index(args.tls, args.net, args.add)
+    t_parse = time.perf_counter() - t0
+
+    print(f"TLS {index.tls_id}: {index.n_links} links, {len(index.lanes)} incoming lanes")
+    for a in index.approaches:
+        links = index.approach_links[a]
+        dirs = "".join(index.link_dir[i] for i in links)
+        print(f"  {a:3s} edge={index.approach_edge[a]:12s} links={links[0]}-{links[-1]} "
+              f"dirs={dirs} detectors={list(index.approach_detectors[a])}")
+    print(f"Straight next : {index.straight_next}")
+    print(f"Left next     : {index.left_next}  (left lane {index.left_lane})")
+    print(f"Load: {t_load * 1e3:.2f} ms (cache {index.source}), XML parse: {t_parse * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+相位衝突檢查（依 Traci.net.xml 路口 foes / response 矩陣）
+
+SUMO 路口 <junction> 底下每個 <request index=i> 有兩個長度 = link 數的 bit 字串：
+- foes     : link i 與哪些 link 軌跡衝突
+- response : link i 必須讓哪些 link（i 是次要車流）
+字串最右邊一位是 link 0，所以 int(bits, 2) 的第 j 個 bit 正好對應 link j。
+
+矩陣只解析一次（以檔案路徑 + mtime 快取），之後每個 RYG state 的檢查
+只是幾個 int 的位元運算（微秒等級），檢查結果也依 state 字串快取。
+
+判斷規則：
+- 兩條衝突的 link 同時為綠燈（G / g）→ 不安全
+- 例外：其中一條是 permissive 'g'，且 response 指出它要讓另一條
+  （例如 'g' 左轉讓對向直行）
+- strict=True 時另外檢查換相：上一個 phase 還是綠 / 黃燈的 link，
+  下一個 phase 直接給衝突 link 綠燈（沒有全紅清空）
+
+用法：
+    python phase_conflicts.py                       # 檢查所有內建計畫
+    python phase_conflicts.py --state rrrrrGGGGrrrrrGGGGrr
+    python phase_conflicts.py --strict --bench
+"""
+
+import argparse
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from phase_plan import (
+    GREEN_CHARS, PERMISSIVE_4, PROTECTED_LEFT_8, PhasePlan, PhasePlanError,
+)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NET_FILE = os.path.join(SCRIPT_DIR, "Traci.net.xml")
+TLS_JUNCTION = "Node2"
+
+# 換相時還佔用路口的燈號（綠 / 黃）
+ACTIVE_CHARS = set("gGyYu")
+
+BUILTIN_PLANS = {
+    "protected_left_8": PROTECTED_LEFT_8,
+    "permissive_4": PERMISSIVE_4,
+}
+
+_JUNCTION_RE = r'<junction\s+id="{}"[^>]*>(.*?)</junction>'
+_REQUEST_RE = re.compile(
+    r'<request\s+index="(\d+)"\s+response="([01]+)"\s+foes="([01]+)"')
+
+
+class UnsafePlanError(PhasePlanError):
+    """相位計畫包含衝突綠燈。"""
+
+
+def _bits(mask):
+    """int bitmask → link index list。"""
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(low.bit_length() - 1)
+        mask ^= low
+    return out
+
+
+@dataclass(frozen=True, eq=False)
+class ConflictMatrix:
+    """單一路口的衝突矩陣（每條 link 一個 int bitmask）。"""
+
+    junction: str
+    n_links: int
+    foes: tuple        # foes[i]     : 與 link i 衝突的 link
+    response: tuple    # response[i] : link i 要讓的 link
+    yielded_by: tuple  # yielded_by[i]: 要讓 link i 的 link
+
+    def masks(self, state):
+        """回傳 (green, minor, active) 三個 bitmask。"""
+        green = minor = active = 0
+        for i, c in enumerate(state):
+            if c in GREEN_CHARS:
+                green |= 1 << i
+                if c == "g":
+                    minor |= 1 << i
+            if c in ACTIVE_CHARS:
+                active |= 1 << i
+        return green, minor, active
+
+    def conflicts(self, state):
+        """回傳 state 中不安全的綠燈 link 對 [(i, j), ...]（i < j）。"""
+        cached = _STATE_CACHE.get((id(self), state))
+        if cached is not None:
+            return cached
+        if len(state) != self.n_links:
+            raise PhasePlanError(
+                f"state length {len(state)} != {self.n_links} links of junction {self.junction}")
+
+        green, minor, _ = self.masks(state)
+        pairs = []
+        for i in _bits(green):
+            bad = self.foes[i] & green & ~((1 << (i + 1)) - 1)   # 只看 j > i
+            if not bad:
+                continue
+            # 'g' 且 response 表示要讓 → 允許
+            if (minor >> i) & 1:
+                bad &= ~self.response[i]
+            bad &= ~(self.yielded_by[i] & minor)
+            pairs.extend((i, j) for j in _bits(bad))
+        result = tuple(pairs)
+        _STATE_CACHE[(id(self), state)] = result
+        return result
+
+    def is_safe_state(self, state):
+        return not self.conflicts(state)
+
+    def clearance_conflicts(self, state, next_state):
+        """
+        換相 state → next_state：next_state 新給綠燈的 link 與 state 中
+        仍為綠 / 黃燈的衝突 link（沒有全紅清空）。回傳 [(舊 link, 新 link), ...]。
+        """
+        old_green, _, active = self.masks(state)
+        new_green, _, _ = self.masks(next_state)
+        pairs = []
+        for j in _bits(new_green & ~old_green):
+            pairs.extend((i, j) for i in _bits(self.foes[j] & active))
+        return pairs
+
+
+_CACHE = {}
+_STATE_CACHE = {}
+
+
+def load_conflicts(net_path=NET_FILE, junction=TLS_JUNCTION):
+    """解析路口的 foes / response 矩陣（同一檔案未修改時只解析一次）。"""
+    net_path = os.path.abspath(net_path)
+    key = (net_path, os.path.getmtime(net_path), junction)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    with open(net_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    m = re.search(_JUNCTION_RE.format(re.escape(junction)), text, re.S)
+    if m is None:
+        raise PhasePlanError(f"junction '{junction}' not found in {net_path}")
+    rows = sorted((int(i), resp, foes) for i, resp, foes in _REQUEST_RE.findall(m.group(1)))
+    if not rows or [r[0] for r in rows] != list(range(len(rows))):
+        raise PhasePlanError(f"junction '{junction}' has no complete <request> matrix")
+
+    n = len(rows)
+    foes = tuple(int(f, 2) for _, _, f in rows)
+    response = tuple(int(r, 2) for _, r, _ in rows)
+    yielded_by = tuple(
+        sum(1 << j for j in range(n) if (response[j] >> i) & 1) for i in range(n))
+
+    matrix = ConflictMatrix(junction=junction, n_links=n, foes=foes,
+                            response=response, yielded_by=yielded_by)
+    _CACHE[key] = matrix
+    return matrix
+
+
+def is_safe_state(state, matrix=None):
+    matrix = matrix or load_conflicts()
+    return matrix.is_safe_state(state)
+
+
+def check_plan(plan, matrix=None, strict=False):
+    """
+    檢查整個計畫（PhasePlan 或 list-of-dict 定義），回傳問題描述 list。
+    strict=True 時也檢查固定循環的換相是否缺少全紅清空。
+    """
+    matrix = matrix or load_conflicts()
+    if isinstance(plan, PhasePlan):
+        names, states = plan.names, plan.states
+    else:
+        names = tuple(p["name"] for p in plan)
+        states = tuple(p["state"] for p in plan)
+
+    problems = []
+    for name, state in zip(names, states):
+        for i, j in matrix.conflicts(state):
+            problems.append(
+                f"'{name}': links {i} ({state[i]}) and {j} ({state[j]}) conflict")
+
+    if strict:
+        n = len(states)
+        for k in range(n):
+            nxt = (k + 1) % n
+            for i, j in matrix.clearance_conflicts(states[k], states[nxt]):
+                problems.append(
+                    f"'{names[k]}' -> '{names[nxt]}': link {j} turns green while "
+                    f"conflicting link {i} is still {states[k][i]} (no all-red)")
+    return problems
+
+
+def validate_plan(plan, matrix=None, strict=False):
+    """有衝突時 raise UnsafePlanError；沒問題則原樣回傳 plan。"""
+    problems = check_plan(plan, matrix=matrix, strict=strict)
+    if problems:
+        raise UnsafePlanError("unsafe phase plan:\n  " + "\n  ".join(problems))
+    return plan
+
+
+# -------------------------
+# CLI
+# -------------------------
+def _bench(matrix, states, repeat=10000):
+    """每個 state 檢查的平均時間（微秒）：未快取 / 快取。"""
+    t0 = time.perf_counter()
+    for _ in range(repeat // 100):
+        for s in states:
+            _STATE_CACHE.clear()
+            matrix.conflicts(s)
+    cold = (time.perf_counter() - t0) / (repeat // 100 * len(states)) * 1e6
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for s in states:
+            matrix.conflicts(s)
+    warm = (time.perf_counter() - t0) / (repeat * len(states)) * 1e6
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check RYG states / phase plans against junction foes")
+    parser.add_argument("--net", default=NET_FILE)
+    parser.add_argument("--junction", default=TLS_JUNCTION)
+    parser.add_argument("--state", action="append", default=None, help="檢查單一 RYG state（可重複）")
+    parser.add_argument("--plan", choices=sorted(BUILTIN_PLANS), action="append", default=None)
+    parser.add_argument("--strict", action="store_true", help="也檢查換相是否缺少全紅")
+    parser.add_argument("--bench", action="store_true", help="量測每個 state 的檢查時間")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    matrix = load_conflicts(args.net, args.junction)
+    print(f"Junction {matrix.junction}: {matrix.n_links} links "
+          f"(parsed in {(time.perf_counter() - t0) * 1e3:.2f} ms)")
+
+    failed = False
+    if args.state:
+        for state in args.state:
+            pairs = matrix.conflicts(state)
+            print(f"{state}: {'OK' if not pairs else 'CONFLICT ' + str(list(pairs))}")
+            failed |= bool(pairs)
+    else:
+        for name in args.plan or sorted(BUILTIN_PLANS):
+            problems = check_plan(BUILTIN_PLANS[name], matrix, strict=args.strict)
+            print(f"\n[{name}] {'OK' if not problems else f'{len(problems)} problem(s)'}")
+            for p in problems:
+                print("  " + p)
+            failed |= bool(problems)
+
+    if args.bench:
+        states = args.state or [p["state"] for plan in BUILTIN_PLANS.values() for p in plan]
+        cold, warm = _bench(matrix, states)
+        print(f"\nCheck time: {cold:.2f} µs/state (uncached), {warm:.3f} µs/state (cached)")
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+相位計畫（phase plan）編譯器
+
+把 PHASE_CYCLE 這種 list-of-dict 的定義，驗證後編譯成唯讀的 NumPy 查表：
+- next_phase      : 固定循環的下一個 phase
+- is_yellow / is_green
+- group_id / movement_id、group_end / movement_end（決策邊界）
+- group_next / movement_next（group / movement 內的下一個 phase）
+- link_green      : (phase, link) 綠燈遮罩
+- approach_green  : (phase, approach) 綠燈遮罩
+- durations       : 每個 phase 的步數（1 step = 0.1 秒）
+
+控制器每一步只做 O(1) 陣列查表，不再走 list / dict 或 `idx in [1, 3, 5, 7]`。
+同一份定義只編譯一次（以內容為 key 快取）。
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# SUMO RYG state 合法字元
+VALID_SIGNAL_CHARS = set("rRyYgGuUoOs")
+GREEN_CHARS = set("gG")
+YELLOW_CHARS = set("yYu")
+
+# 索引對應: SB(0-4), WB(5-9), NB(10-14), EB(15-19)
+APPROACH_LINKS = {
+    "SB": tuple(range(0, 5)),
+    "WB": tuple(range(5, 10)),
+    "NB": tuple(range(10, 15)),
+    "EB": tuple(range(15, 20)),
+}
+
+# -------------------------
+# 計畫定義
+# -------------------------
+# 保護左轉 8 相位（與 PPO / Max-Pressure / Webster / LLM 相同）
+#   NS 直行 G: 30s → 300 steps    NS 直行 Y: 3s → 30 steps
+#   NS 左轉 G: 15s → 150 steps    NS 左轉 Y: 3s → 30 steps
+#   EW 直行 G: 30s → 300 steps    EW 直行 Y: 3s → 30 steps
+#   EW 左轉 G: 15s → 150 steps    EW 左轉 Y: 3s → 30 steps
+# Straight: GGGGr (Right+Straight Green, Left Red)
+# Left: rrrrG (Left Green, others Red)
+
+PROTECTED_LEFT_8 = [
+    {"name": "NS Straight",     "state": "GGGGrrrrrrGGGGrrrrrr", "duration": 300, "group": "NS", "movement": "NS_STRAIGHT"},
+    {"name": "NS Straight (Y)", "state": "yyyyrrrrrryyyyrrrrrr", "duration": 30,  "group": "NS", "movement": "NS_STRAIGHT"},
+    {"name": "NS Left",         "state": "rrrrGrrrrrrrrrGrrrrr", "duration": 150, "group": "NS", "movement": "NS_LEFT"},
+    {"name": "NS Left (Y)",     "state": "rrrryrrrrrrrrryrrrrr", "duration": 30,  "group": "NS", "movement": "NS_LEFT"},
+    {"name": "EW Straight",     "state": "rrrrrGGGGrrrrrrGGGGr", "duration": 300, "group": "EW", "movement": "EW_STRAIGHT"},
+    {"name": "EW Straight (Y)", "state": "rrrrryyyyrrrrrryyyyr", "duration": 30,  "group": "EW", "movement": "EW_STRAIGHT"},
+    {"name": "EW Left",         "state": "rrrrrrrrrGrrrrrrrrrG", "duration": 150, "group": "EW", "movement": "EW_LEFT"},
+    {"name": "EW Left (Y)",     "state": "rrrrrrrrryrrrrrrrrry", "duration": 30,  "group": "EW", "movement": "EW_LEFT"},
+]
+
+# SUMO 內建的 4 相位（左轉為 permissive 'g'），取自 Traci.net.xml 的 tlLogic
+PERMISSIVE_4 = [
+    {"name": "NS Green",  "state": "GGGGgrrrrrGGGGgrrrrr", "duration": 420, "group": "NS", "movement": "NS"},
+    {"name": "NS Yellow", "state": "yyyyyrrrrryyyyyrrrrr", "duration": 30,  "group": "NS", "movement": "NS"},
+    {"name": "EW Green",  "state": "rrrrrGGGGgrrrrrGGGGg", "duration": 420, "group": "EW", "movement": "EW"},
+    {"name": "EW Yellow", "state": "rrrrryyyyyrrrrryyyyy", "duration": 30,  "group": "EW", "movement": "EW"},
+]
+
+
+class PhasePlanError(ValueError):
+    """相位計畫定義不合法。"""
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+@dataclass(frozen=True, eq=False)
+class PhasePlan:
+    """編譯後的相位計畫（所有陣列皆唯讀）。"""
+
+    phases: tuple            # 原始定義（dict），方便列印 / 存 config
+    names: tuple
+    states: tuple
+    groups: tuple            # group 名稱，例如 ("NS", "EW")
+    movements: tuple         # movement 名稱，例如 ("NS_STRAIGHT", ...)
+    approaches: tuple        # approach 名稱，例如 ("SB", "WB", "NB", "EB")
+    approach_links: tuple    # ((approach, (link, ...)), ...)
+    durations: np.ndarray    # (P,) int, steps
+    next_phase: np.ndarray   # (P,) int
+    is_yellow: np.ndarray    # (P,) bool
+    is_green: np.ndarray     # (P,) bool
+    group_id: np.ndarray     # (P,) int
+    movement_id: np.ndarray  # (P,) int
+    group_start: np.ndarray  # (G,) int
+    group_next: np.ndarray   # (P,) int
+    group_end: np.ndarray    # (P,) bool
+    movement_start: np.ndarray  # (M,) int
+    movement_next: np.ndarray   # (P,) int
+    movement_end: np.ndarray    # (P,) bool
+    link_green: np.ndarray      # (P, L) bool
+    approach_green: np.ndarray  # (P, A) bool
+
+    @property
+    def n_phases(self):
+        return len(self.states)
+
+    @property
+    def n_links(self):
+        return self.link_green.shape[1]
+
+    @property
+    def cycle_steps(self):
+        return int(self.durations.sum())
+
+    def group_index(self, name):
+        return self.groups.index(name)
+
+    def movement_index(self, name):
+        return self.movements.index(name)
+
+    def group_green(self, name):
+        """(P,) bool：屬於 group name 且為綠燈的 phase。"""
+        return _readonly(self.is_green & (self.group_id == self.group_index(name)))
+
+    def with_durations(self, durations):
+        """回傳只改 duration（steps）的新計畫（重新驗證、編譯）。"""
+        durations = [int(d) for d in durations]
+        if len(durations) != self.n_phases:
+            raise PhasePlanError("durations length does not match number of phases")
+        return compile_plan([dict(p, duration=d) for p, d in zip(self.phases, durations)],
+                            approach_links=dict(self.approach_links))
+
+
+def _group_of(p):
+    return p.get("group", "ALL")
+
+
+def _movement_of(p):
+    return p.get("movement", _group_of(p))
+
+
+def _ordered_unique(seq):
+    out = []
+    for x in seq:
+        if x not in out:
+            out.append(x)
+    return tuple(out)
+
+
+def validate_plan(plan_def):
+    """檢查計畫定義；有問題時 raise PhasePlanError。"""
+    if not plan_def:
+        raise PhasePlanError("phase plan is empty")
+
+    n_links = len(plan_def[0]["state"])
+    names = []
+    for i, p in enumerate(plan_def):
+        for key in ("name", "state", "duration"):
+            if key not in p:
+                raise PhasePlanError(f"phase {i} missing '{key}'")
+        state = p["state"]
+        if len(state) != n_links:
+            raise PhasePlanError(
+                f"phase {i} ({p['name']}): state length {len(state)} != {n_links}")
+        bad = set(state) - VALID_SIGNAL_CHARS
+        if bad:
+            raise PhasePlanError(f"phase {i} ({p['name']}): invalid signal chars {sorted(bad)}")
+        if int(p["duration"]) <= 0:
+            raise PhasePlanError(f"phase {i} ({p['name']}): duration must be positive")
+        names.append(p["name"])
+
+    dup = {n for n in names if names.count(n) > 1}
+    if dup:
+        raise PhasePlanError(f"duplicate phase names: {sorted(dup)}")
+
+    # group / movement 必須是連續區段（決策只發生在區段結尾）
+    for key, label_of in (("group", _group_of), ("movement", _movement_of)):
+        labels = [label_of(p) for p in plan_def]
+        seen, prev = set(), None
+        for label in labels:
+            if label != prev and label in seen:
+                raise PhasePlanError(f"{key} '{label}' is not contiguous")
+            seen.add(label)
+            prev = label
+
+    # 綠燈不可直接變紅燈（固定循環的下一個 phase）
+    n = len(plan_def)
+    for i, p in enumerate(plan_def):
+        nxt = plan_def[(i + 1) % n]["state"]
+        for link, (a, b) in enumerate(zip(p["state"], nxt)):
+            if a in GREEN_CHARS and b in "rR":
+                raise PhasePlanError(
+                    f"link {link}: green in '{p['name']}' goes straight to red in "
+                    f"'{plan_def[(i + 1) % n]['name']}' (missing yellow)")
+
+    # movement 結尾會跳到任意 movement 開頭，因此結尾不可留綠燈
+    for i, p in enumerate(plan_def):
+        last_of_movement = (i == n - 1) or _movement_of(plan_def[i + 1]) != _movement_of(p)
+        if last_of_movement and set(p["state"]) & GREEN_CHARS:
+            raise PhasePlanError(
+                f"phase {i} ({p['name']}) ends a movement but still shows green")
+
+
+_CACHE = {}
+
+
+def _plan_key(plan_def, approach_links):
+    phases = tuple(
+        (p["name"], p["state"], int(p["duration"]), p.get("group"), p.get("movement"))
+        for p in plan_def
+    )
+    links = tuple(sorted((k, tuple(v)) for k, v in approach_links.items()))
+    return phases, links
+
+
+def compile_plan(plan_def, approach_links=None):
+    """
+    驗證並編譯計畫定義 → PhasePlan（內容相同的定義只編譯一次）。
+    approach_links: {approach: link index 序列}，預設 APPROACH_LINKS。
+    """
+    approach_links = APPROACH_LINKS if approach_links is None else approach_links
+    key = _plan_key(plan_def, approach_links)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    validate_plan(plan_def)
+
+    P = len(plan_def)
+    L = len(plan_def[0]["state"])
+    states = tuple(p["state"] for p in plan_def)
+    names = tuple(p["name"] for p in plan_def)
+    group_labels = [_group_of(p) for p in plan_def]
+    movement_labels = [_movement_of(p) for p in plan_def]
+    groups = _ordered_unique(group_labels)
+    movements = _ordered_unique(movement_labels)
+    approaches = tuple(approach_links)
+
+    link_green = np.array([[c in GREEN_CHARS for c in s] for s in states], dtype=bool)
+    link_yellow = np.array([[c in YELLOW_CHARS for c in s] for s in states], dtype=bool)
+    is_green = link_green.any(axis=1)
+    is_yellow = link_yellow.any(axis=1) & ~is_green
+
+    approach_mask = np.zeros((len(approaches), L), dtype=bool)
+    for a, name in enumerate(approaches):
+        idx = [i for i in approach_links[name] if i < L]
+        approach_mask[a, idx] = True
+    approach_green = (link_green[:, None, :] & approach_mask[None, :, :]).any(axis=2)
+
+    group_id = np.array([groups.index(g) for g in group_labels], dtype=np.int64)
+    movement_id = np.array([movements.index(m) for m in movement_labels], dtype=np.int64)
+
+    def segment_tables(ids, n_seg):
+        start = np.array([int(np.flatnonzero(ids == k)[0]) for k in range(n_seg)], dtype=np.int64)
+        nxt = np.empty(P, dtype=np.int64)
+        end = np.zeros(P, dtype=bool)
+        for k in range(n_seg):
+            members = np.flatnonzero(ids == k)
+            nxt[members] = np.roll(members, -1)
+            end[members[-1]] = True
+        return start, nxt, end
+
+    group_start, group_next, group_end = segment_tables(group_id, len(groups))
+    movement_start, movement_next, movement_end = segment_tables(movement_id, len(movements))
+
+    plan = PhasePlan(
+        phases=tuple(dict(p) for p in plan_def),
+        names=names,
+        states=states,
+        groups=groups,
+        movements=movements,
+        approaches=approaches,
+        approach_links=tuple((name, tuple(approach_links[name])) for name in approaches),
+        durations=_readonly(np.array([int(p["duration"]) for p in plan_def], dtype=np.int64)),
+        next_phase=_readonly((np.arange(P, dtype=np.int64) + 1) % P),
+        is_yellow=_readonly(is_yellow),
+        is_green=_readonly(is_green),
+        group_id=_readonly(group_id),
+        movement_id=_readonly(movement_id),
+        group_start=_readonly(group_start),
+        group_next=_readonly(group_next),
+        group_end=_readonly(group_end),
+        movement_start=_readonly(movement_start),
+        movement_next=_readonly(movement_next),
+        movement_end=_readonly(movement_end),
+        link_green=_readonly(link_green),
+        approach_green=_readonly(approach_green),
+    )
+    _CACHE[key] = plan
+    return plan
+
+
+# 預設計畫（所有控制器共用）
+DEFAULT_PLAN = compile_plan(PROTECTED_LEFT_8)
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Policy 蒸餾成查表：把訓練好的 PPO（或 LLM 的決策紀錄）量化成整數 action 表，推論只剩一次索引
+
+- 觀測量化：4 個 movement 的 queue（NS_STRAIGHT / NS_LEFT / EW_STRAIGHT / EW_LEFT，
+  與 LLM 控制器的 q_NS_s 等相同：直行 = 車道 0、1，左轉 = 車道 2）依 QUEUE_EDGES 分 bin，
+  再乘上 phase index → cell = ((((b0·B + b1)·B + b2)·B + b3)·P + phase
+- 表格內容：
+  - PPO（npz: policy_W, policy_b）：先以每個 cell 的代表 state 填 greedy action，
+    有樣本（rollout_archive 或 TRACI_BC_LOG 紀錄）時，樣本落到的 cell 改用該 cell 樣本上 greedy action 的多數決
+  - 決策紀錄（例如 TRACI_BC_LOG 記錄的 LLM movement 選擇）：每個 cell 取多數決，
+    沒有樣本的 cell 用 LLM 控制器自己的 fallback（queue 最大的 movement）
+- 報告：樣本上與原 policy 的一致率（全部 / 只算 group 結尾決策點），以及單次決策延遲
+  （PPO：np.array + matmul + argmax；查表：純 Python 的 bin 查詢 + bytes 索引）
+- 表格另存 seen（有樣本支持的 cell）；控制器以 TRACI_POLICY_TABLE 載入時，
+  沒有樣本的 cell 視為 miss，改用控制器原本的決策（PPO 網路 / LLM 呼叫）
+
+用法：
+    python policy_table.py build --ppo runs/ppo_pretrained.npz --samples runs/rollouts --out runs/ppo_table.npz
+    TRACI_BC_LOG=runs/bc/llm python traci.LLM.RAP.compare.py
+    python policy_table.py build --decisions runs/bc/llm --out runs/llm_table.npz
+    python policy_table.py info runs/ppo_table.npz
+    TRACI_PPO_WEIGHTS=runs/ppo_pretrained.npz TRACI_POLICY_TABLE=runs/ppo_table.npz python traci_ppo_signal_control.py
+    TRACI_POLICY_TABLE=runs/llm_table.npz python traci.LLM.RAP.compare.py
+"""
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from phase_plan import DEFAULT_PLAN
+
+STATE_APPROACHES = ("EB", "SB", "WB", "NB")   # get_state 的 approach 順序
+LANES_PER_APPROACH = 3
+LEFT_LANE = 2
+MOVEMENTS = ("NS_STRAIGHT", "NS_LEFT", "EW_STRAIGHT", "EW_LEFT")
+MOVEMENT_APPROACHES = {"NS": ("SB", "NB"), "EW": ("EB", "WB")}
+QUEUE_EDGES = (1, 2, 4, 7, 11, 16, 24)        # bin 下界（第 0 個 bin 為 queue < 1）
+MISS = -1                                     # compile(strict=True) 在沒有樣本的 cell 回傳
+
+# 控制器端：有值時以查表決策（見 open_decider）
+POLICY_TABLE = os.environ.get("TRACI_POLICY_TABLE", "")
+
+
+def _readonly(arr):
+    arr = np.asarray(arr)
+    arr.setflags(write=False)
+    return arr
+
+
+def _movement_lanes():
+    """(4, 25) 0/1 矩陣：state 的 queue 欄位 → movement queue。"""
+    M = np.zeros((len(MOVEMENTS), 2 * LANES_PER_APPROACH * len(STATE_APPROACHES) + 1), dtype=np.float32)
+    for m, name in enumerate(MOVEMENTS):
+        group, kind = name.split("_")
+        for a in MOVEMENT_APPROACHES[group]:
+            base = STATE_APPROACHES.index(a) * LANES_PER_APPROACH
+            lanes = (LEFT_LANE,) if kind == "LEFT" else tuple(i for i in range(LANES_PER_APPROACH) if i != LEFT_LANE)
+            for lane in lanes:
+                M[m, base + lane] = 1.0
+    return M
+
+
+MOVEMENT_LANES = _readonly(_movement_lanes())
+
+
+def movement_queues(states):
+    """(N, 25) state → (N, 4) movement queue。"""
+    return np.asarray(states, dtype=np.float32) @ MOVEMENT_LANES.T
+
+
+# -------------------------
+# 查表 policy
+# -------------------------
+
+@dataclass(frozen=True)
+class PolicyTable:
+    edges: tuple             # queue bin 下界
+    n_phases: int
+    n_actions: int
+    actions: np.ndarray      # (B^4 · P,) int8
+    source: str = ""
+    seen: np.ndarray = None  # (B^4 · P,) bool，有樣本支持的 cell（None = 全部）
+
+    @property
+    def n_bins(self):
+        return len(self.edges) + 1
+
+    def cells(self, states):
+        """(N, 25) state → (N,) cell index（向量化）。"""
+        states = np.asarray(states, dtype=np.float32)
+        bins = np.searchsorted(np.asarray(self.edges, dtype=np.float32), movement_queues(states), side="right")
+        cell = np.zeros(len(states), dtype=np.int64)
+        for m in range(len(MOVEMENTS)):
+            cell = cell * self.n_bins + bins[:, m]
+        return cell * self.n_phases + states[:, -1].astype(np.int64)
+
+    def lookup(self, states):
+        return self.actions[self.cells(states)].astype(np.int64)
+
+    def compile(self, strict=False):
+        """
+        回傳 act(state) → action 的純 Python 函式：queue → bin 與 movement 欄位都預先展開，
+        每次決策只有整數運算與一次 bytes 索引（不經 NumPy）。
+        strict=True 時沒有樣本的 cell 與超出表格的 phase 回傳 MISS。
+        """
+        actions = self.actions.astype(np.int16)
+        if strict and self.seen is not None:
+            actions = np.where(self.seen, actions, 255)
+        table = actions.astype(np.uint8).tobytes()
+        top = self.edges[-1]
+        bin_of = [int(b) for b in np.searchsorted(self.edges, np.arange(top + 1), side="right")]
+        last = self.n_bins - 1
+        lanes = [tuple(int(i) for i in np.flatnonzero(row)) for row in MOVEMENT_LANES]
+        B, P = self.n_bins, self.n_phases
+
+        def act(state):
+            cell = 0
+            for idx in lanes:
+                q = int(sum(state[i] for i in idx))
+                cell = cell * B + (bin_of[q] if q <= top else last)
+            return table[cell * P + int(state[-1])]
+
+        if not strict:
+            return act
+
+        def act_strict(state):
+            phase = int(state[-1])
+            if not 0 <= phase < P:
+                return MISS
+            cell = 0
+            for idx in lanes:
+                q = int(sum(state[i] for i in idx))
+                cell = cell * B + (bin_of[q] if q <= top else last)
+            a = table[cell * P + phase]
+            return MISS if a == 255 else a
+
+        return act_strict
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        seen = np.ones(len(self.actions), dtype=bool) if self.seen is None else self.seen
+        np.savez(path, actions=self.actions, edges=np.asarray(self.edges), n_phases=self.n_phases,
+                 n_actions=self.n_actions, source=self.source, seen=seen)
+
+
+_table_cache = {}
+
+
+def load_table(path):
+    table = _table_cache.get(path)
+    if table is None:
+        data = np.load(path)
+        seen = _readonly(data["seen"].astype(bool)) if "seen" in data.files else None
+        table = PolicyTable(tuple(int(e) for e in data["edges"]), int(data["n_phases"]),
+                            int(data["n_actions"]), _readonly(data["actions"].astype(np.int8)),
+                            str(data["source"]), seen)
+        _table_cache[path] = table
+    return table
+
+
+# -------------------------
+# 控制器端：TRACI_POLICY_TABLE
+# -------------------------
+
+class TableDecider:
+    """
+    控制器在決策點呼叫 decide(state, fallback)：查表命中直接回傳 action，miss 時改呼叫 fallback(state)。
+    兩條路徑分別計次、計時；shadow=True 時命中也呼叫 fallback（不影響決策），
+    在同一批實際決策上量測一致率與延遲比（PPO 網路夠便宜才開；LLM 不開）。
+    """
+
+    def __init__(self, table, path, shadow=False):
+        self.table = table
+        self.path = path
+        self.shadow = shadow
+        self._act = table.compile(strict=True)
+        self.hits = self.misses = 0
+        self.table_s = 0.0
+        self.fallback_n = 0
+        self.fallback_s = 0.0
+        self.agree = 0
+
+    def decide(self, state, fallback):
+        t0 = time.perf_counter()
+        action = self._act(state)
+        t1 = time.perf_counter()
+        self.table_s += t1 - t0
+        if action == MISS:
+            self.misses += 1
+            action = fallback(state)
+            self.fallback_s += time.perf_counter() - t1
+            self.fallback_n += 1
+            return action
+        self.hits += 1
+        if self.shadow:
+            reference = fallback(state)
+            self.fallback_s += time.perf_counter() - t1
+            self.fallback_n += 1
+            self.agree += reference == action
+        return action
+
+    def summary(self):
+        """可併入 results store 的欄位（延遲為 µs / 決策）。"""
+        n = self.hits + self.misses
+        table_us = self.table_s / n * 1e6 if n else 0.0
+        fallback_us = self.fallback_s / self.fallback_n * 1e6 if self.fallback_n else 0.0
+        return {
+            "table_hits": self.hits,
+            "table_misses": self.misses,
+            "table_us": table_us,
+            "fallback_us": fallback_us,
+            "table_speedup": fallback_us / table_us if table_us and fallback_us else 0.0,
+            "table_agreement": self.agree / self.hits if self.shadow and self.hits else None,
+        }
+
+    def report(self, fallback_name):
+        s = self.summary()
+        print(f"Policy table        = {self.path} ({s['table_hits']} hits, {s['table_misses']} misses)")
+        line = f"Table latency       = {s['table_us']:.2f} µs/decision"
+        if s["fallback_us"]:
+            line += f", {fallback_name} {s['fallback_us']:.2f} µs/decision ({s['table_speedup']:.1f}×)"
+        print(line)
+        if s["table_agreement"] is not None:
+            print(f"Table vs {fallback_name:10s} = {s['table_agreement'] * 100:.1f}% agreement on table hits")
+
+
+def open_decider(n_actions, n_phases=None, shadow=False):
+    """TRACI_POLICY_TABLE 有值時載入表格（檢查 action / phase 數）回傳 TableDecider，否則 None。"""
+    if not POLICY_TABLE:
+        return None
+    n_phases = n_phases or DEFAULT_PLAN.n_phases
+    table = load_table(POLICY_TABLE)
+    if table.n_actions != n_actions or table.n_phases != n_phases:
+        raise ValueError(f"{POLICY_TABLE}: table has {table.n_actions} actions / {table.n_phases} phases, "
+                         f"controller expects {n_actions} / {n_phases} (source {table.source or '-'})")
+    return TableDecider(table, POLICY_TABLE, shadow)
+
+
+# -------------------------
+# 蒸餾
+# -------------------------
+
+def representative_states(edges=QUEUE_EDGES, n_phases=None, halt_ratio=1.0):
+    """
+    每個 cell 一個代表 state（B^4 · P, 25）：movement queue 取 bin 中點（最後一個 bin 取下界），
+    平均分到該 movement 的車道；halting = queue · halt_ratio。
+    """
+    n_phases = n_phases or DEFAULT_PLAN.n_phases
+    lo = np.array((0,) + tuple(edges), dtype=np.float32)
+    hi = np.array(tuple(edges) + (edges[-1],), dtype=np.float32)
+    rep = (lo + hi) / 2.0
+    B = len(rep)
+    grid = np.stack(np.meshgrid(*([np.arange(B)] * len(MOVEMENTS)), np.arange(n_phases), indexing="ij"),
+                    axis=-1).reshape(-1, len(MOVEMENTS) + 1)
+    per_lane = MOVEMENT_LANES / MOVEMENT_LANES.sum(axis=1, keepdims=True)   # (4, 25)
+    q = rep[grid[:, :len(MOVEMENTS)]] @ per_lane
+    n_q = LANES_PER_APPROACH * len(STATE_APPROACHES)
+    S = q.copy()
+    S[:, n_q:2 * n_q] = q[:, :n_q] * halt_ratio
+    S[:, -1] = grid[:, -1]
+    return S
+
+
+def _majority(cells, actions, n_cells, n_actions):
+    """每個 cell 的多數決 action 與樣本數。"""
+    votes = np.bincount(cells * n_actions + actions, minlength=n_cells * n_actions).reshape(n_cells, n_actions)
+    return votes.argmax(axis=1), votes.sum(axis=1)
+
+
+def distill_policy(policy_fn, n_actions, samples=None, edges=QUEUE_EDGES, n_phases=None, source=""):
+    """policy_fn((N, 25)) → (N,) greedy action；回傳 (PolicyTable, 有樣本的 cell 數)。"""
+    n_phases = n_phases or DEFAULT_PLAN.n_phases
+    halt_ratio = 1.0
+    if samples is not None and len(samples):
+        n_q = LANES_PER_APPROACH * len(STATE_APPROACHES)
+        halt_ratio = float(samples[:, n_q:2 * n_q].sum() / max(samples[:, :n_q].sum(), 1.0))
+    actions = policy_fn(representative_states(edges, n_phases, halt_ratio)).astype(np.int8)
+    table = PolicyTable(tuple(edges), n_phases, n_actions, actions, source)
+    visited = 0
+    seen = None              # 沒有樣本：每個 cell 都是 policy 在代表 state 上的輸出
+    if samples is not None and len(samples):
+        vote, count = _majority(table.cells(samples), policy_fn(samples), len(actions), n_actions)
+        seen = count > 0
+        actions[seen] = vote[seen]
+        visited = int(seen.sum())
+        seen = _readonly(seen)
+    return PolicyTable(tuple(edges), n_phases, n_actions, _readonly(actions), source, seen), visited
+
+
+def distill_decisions(states, decisions, n_actions=len(MOVEMENTS), edges=QUEUE_EDGES, n_phases=None,
+                      source=""):
+    """由 (state, action) 紀錄建表；沒有樣本的 cell 用 queue 最大的 movement。"""
+    n_phases = n_phases or DEFAULT_PLAN.n_phases
+    decisions = np.asarray(decisions, dtype=np.int64)
+    if len(decisions) and (decisions.min() < 0 or decisions.max() >= n_actions):
+        raise ValueError(f"decisions must be in [0, {n_actions}), got {decisions.min()}..{decisions.max()}")
+
+    def fallback(S):
+        return movement_queues(S).argmax(axis=1)
+
+    actions = fallback(representative_states(edges, n_phases)).astype(np.int8)
+    table = PolicyTable(tuple(edges), n_phases, n_actions, actions, source)
+    vote, count = _majority(table.cells(states), decisions, len(actions), n_actions)
+    seen = count > 0
+    actions[seen] = vote[seen]
+    return (PolicyTable(tuple(edges), n_phases, n_actions, _readonly(actions), source, _readonly(seen)),
+            int(seen.sum()))
+
+
+def ppo_greedy(weights_path):
+    """線性 PPO policy（npz: policy_W, policy_b）的 greedy action。"""
+    data = np.load(weights_path)
+    W, b = data["policy_W"].astype(np.float32), data["policy_b"].astype(np.float32)
+    return lambda S: np.argmax(np.asarray(S, dtype=np.float32) @ W + b, axis=1), W, b
+
+
+def load_samples(path, max_samples=None, seed=0, sources=None):
+    """
+    rollout_archive 資料夾（index.json）或 TRACI_BC_LOG 資料夾（meta*.json）→ (states, actions)。
+    sources 只套用在 TRACI_BC_LOG 資料夾（見 behavior_cloning.load_shards）。
+    """
+    if os.path.exists(os.path.join(path, "index.json")):
+        from rollout_archive import RolloutArchive
+        archive = RolloutArchive(path, mode="r")
+        n = len(archive)
+        if max_samples and n > max_samples:
+            # 只讀抽中的列（memmap 上的 fancy index，不載入整個 archive）
+            pick = np.sort(np.random.default_rng(seed).choice(n, max_samples, replace=False))
+            states, actions = [], []
+            for start, cols in archive.chunks(["states", "actions"]):
+                rows = pick[(pick >= start) & (pick < start + len(cols["actions"]))] - start
+                states.append(np.asarray(cols["states"][rows]))
+                actions.append(np.asarray(cols["actions"][rows]))
+            return np.concatenate(states), np.concatenate(actions).astype(np.int64)
+        return np.asarray(archive.read("states")), np.asarray(archive.read("actions")).astype(np.int64)
+    from behavior_cloning import load_shards
+    states, actions, _ = load_shards([path], sources)
+    if max_samples and len(states) > max_samples:
+        pick = np.sort(np.random.default_rng(seed).choice(len(states), max_samples, replace=False))
+        states, actions = states[pick], actions[pick]
+    return states, actions
+
+
+# -------------------------
+# 報告
+# -------------------------
+
+def agreement(table, states, reference, plan=DEFAULT_PLAN):
+    """(全部樣本一致率, group 結尾決策點一致率)；決策點沒有樣本時為 nan。"""
+    match = table.lookup(states) == reference
+    decision = np.asarray(plan.group_end)[states[:, -1].astype(np.int64)]
+    return float(match.mean()), float(match[decision].mean()) if decision.any() else float("nan")
+
+
+def latency_us(fn, states, repeat=3):
+    """逐筆呼叫 fn(state) 的平均耗時（µs / 決策），取 repeat 次中最快。"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for s in states:
+            fn(s)
+        best = min(best, (time.perf_counter() - t0) / len(states))
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill a signal policy into a lookup table")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--ppo", help="PPO 權重 npz（policy_W, policy_b）")
+    src.add_argument("--decisions", help="TRACI_BC_LOG 資料夾（例如 LLM 的 movement 選擇）")
+    p.add_argument("--samples", default=None, help="PPO 用的樣本：rollout_archive 或 TRACI_BC_LOG 資料夾")
+    p.add_argument("--eval", default=None,
+                   help="評估一致率用的另一組樣本（與建表樣本不同的 archive / TRACI_BC_LOG 資料夾）；"
+                        "未指定時 PPO 用 --samples（沒有則不報告），--decisions 用建表的紀錄")
+    p.add_argument("--edges", type=int, nargs="+", default=list(QUEUE_EDGES), help="movement queue bin 下界")
+    p.add_argument("--max-samples", type=int, default=200000)
+    p.add_argument("--latency-samples", type=int, default=20000)
+    p.add_argument("--out", default=os.path.join("runs", "policy_table.npz"))
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        table = load_table(args.path)
+        counts = np.bincount(table.actions, minlength=table.n_actions)
+        print(f"{args.path}: source {table.source or '-'}, edges {list(table.edges)}, "
+              f"{table.n_phases} phases, {len(table.actions)} cells ({table.actions.nbytes} bytes)")
+        print(f"action counts: {counts.tolist()}")
+        if table.seen is not None:
+            print(f"cells with samples: {int(table.seen.sum())}/{len(table.seen)}")
+        return
+
+    edges = tuple(sorted(set(args.edges)))
+    if args.ppo:
+        policy_fn, W, b = ppo_greedy(args.ppo)
+        states = None
+        if args.samples:
+            states, _ = load_samples(args.samples, args.max_samples)
+        table, visited = distill_policy(policy_fn, W.shape[1], states, edges, source=f"ppo:{args.ppo}")
+        if states is None or not len(states):
+            # 沒有樣本時表就是在代表 state 上建的，拿同一組算一致率必定是 100%：只用來量延遲
+            states = representative_states(edges)
+            eval_states = None
+        else:
+            eval_states = states
+        if args.eval:
+            eval_states, _ = load_samples(args.eval, args.max_samples, seed=1)
+        eval_reference = policy_fn(eval_states) if eval_states is not None and len(eval_states) else None
+
+        def original(s):
+            return int(np.argmax(np.array(s, dtype=np.float32) @ W + b))
+    else:
+        from behavior_cloning import MOVEMENT_SOURCES   # 同資料夾可能也有 keep / switch 的 shard
+        states, reference = load_samples(args.decisions, args.max_samples, sources=MOVEMENT_SOURCES)
+        if not len(states):
+            raise SystemExit(f"no decisions in {args.decisions}")
+        # 紀錄可能沒出現某些 movement，action 數以 MOVEMENTS 為準（fallback cell 也會用到）
+        table, visited = distill_decisions(states, reference, len(MOVEMENTS), edges,
+                                           source=f"decisions:{args.decisions}")
+        original = None
+        eval_states, eval_reference = states, reference
+        if args.eval:
+            eval_states, eval_reference = load_samples(args.eval, args.max_samples, seed=1,
+                                                       sources=MOVEMENT_SOURCES)
+
+    table.save(args.out)
+    print(f"table: {len(table.actions)} cells × int8 = {table.actions.nbytes} bytes, "
+          f"{visited} cells seen in {len(states)} samples")
+    eval_name = "held-out samples" if args.eval else "build samples"
+    if eval_reference is None or not len(eval_reference):
+        overall = at_decision = None
+        print("agreement: n/a (no samples; pass --samples or --eval to measure it)")
+    elif args.ppo:
+        overall, at_decision = agreement(table, eval_states, eval_reference)
+        # PPO 每步都輸出 action，但只有 group 結尾的 action 會生效
+        print(f"agreement with original: {overall * 100:.1f}% (all samples), "
+              f"{at_decision * 100:.1f}% (group-end decisions) on {len(eval_states)} {eval_name}")
+    else:
+        overall, at_decision = agreement(table, eval_states, eval_reference)
+        print(f"agreement with recorded decisions: {overall * 100:.1f}% on {len(eval_states)} {eval_name}")
+
+    rows = [tuple(float(x) for x in s) for s in states[:args.latency_samples]]
+    act = table.compile()
+    report = {"table_us": latency_us(act, rows)}
+    if original is not None:
+        report["policy_us"] = latency_us(original, rows)
+    line = f"latency: table {report['table_us']:.2f} µs/decision"
+    if "policy_us" in report:
+        line += f", PPO {report['policy_us']:.2f} µs/decision ({report['policy_us'] / report['table_us']:.1f}×)"
+    print(line)
+    print(f"table → {args.out}")
+    with open(os.path.splitext(args.out)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({"source": table.source, "edges": list(edges), "cells": len(table.actions),
+                   "visited": visited, "samples": len(states), "agreement": overall,
+                   "agreement_on": None if overall is None else eval_name,
+                   "agreement_decisions": at_decision, **report}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+逐 movement 的 Max-Pressure：相位壓力 = Σ（上游車道排隊 − 下游車道車輛數）
+
+- movement = TLS 的一個 link（進入車道 → 離開車道）
+- 上游：進入車道 e2 的車輛數，平均分給從該車道出發的每個 link
+  （共用車道的右轉 / 直行各得一半；同一相位兩者都綠時合計仍是整條車道）
+- 下游：離開車道上的車輛數（traci.lane），每個 movement 都扣掉完整的下游車數，
+  下游塞住時壓力下降，避免溢流
+- 相位 × movement 的關聯矩陣在建立時先乘好：
+    M = G · [A_up, −A_down]      G: (P_green, L) 綠燈、A_up: (L, N_lane)、A_down: (L, N_out)
+  決策時只做一次 M @ [q; x]（P_green × (N_lane + N_out)，Node2 為 4 × 24）
+
+用法：
+    python pressure.py            # 印出矩陣並量測每次決策時間
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from network_index import load_index
+from phase_plan import DEFAULT_PLAN, PhasePlanError
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+@dataclass(frozen=True, eq=False)
+class PressureModel:
+    """相位壓力的預先計算矩陣（唯讀）。"""
+
+    phases: np.ndarray     # (P_green,) 候選的綠燈 phase index
+    in_lanes: tuple        # (N_lane,) 上游車道（與 NetworkIndex.lanes 相同）
+    in_detectors: tuple    # (N_lane,) 上游車道的 e2（沒有則為 None）
+    out_lanes: tuple       # (N_out,) 下游車道
+    matrix: np.ndarray     # (P_green, N_lane + N_out)
+    link_matrix: np.ndarray  # (L, N_lane + N_out)，逐 link 壓力
+
+    def phase_pressure(self, q_up, x_down):
+        """(P_green,) 各候選相位的壓力。"""
+        return self.matrix @ np.concatenate((q_up, x_down))
+
+    def link_pressure(self, q_up, x_down):
+        """(L,) 各 movement 的壓力。"""
+        return self.link_matrix @ np.concatenate((q_up, x_down))
+
+    def best_phase(self, q_up, x_down):
+        """壓力最大的綠燈 phase index（同分取較前面的 phase）。"""
+        return int(self.phases[np.argmax(self.matrix @ np.concatenate((q_up, x_down)))])
+
+
+_CACHE = {}
+
+
+def build_pressure_model(plan=DEFAULT_PLAN, index=None):
+    """依相位計畫與路網索引建立 PressureModel（同一組合只建一次）。"""
+    index = index or load_index()
+    key = (plan.states, index.source)
+    cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+    if plan.n_links != index.n_links:
+        raise PhasePlanError(f"plan has {plan.n_links} links, network has {index.n_links}")
+
+    L = index.n_links
+    n_in = len(index.lanes)
+    out_lanes = tuple(dict.fromkeys(index.link_to_lane))
+    out_pos = {lane: k for k, lane in enumerate(out_lanes)}
+
+    # 上游車道 → 該車道所有 link（平均分攤）、link → 下游車道（完整車數）
+    a_up = index.lane_link.T.astype(np.float64)
+    a_up /= np.maximum(a_up.sum(axis=0, keepdims=True), 1.0)
+    a_down = np.zeros((L, len(out_lanes)))
+    a_down[np.arange(L), [out_pos[lane] for lane in index.link_to_lane]] = 1.0
+
+    link_matrix = np.hstack((a_up, -a_down))
+    phases = np.flatnonzero(plan.is_green)
+    green = plan.link_green[phases].astype(np.float64)
+
+    model = PressureModel(
+        phases=_readonly(phases),
+        in_lanes=index.lanes,
+        in_detectors=index.detector_ids,
+        out_lanes=out_lanes,
+        matrix=_readonly(green @ link_matrix),
+        link_matrix=_readonly(link_matrix),
+    )
+    _CACHE[key] = model
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-movement max-pressure incidence matrix")
+    parser.add_argument("--repeat", type=int, default=100000)
+    args = parser.parse_args()
+
+    model = build_pressure_model()
+    names = [DEFAULT_PLAN.names[p] for p in model.phases]
+    print(f"candidate phases: {names}")
+    print(f"matrix: {model.matrix.shape} ({len(model.in_lanes)} in lanes, {len(model.out_lanes)} out lanes)")
+
+    rng = np.random.default_rng(0)
+    q = rng.integers(0, 20, len(model.in_lanes)).astype(np.float64)
+    x = rng.integers(0, 20, len(model.out_lanes)).astype(np.float64)
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        model.best_phase(q, x)
+    dt = (time.perf_counter() - t0) / args.repeat
+    print(f"best_phase: {dt * 1e6:.2f} us/decision")
+
+
+if __name__ == "__main__":
+    main()
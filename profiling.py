@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+低開銷 profiling：TraCI 呼叫統計 + 控制迴圈區段計時 + folded stack（flamegraph）
+
+- TRACI_PROFILE=1：run_config.load_traci() 回傳包裝過的 traci，
+  lanearea / vehicle / edge / trafficlight / simulation 各函式與 simulationStep 逐一計次、累計耗時
+  （第一次取用時包裝並快取在 proxy 上，之後的屬性查詢與原本相同）
+- 控制迴圈以 profiling.get().mark("observe") 切換目前區段（step / lane_discipline / observe /
+  decide / actuate / record），不需要重新縮排；TraCI 呼叫依所在區段歸類。
+  未啟用時 get() 回傳 NullProfiler，mark() 是空函式
+- 每次 traci.close() 在 stderr 印出該次執行的分解表（區段總時間、扣掉 TraCI 的 self time、
+  各函式呼叫數 / 耗時），並估計 profiling 本身的開銷
+- TRACI_PROFILE_FOLDED=<檔案>：另外附加 folded stack（"腳本;區段;domain.函式 µs"），
+  可直接給 flamegraph.pl / speedscope
+- 只包裝模組層級的 traci；traci.getConnection() 取得的連線（traci_mpc 的 worker）不計入
+
+用法：
+    TRACI_PROFILE=1 python traci.maxpreesure.py
+    TRACI_PROFILE=1 TRACI_PROFILE_FOLDED=runs/mp.folded python traci.maxpreesure.py
+    flamegraph.pl runs/mp.folded > runs/mp.svg
+"""
+
+import os
+import sys
+import time
+
+PROFILE = os.environ.get("TRACI_PROFILE", "0") not in ("", "0")
+PROFILE_FOLDED = os.environ.get("TRACI_PROFILE_FOLDED", "")
+
+DOMAINS = ("lanearea", "vehicle", "edge", "trafficlight", "simulation")
+TOP_LEVEL = ("simulationStep",)
+SETUP = "unmarked"         # 第一次 mark() 之前（或沒有標記區段的控制器）
+
+
+class NullProfiler:
+    """未啟用時使用：所有方法都不做事。"""
+
+    enabled = False
+
+    def mark(self, name):
+        pass
+
+
+class Profiler:
+    """依區段累計時間，TraCI 呼叫以 (區段, 函式) 累計次數與耗時。"""
+
+    enabled = True
+
+    def __init__(self, root=None):
+        self.root = root or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+        self.per_call_overhead = 0.0
+        self.calls = {}          # (區段, 函式) → [次數, 秒]；包裝函式持有此 dict，只清空不換新
+        self.sections = {}       # 區段 → [次數, 秒]
+        self.reset()
+
+    def reset(self):
+        self.calls.clear()
+        self.sections.clear()
+        self.current = SETUP
+        self._t = time.perf_counter()
+        self._wall0 = self._t
+
+    def mark(self, name):
+        """結束目前區段、開始 name（None = 不屬於任何區段）。"""
+        now = time.perf_counter()
+        rec = self.sections.get(self.current)
+        if rec is None:
+            self.sections[self.current] = [1, now - self._t]
+        else:
+            rec[0] += 1
+            rec[1] += now - self._t
+        self.current = name
+        self._t = now
+
+    def _flush(self):
+        """把目前區段到現在的時間計入（不增加次數），報告前呼叫。"""
+        now = time.perf_counter()
+        rec = self.sections.setdefault(self.current, [0, 0.0])
+        rec[1] += now - self._t
+        self._t = now
+
+    def timed(self, label, fn):
+        """回傳計時版的 fn；結果依呼叫當下的區段歸類。"""
+        calls = self.calls
+        clock = time.perf_counter
+
+        # 丟出例外的呼叫不計入（TraCIException 多半在 try/except 裡被吞掉，本來就不是熱點）
+        def wrapper(*args, **kwargs):
+            t0 = clock()
+            result = fn(*args, **kwargs)
+            dt = clock() - t0
+            rec = calls.get((self.current, label))
+            if rec is None:
+                calls[(self.current, label)] = [1, dt]
+            else:
+                rec[0] += 1
+                rec[1] += dt
+            return result
+
+        wrapper.__name__ = getattr(fn, "__name__", label)
+        wrapper.__doc__ = getattr(fn, "__doc__", None)
+        return wrapper
+
+    def calibrate(self, n=20000):
+        """量測包裝本身每次呼叫的額外成本（秒），報告時用來估計 profiling 開銷。"""
+        def noop():
+            return None
+        wrapped = self.timed("_calibrate", noop)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            noop()
+        base = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(n):
+            wrapped()
+        self.per_call_overhead = max(0.0, (time.perf_counter() - t0 - base) / n)
+        self.calls.clear()
+
+    # -------------------------
+    # 報告
+    # -------------------------
+
+    def summary(self):
+        """可併入 results store 的欄位（秒）。"""
+        self._flush()
+        wall = time.perf_counter() - self._wall0
+        traci_s = sum(t for _, t in self.calls.values())
+        n_calls = sum(n for n, _ in self.calls.values())
+        by_func = {}
+        for (_, label), (n, t) in self.calls.items():
+            rec = by_func.setdefault(label, [0, 0.0])
+            rec[0] += n
+            rec[1] += t
+        return {
+            "profile_wall_s": wall,
+            "profile_traci_s": traci_s,
+            "profile_traci_calls": n_calls,
+            "profile_overhead_s": n_calls * self.per_call_overhead,
+            "profile_sections": {k: round(t, 6) for k, (_, t) in self.sections.items()},
+            "profile_calls": {k: [n, round(t, 6)] for k, (n, t) in by_func.items()},
+        }
+
+    def report(self, stream=sys.stderr, top=15):
+        s = self.summary()
+        wall = s["profile_wall_s"] or 1e-12
+        traci_in = {}
+        for (section, _), (_, t) in self.calls.items():
+            traci_in[section] = traci_in.get(section, 0.0) + t
+        print(f"\n========== Profile: {self.root} (wall {wall:.2f} s) ==========", file=stream)
+        print(f"{'section':18s}{'total s':>10s}{'%':>7s}{'self s':>10s}{'TraCI s':>10s}{'marks':>10s}",
+              file=stream)
+        for name, (n, t) in sorted(self.sections.items(), key=lambda kv: -kv[1][1]):
+            tr = traci_in.get(name, 0.0)
+            print(f"{str(name):18s}{t:10.3f}{t / wall * 100:6.1f}%{t - tr:10.3f}{tr:10.3f}{n:10d}",
+                  file=stream)
+        print(f"\n{'TraCI function':40s}{'calls':>10s}{'total s':>10s}{'µs/call':>10s}", file=stream)
+        funcs = sorted(s["profile_calls"].items(), key=lambda kv: -kv[1][1])
+        for label, (n, t) in funcs[:top]:
+            print(f"{label:40s}{n:10d}{t:10.3f}{t / n * 1e6:10.1f}", file=stream)
+        if len(funcs) > top:
+            rest = funcs[top:]
+            print(f"{f'({len(rest)} more)':40s}{sum(n for _, (n, _) in rest):10d}"
+                  f"{sum(t for _, (_, t) in rest):10.3f}", file=stream)
+        print(f"\nTraCI total {s['profile_traci_s']:.3f} s in {s['profile_traci_calls']} calls "
+              f"({s['profile_traci_s'] / wall * 100:.1f}% of wall); "
+              f"profiling overhead ≈ {s['profile_overhead_s'] * 1000:.1f} ms "
+              f"({s['profile_overhead_s'] / wall * 100:.2f}%)", file=stream)
+
+    def folded(self):
+        """folded stack 行（µs，整數）：區段 self time 與各 TraCI 函式。"""
+        self._flush()
+        lines = []
+        traci_in = {}
+        for (section, label), (_, t) in self.calls.items():
+            traci_in[section] = traci_in.get(section, 0.0) + t
+            us = int(t * 1e6)
+            if us > 0:
+                lines.append(f"{self.root};{section};{label} {us}")
+        for section, (_, t) in self.sections.items():
+            us = int((t - traci_in.get(section, 0.0)) * 1e6)
+            if us > 0:
+                lines.append(f"{self.root};{section} {us}")
+        return lines
+
+    def finish_run(self):
+        """一次執行（traci.start → close）結束：印表、附加 folded、歸零。"""
+        if not self.calls and not self.sections:
+            return
+        self.report()
+        if PROFILE_FOLDED:
+            os.makedirs(os.path.dirname(PROFILE_FOLDED) or ".", exist_ok=True)
+            with open(PROFILE_FOLDED, "a", encoding="utf-8") as f:
+                f.write("\n".join(self.folded()) + "\n")
+            print(f"folded stacks → {PROFILE_FOLDED}", file=sys.stderr)
+        self.reset()
+
+
+# -------------------------
+# traci 包裝
+# -------------------------
+
+class _DomainProxy:
+    """traci domain 的代理：函式第一次取用時包裝並存成實例屬性。"""
+
+    def __init__(self, profiler, name, domain):
+        self._profiler = profiler
+        self._name = name
+        self._domain = domain
+
+    def __getattr__(self, attr):
+        value = getattr(self._domain, attr)
+        if callable(value) and not attr.startswith("_"):
+            value = self._profiler.timed(f"{self._name}.{attr}", value)
+            setattr(self, attr, value)
+        return value
+
+
+class ProfiledTraci:
+    """traci 模組的代理；未包裝的屬性（constants、gui、exceptions…）直接轉給原模組。"""
+
+    def __init__(self, traci, profiler):
+        self._traci = traci
+        self._profiler = profiler
+        for name in DOMAINS:
+            setattr(self, name, _DomainProxy(profiler, name, getattr(traci, name)))
+        for name in TOP_LEVEL:
+            setattr(self, name, profiler.timed(name, getattr(traci, name)))
+
+    def __getattr__(self, attr):
+        return getattr(self._traci, attr)
+
+    def start(self, *args, **kwargs):
+        # 前一次執行沒有 close（例如例外中斷）時先結算
+        self._profiler.finish_run()
+        result = self._traci.start(*args, **kwargs)
+        self._profiler.reset()
+        return result
+
+    def close(self, *args, **kwargs):
+        try:
+            return self._traci.close(*args, **kwargs)
+        finally:
+            self._profiler.finish_run()
+
+
+_active = NullProfiler()
+
+
+def get():
+    """目前的 profiler（未啟用時為 NullProfiler）。"""
+    return _active
+
+
+def instrument(traci, root=None):
+    """建立 Profiler 並回傳包裝過的 traci（run_config.load_traci 在 TRACI_PROFILE=1 時呼叫）。"""
+    global _active
+    if isinstance(traci, ProfiledTraci):
+        return traci
+    _active = Profiler(root)
+    _active.calibrate()
+    return ProfiledTraci(traci, _active)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+從 results store 自動產生控制器比較報告（Markdown）
+
+- 依 (controller, scenario, config hash) 分組
+- 每個指標輸出 mean ± 95% 信賴區間（跨 seed，t 分布）
+- 另外附上 wall time 與 steps/sec
+
+用法：
+    python results_report.py                       # 印到終端機
+    python results_report.py --out "Comparison.md" --scenario S1
+"""
+
+import argparse
+import math
+from collections import OrderedDict
+
+import results_store
+
+# 報告中的指標：(summary key, 顯示名稱, 格式)
+REPORT_METRICS = [
+    ("avg_queue_total", "Avg Queue (veh)", "{:.2f}"),
+    ("avg_delay_time", "Avg Delay (s/veh)", "{:.2f}"),
+    ("total_waiting_time", "Total Waiting (veh·s)", "{:.0f}"),
+    ("total_arrived", "Arrived (veh)", "{:.0f}"),
+    ("cumulative_reward", "Cumulative Reward", "{:.0f}"),
+]
+
+# 雙尾 95% t 臨界值，df = 1..30
+_T95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t_critical_95(df):
+    """雙尾 95% t 臨界值；df > 30 用 Cornish-Fisher 近似。"""
+    if df < 1:
+        return float("inf")
+    df_i = int(math.floor(df))
+    if df_i <= 30:
+        return _T95[df_i - 1]
+    z = 1.959964
+    return z + (z ** 3 + z) / (4.0 * df)
+
+
+def mean_ci(values):
+    """回傳 (mean, 95% CI 半寬)；樣本數 < 2 時半寬為 inf。"""
+    n = len(values)
+    if n == 0:
+        return float("nan"), float("inf")
+    mean = sum(values) / n
+    if n < 2:
+        return mean, float("inf")
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, t_critical_95(n - 1) * math.sqrt(var / n)
+
+
+def welch_diff_ci(a, b):
+    """
+    兩組獨立樣本平均差 mean(a) - mean(b) 的 95% CI（Welch t）。
+    回傳 (diff, 半寬)；任一組 < 2 筆時半寬為 inf。
+    """
+    na, nb = len(a), len(b)
+    if na < 2 or nb < 2:
+        diff = (sum(a) / na if na else float("nan")) - (sum(b) / nb if nb else float("nan"))
+        return diff, float("inf")
+    ma, mb = sum(a) / na, sum(b) / nb
+    va = sum((v - ma) ** 2 for v in a) / (na - 1)
+    vb = sum((v - mb) ** 2 for v in b) / (nb - 1)
+    se2 = va / na + vb / nb
+    if se2 == 0.0:
+        return ma - mb, 0.0
+    df = se2 ** 2 / ((va / na) ** 2 / (na - 1) + (vb / nb) ** 2 / (nb - 1))
+    return ma - mb, t_critical_95(df) * math.sqrt(se2)
+
+
+def group_runs(runs):
+    """依 (controller, scenario, config_hash) 分組，保留第一次出現的順序。"""
+    groups = OrderedDict()
+    for run in runs:
+        key = (run["controller"], run["scenario"], run["config_hash"])
+        groups.setdefault(key, []).append(run)
+    return groups
+
+
+def _fmt_ci(values, fmt):
+    if not values:
+        return "-"
+    mean, half = mean_ci(values)
+    if math.isinf(half):
+        return fmt.format(mean)
+    return f"{fmt.format(mean)} ± {fmt.format(half)}"
+
+
+def build_report(runs, title="Traffic Control Methods Comparison"):
+    """runs（results_store.load_runs 的輸出）→ Markdown 字串。"""
+    groups = group_runs(runs)
+
+    lines = [f"# {title}", ""]
+    lines.append("數值為跨 seed 平均 ± 95% 信賴區間半寬（t 分布）。")
+    lines.append("")
+
+    header = ["Controller", "Scenario", "Config", "Runs"] + [m[1] for m in REPORT_METRICS]
+    lines.append("| " + " | ".join(header) + " |")
+    lines.append("|" + "|".join(["---"] * len(header)) + "|")
+    for (controller, scenario, cfg_hash), group in groups.items():
+        row = [controller, scenario, f"`{cfg_hash}`", str(len(group))]
+        for key, _, fmt in REPORT_METRICS:
+            values = [float(r[key]) for r in group if r.get(key) is not None]
+            row.append(_fmt_ci(values, fmt))
+        lines.append("| " + " | ".join(row) + " |")
+
+    lines.append("")
+    lines.append("## Runtime")
+    lines.append("")
+    lines.append("| Controller | Config | Seeds | Wall Time (s) | Steps/s |")
+    lines.append("|---|---|---|---|---|")
+    for (controller, _, cfg_hash), group in groups.items():
+        seeds = sorted({r["seed"] for r in group if r["seed"] is not None})
+        seeds_txt = ", ".join(str(s) for s in seeds[:10]) + (" …" if len(seeds) > 10 else "")
+        lines.append(
+            f"| {controller} | `{cfg_hash}` | {seeds_txt} | "
+            f"{_fmt_ci([r['wall_time'] for r in group], '{:.1f}')} | "
+            f"{_fmt_ci([r['steps_per_sec'] for r in group], '{:.0f}')} |"
+        )
+    lines.append("")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build comparison report from results store")
+    parser.add_argument("--db", default=results_store.DEFAULT_DB)
+    parser.add_argument("--controller", action="append", default=None,
+                        help="只列出指定控制器（可重複）")
+    parser.add_argument("--scenario", default=None)
+    parser.add_argument("--title", default="Traffic Control Methods Comparison")
+    parser.add_argument("--out", default=None, help="輸出 Markdown 檔（預設印到終端機）")
+    args = parser.parse_args()
+
+    runs = results_store.load_runs(scenario=args.scenario, db_path=args.db)
+    if args.controller:
+        runs = [r for r in runs if r["controller"] in args.controller]
+
+    report = build_report(runs, title=args.title)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"Report written to {args.out} ({len(runs)} runs)")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only 本機結果庫（SQLite）
+
+每個控制器跑完後呼叫 record_run()，寫入：
+- controller / scenario / seed
+- config（JSON）與 config hash（同一組參數的 run 可以直接分組比較）
+- wall time、模擬步數、steps/sec
+- summary（控制器最後印出的統計數字）
+
+runs 表只允許 INSERT（UPDATE / DELETE 會被 trigger 擋下）。
+預設路徑 results/results.sqlite，可用環境變數 TRACI_RESULTS_DB 覆寫。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get(
+    "TRACI_RESULTS_DB", os.path.join(SCRIPT_DIR, "results", "results.sqlite")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id        TEXT NOT NULL UNIQUE,
+    controller    TEXT NOT NULL,
+    scenario      TEXT NOT NULL,
+    config_hash   TEXT NOT NULL,
+    config_json   TEXT NOT NULL,
+    seed          INTEGER,
+    created_at    TEXT NOT NULL,
+    wall_time     REAL NOT NULL,
+    sim_steps     INTEGER NOT NULL,
+    steps_per_sec REAL NOT NULL,
+    summary_json  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_controller ON runs (controller, scenario, config_hash);
+CREATE TRIGGER IF NOT EXISTS runs_no_update BEFORE UPDATE ON runs
+BEGIN SELECT RAISE(ABORT, 'runs table is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS runs_no_delete BEFORE DELETE ON runs
+BEGIN SELECT RAISE(ABORT, 'runs table is append-only'); END;
+"""
+
+
+def connect(db_path=DEFAULT_DB):
+    """開啟（必要時建立）結果庫。"""
+    if db_path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def config_hash(config):
+    """config dict 的穩定 hash（key 排序後 JSON → sha1 前 12 碼）。"""
+    blob = json.dumps(config, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:12]
+
+
+def record_run(controller, summary, config, seed, wall_time, sim_steps,
+               run_id, scenario="S1", db_path=DEFAULT_DB):
+    """寫入一筆 run，回傳 config hash。"""
+    cfg_hash = config_hash(config)
+    steps_per_sec = sim_steps / wall_time if wall_time > 0 else 0.0
+    with connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO runs (run_id, controller, scenario, config_hash, config_json,"
+            " seed, created_at, wall_time, sim_steps, steps_per_sec, summary_json)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id, controller, scenario, cfg_hash,
+                json.dumps(config, sort_keys=True, default=str, ensure_ascii=False),
+                seed, datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                float(wall_time), int(sim_steps), float(steps_per_sec),
+                json.dumps(summary, sort_keys=True, default=float),
+            ),
+        )
+    conn.close()
+    return cfg_hash
+
+
+def load_runs(controller=None, scenario=None, config_hash=None, run_ids=None,
+              db_path=DEFAULT_DB):
+    """
+    讀出 runs，回傳 list of dict；summary 欄位攤平到最外層。
+    可依 controller / scenario / config_hash / run_ids 篩選。
+    """
+    if not os.path.exists(db_path):
+        return []
+
+    where, params = [], []
+    for col, val in (("controller", controller), ("scenario", scenario),
+                     ("config_hash", config_hash)):
+        if val is not None:
+            where.append(f"{col} = ?")
+            params.append(val)
+    if run_ids is not None:
+        run_ids = list(run_ids)
+        if not run_ids:
+            return []
+        where.append(f"run_id IN ({','.join('?' * len(run_ids))})")
+        params.extend(run_ids)
+
+    sql = "SELECT * FROM runs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id"
+
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    runs = []
+    for row in rows:
+        rec = dict(row)
+        summary = json.loads(rec.pop("summary_json"))
+        rec["config"] = json.loads(rec.pop("config_json"))
+        rec.update(summary)
+        runs.append(rec)
+    return runs
+
+
+# -------------------------
+# 多 episode 的 run id
+# -------------------------
+
+def episode_run_id(run_id, episode, n_episodes):
+    """多 episode 的 run（PPO 的 TRACI_PPO_EPISODES > 1）每個 episode 存成 <run_id>-ep<n>，單 episode 不加。"""
+    return run_id if n_episodes == 1 else f"{run_id}-ep{episode}"
+
+
+def _episode_of(run_id, stored):
+    """stored 是 run_id 本身（0）或 run_id 的第 n 個 episode（n）；其他回傳 None。"""
+    if stored == run_id:
+        return 0
+    m = re.fullmatch(re.escape(run_id) + r"-ep(\d+)", stored)
+    return int(m.group(1)) if m else None
+
+
+def load_final_runs(run_ids, controller=None, db_path=DEFAULT_DB):
+    """
+    啟動時給的 run_id → 該 run 最後一個 episode 的紀錄，依 run_ids 順序回傳 list of dict
+    （沒有紀錄的 run_id 略過）；呼叫端不需要知道 run 跑了幾個 episode。
+    """
+    run_ids = list(run_ids)
+    if not run_ids or not os.path.exists(db_path):
+        return []
+    final = {}
+    conn = connect(db_path)
+    try:
+        for rid in run_ids:
+            like = rid.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "-ep%"
+            rows = conn.execute("SELECT run_id FROM runs WHERE run_id = ? OR run_id LIKE ? ESCAPE '\\'",
+                                (rid, like)).fetchall()
+            eps = [(ep, stored) for (stored,) in rows
+                   for ep in (_episode_of(rid, stored),) if ep is not None]
+            if eps:
+                final[rid] = max(eps)[1]
+    finally:
+        conn.close()
+    by_id = {r["run_id"]: r for r in load_runs(controller=controller, run_ids=final.values(),
+                                                 db_path=db_path)}
+    return [by_id[final[rid]] for rid in run_ids if final.get(rid) in by_id]
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+PPO rollout 封存：分塊（chunk）memmap + index.json，供 offline RL / 離線分析 / 重播更新
+
+- 每個欄位（states / actions / rewards / logprobs / values / episode）各自一組
+  .npy chunk，以 np.lib.format.open_memmap 預先配置 CHUNK_ROWS 列，寫滿才開下一塊
+- index.json 記錄欄位 dtype / 形狀、每個 chunk 的有效列數與總列數；以 os.replace 原子更新。
+  每附加 flush_every 列或距上次 flush 超過 flush_seconds 秒、chunk 寫滿、close() 與收到 SIGTERM 時
+  都會 flush，寫入中斷時最多少掉最後一次 flush 之後的資料
+  （TRACI_ROLLOUT_FLUSH_EVERY / TRACI_ROLLOUT_FLUSH_SECONDS）
+- 單一寫入者：mode="a" 開啟時建立 writer.lock（內容為 pid，close() 時刪除），
+  已有其他存活的 process 在寫同一個資料夾就拋 FileExistsError；留下的 lock 若 pid 已不存在
+  （例如被 kill -9）會自動接手。讀取（mode="r"）不受限制，看到的是最後一次 flush 的內容
+- 讀取一律 mmap（mode="r"），chunks() 回傳的是 memmap 的 view（zero-copy），
+  數億筆 transition 也不需要載入 RAM；跨 chunk 的 read(start, stop) 才會複製
+
+啟用：TRACI_ROLLOUT_ARCHIVE=<資料夾> python traci_ppo_signal_control.py
+      （每次 ppo_update 前把 buffer 整批 append）
+
+用法：
+    python rollout_archive.py info runs/rollouts
+    python rollout_archive.py replay runs/rollouts --policy-lr 3e-4 --epochs 8 --out runs/ppo_replay.npz
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+CHUNK_ROWS = 1 << 20        # 每個 chunk 的列數（states 約 100 MB）
+
+# 欄位 → (dtype, 每列形狀)
+FIELDS = {
+    "states": ("float32", (25,)),
+    "actions": ("int8", ()),
+    "rewards": ("float32", ()),
+    "logprobs": ("float32", ()),
+    "values": ("float32", ()),
+    "episode": ("int32", ()),
+}
+
+ROLLOUT_ARCHIVE = os.environ.get("TRACI_ROLLOUT_ARCHIVE", "")
+FLUSH_EVERY = int(os.environ.get("TRACI_ROLLOUT_FLUSH_EVERY", "8192"))         # 列
+FLUSH_SECONDS = float(os.environ.get("TRACI_ROLLOUT_FLUSH_SECONDS", "30"))     # 秒
+LOCK_NAME = "writer.lock"
+
+
+def _pid_alive(pid):
+    """pid 是否還存在（只在 POSIX 判斷；Windows 的 os.kill 會直接結束 process，一律當作存在）。"""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RolloutArchive:
+    """
+    mode="a"：開啟（或建立）並附加（單一寫入者，持有 writer.lock 直到 close()）；mode="r"：唯讀。
+    欄位定義存在 index.json，重新開啟時以檔案為準。
+    """
+
+    def __init__(self, path, mode="r", chunk_rows=CHUNK_ROWS, fields=FIELDS,
+                 flush_every=FLUSH_EVERY, flush_seconds=FLUSH_SECONDS):
+        if mode not in ("r", "a"):
+            raise ValueError("mode must be 'r' or 'a'")
+        self.path = path
+        self.mode = mode
+        self.index_path = os.path.join(path, "index.json")
+        self.lock_path = os.path.join(path, LOCK_NAME)
+        self._locked = False
+        if mode == "a":
+            os.makedirs(path, exist_ok=True)
+            self._acquire_lock()
+        try:
+            self.index = self._load_index(mode, chunk_rows, fields)
+        except BaseException:
+            self._release_lock()
+            raise
+        self.fields = {k: (np.dtype(dt), tuple(shape)) for k, (dt, shape) in self.index["fields"].items()}
+        self.chunk_rows = self.index["chunk_rows"]
+        self._maps = {}          # (chunk, field) → memmap
+        self._dirty = False
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._unflushed = 0      # 上次 flush 之後附加的列數
+        self._flushed_at = time.monotonic()
+        self._flushing = False
+        self._prev_sigterm = None
+        if mode == "a":
+            self._install_sigterm()
+
+    def _load_index(self, mode, chunk_rows, fields):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        if mode == "a":
+            return {"chunk_rows": chunk_rows, "rows": 0, "chunks": [],
+                    "fields": {k: [dt, list(shape)] for k, (dt, shape) in fields.items()}}
+        raise FileNotFoundError(f"no index.json in {self.path}")
+
+    def __len__(self):
+        return self.index["rows"]
+
+    # -------------------------
+    # 單一寫入者 lock / SIGTERM
+    # -------------------------
+
+    def _acquire_lock(self):
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(self.lock_path, "r", encoding="utf-8") as f:
+                        pid = int(f.read().strip() or 0)
+                except (OSError, ValueError):
+                    pid = 0
+                if pid and (pid == os.getpid() or _pid_alive(pid)):
+                    raise FileExistsError(
+                        f"{self.path} is being written by pid {pid} (single writer only; "
+                        f"remove {self.lock_path} if that process is gone)") from None
+                try:
+                    os.remove(self.lock_path)      # 上一個寫入者沒有正常結束
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str(os.getpid()))
+            self._locked = True
+            return
+        raise FileExistsError(f"could not acquire {self.lock_path}")
+
+    def _release_lock(self):
+        if self._locked:
+            self._locked = False
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+
+    def _install_sigterm(self):
+        """SIGTERM 時先 flush、釋放 lock，再交給原本的 handler（預設為結束 process）。"""
+        if threading.current_thread() is not threading.main_thread():
+            return                                 # signal 只能在 main thread 設定
+        self._prev_sigterm = signal.getsignal(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _restore_sigterm(self):
+        if self._prev_sigterm is not None and signal.getsignal(signal.SIGTERM) == self._on_sigterm:
+            signal.signal(signal.SIGTERM, self._prev_sigterm)
+        self._prev_sigterm = None
+
+    def _on_sigterm(self, signum, frame):
+        prev = self._prev_sigterm
+        if not self._flushing:                     # 正在 flush 時磁碟上仍是上一版完整的 index
+            self.close()
+        else:
+            self._release_lock()
+            self._restore_sigterm()
+        if callable(prev):
+            prev(signum, frame)
+        elif prev != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    def _file(self, chunk, field):
+        return os.path.join(self.path, f"{field}-{chunk:06d}.npy")
+
+    def _map(self, chunk, field):
+        key = (chunk, field)
+        m = self._maps.get(key)
+        if m is None:
+            path = self._file(chunk, field)
+            if self.mode == "a" and not os.path.exists(path):
+                dt, shape = self.fields[field]
+                m = np.lib.format.open_memmap(path, mode="w+", dtype=dt,
+                                              shape=(self.chunk_rows,) + shape)
+            else:
+                m = np.load(path, mmap_mode="r+" if self.mode == "a" else "r")
+            self._maps[key] = m
+        return m
+
+    # -------------------------
+    # 寫入
+    # -------------------------
+
+    def append(self, **columns):
+        """各欄位等長的一批資料（缺少的欄位補 0）；回傳寫入後的總列數。"""
+        if self.mode != "a":
+            raise PermissionError("archive opened read-only")
+        unknown = set(columns) - set(self.fields)
+        if unknown:
+            raise KeyError(f"unknown fields: {sorted(unknown)}")
+        n = len(next(iter(columns.values())))
+        pos = 0
+        while pos < n:
+            if not self.index["chunks"] or self.index["chunks"][-1] == self.chunk_rows:
+                self.index["chunks"].append(0)
+            chunk = len(self.index["chunks"]) - 1
+            filled = self.index["chunks"][-1]
+            take = min(n - pos, self.chunk_rows - filled)
+            for field in self.fields:
+                m = self._map(chunk, field)
+                if field in columns:
+                    m[filled:filled + take] = np.asarray(columns[field])[pos:pos + take]
+                else:
+                    m[filled:filled + take] = 0
+            self.index["chunks"][-1] = filled + take
+            self.index["rows"] += take
+            pos += take
+            if self.index["chunks"][-1] == self.chunk_rows:
+                self.flush()
+                for field in self.fields:          # 寫滿的 chunk 不再保留 memmap
+                    self._maps.pop((chunk, field), None)
+        self._dirty = self._dirty or n > 0
+        self._unflushed += n
+        if self._dirty and (self._unflushed >= self.flush_every
+                            or time.monotonic() - self._flushed_at >= self.flush_seconds):
+            self.flush()
+        return self.index["rows"]
+
+    def flush(self):
+        self._flushing = True
+        try:
+            for m in self._maps.values():
+                if m.mode != "r":
+                    m.flush()
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, indent=1)
+            os.replace(tmp, self.index_path)
+        finally:
+            self._flushing = False
+        self._dirty = False
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        if self.mode == "a" and self._dirty:
+            self.flush()
+        self._maps.clear()
+        if self.mode == "a":
+            self._release_lock()
+            self._restore_sigterm()
+
+    # -------------------------
+    # 讀取
+    # -------------------------
+
+    def chunks(self, fields=None):
+        """依序產生 (起始列, {field: memmap view})，view 只含有效列，不複製。"""
+        fields = fields or list(self.fields)
+        start = 0
+        for chunk, rows in enumerate(self.index["chunks"]):
+            if rows:
+                yield start, {f: self._map(chunk, f)[:rows] for f in fields}
+            start += rows
+
+    def read(self, field, start=0, stop=None):
+        """[start, stop) 的單一欄位；在同一個 chunk 內回傳 view，跨 chunk 時複製合併。"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        parts = []
+        offset = 0
+        for chunk, rows in enumerate(self.index["chunks"]):
+            lo, hi = max(start - offset, 0), min(stop - offset, rows)
+            if lo < hi:
+                parts.append(self._map(chunk, field)[lo:hi])
+            offset += rows
+            if offset >= stop:
+                break
+        if len(parts) == 1:
+            return parts[0]
+        dt, shape = self.fields[field]
+        return np.concatenate(parts) if parts else np.empty((0,) + shape, dtype=dt)
+
+
+def open_archive():
+    """TRACI_ROLLOUT_ARCHIVE 有設定時以附加模式開啟，否則 None（預設不封存）。"""
+    return RolloutArchive(ROLLOUT_ARCHIVE, mode="a") if ROLLOUT_ARCHIVE else None
+
+
+def last_episode(archive):
+    """封存中最後一筆的 episode id（空的封存為 0）；新的執行從其後接續編號。"""
+    return int(archive.read("episode", len(archive) - 1)[0]) if len(archive) else 0
+
+
+# -------------------------
+# 重播：以不同超參數重新跑 ppo_update
+# -------------------------
+
+def replay(archive, ppo, update_interval=None, verbose=True):
+    """
+    依封存順序填入 PPO buffer 並呼叫 ppo_update（不需重新模擬）。
+    與線上訓練相同：滿 update_interval 筆或 episode 結束時更新一次（GAE 不跨 episode）。
+    ppo 為 traci_ppo_signal_control 模組（超參數已設定好、權重已初始化）。
+    """
+    update_interval = update_interval or ppo.PPO_UPDATE_INTERVAL
+    updates = 0
+    current = None
+    for start, cols in archive.chunks():
+        episode = cols["episode"]
+        n = len(episode)
+        bounds = [0, *(np.flatnonzero(np.diff(episode)) + 1), n]
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if current is not None and episode[lo] != current and ppo.states_buffer:
+                ppo.ppo_update()
+                updates += 1
+            current = episode[lo]
+            while lo < hi:
+                take = min(hi - lo, update_interval - len(ppo.states_buffer))
+                ppo.states_buffer.extend(cols["states"][lo:lo + take])
+                ppo.actions_buffer.extend(cols["actions"][lo:lo + take].astype(np.int64))
+                ppo.rewards_buffer.extend(cols["rewards"][lo:lo + take])
+                ppo.old_logprobs_buffer.extend(cols["logprobs"][lo:lo + take])
+                ppo.values_buffer.extend(cols["values"][lo:lo + take])
+                lo += take
+                if len(ppo.states_buffer) >= update_interval:
+                    ppo.ppo_update()
+                    updates += 1
+        if verbose:
+            print(f"[replay] {start + n}/{len(archive)} transitions, {updates} updates")
+    if ppo.states_buffer:
+        ppo.ppo_update()
+        updates += 1
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked memmap archive of PPO rollouts")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    p = sub.add_parser("replay")
+    p.add_argument("path")
+    p.add_argument("--gamma", type=float, default=None)
+    p.add_argument("--lambda", dest="lam", type=float, default=None)
+    p.add_argument("--policy-lr", type=float, default=None)
+    p.add_argument("--value-lr", type=float, default=None)
+    p.add_argument("--epochs", type=int, default=None)
+    p.add_argument("--update-interval", type=int, default=None)
+    p.add_argument("--init", default=None, help="起始權重 npz（預設隨機）")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=os.path.join("runs", "ppo_replay.npz"))
+    args = parser.parse_args()
+
+    archive = RolloutArchive(args.path, mode="r")
+    if args.cmd == "info":
+        # chunk 預先配置但未寫入的部分是 sparse，以實際配置的 block 計算
+        size = sum(os.stat(os.path.join(args.path, f)).st_blocks * 512 for f in os.listdir(args.path))
+        print(f"{len(archive)} transitions in {len(archive.index['chunks'])} chunks "
+              f"(chunk {archive.chunk_rows} rows, {size / 2**20:.1f} MB on disk)")
+        if len(archive):
+            print(f"last episode id: {last_episode(archive)}")
+            total = 0.0
+            for _, cols in archive.chunks(["rewards"]):
+                total += float(cols["rewards"].sum(dtype=np.float64))
+            print(f"mean reward: {total / len(archive):.3f}")
+        return
+
+    import traci_ppo_signal_control as ppo
+
+    for attr, value in (("GAMMA", args.gamma), ("LAMBDA", args.lam), ("POLICY_LR", args.policy_lr),
+                        ("VALUE_LR", args.value_lr), ("PPO_EPOCHS", args.epochs)):
+        if value is not None:
+            setattr(ppo, attr, value)
+    np.random.seed(args.seed)
+    ppo.init_networks(args.init)
+    t0 = time.perf_counter()
+    updates = replay(archive, ppo, args.update_interval)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    ppo.save_networks(args.out)
+    print(f"{updates} updates over {len(archive)} transitions in {time.perf_counter() - t0:.1f} s "
+          f"→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
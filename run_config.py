@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+各控制器共用的執行設定（由環境變數覆寫，方便 benchmark / 批次執行）
+
+- TRACI_SEED        : SUMO 亂數種子（--seed），預設 42
+- TRACI_RUN_ID      : 這次執行的 id（寫入 results store），預設自動產生
+- TRACI_SCENARIO    : 情境名稱，預設 S1（Traci.rou.xml 四向均衡）
+- TRACI_RECORD      : 設為 0 則不寫入 results store
+- TRACI_SUMO_BINARY : SUMO 執行檔，預設 sumo-gui；批次執行用 sumo（headless）
+- TRACI_OUTPUT_PREFIX : SUMO --output-prefix（例如 runs/<run_id>/），
+                        平行執行時避免 e2 輸出檔互相覆蓋
+- TRACI_ROUTE_FILE  : 取代 Traci.sumocfg 的 route 檔（scenario_gen.py 產生），
+                      未設定 TRACI_SCENARIO 時情境名稱取檔名（例如 g1f2984fb2e0a）
+- TRACI_SIM_TIME    : 模擬總時間（秒），預設 1800；全天 = 86400
+- TRACI_PROGRESS_EVERY : 狀態列印間隔（模擬秒）；預設 1 h 以內 10 s（每 100 step），
+                         更長的模擬 600 s，避免全天執行時 console 輸出過多
+- TRACI_PROFILE     : 設為 1 則 load_traci() 回傳計時包裝的 traci（見 profiling.py）
+"""
+
+import os
+import sys
+import uuid
+
+SEED = int(os.environ.get("TRACI_SEED", "42"))
+RUN_ID = os.environ.get("TRACI_RUN_ID") or uuid.uuid4().hex[:12]
+ROUTE_FILE = os.environ.get("TRACI_ROUTE_FILE", "")
+SCENARIO = os.environ.get("TRACI_SCENARIO") or (
+    os.path.basename(ROUTE_FILE).split(".")[0] if ROUTE_FILE else "S1")
+RECORD_RESULTS = os.environ.get("TRACI_RECORD", "1") != "0"
+SUMO_BINARY = os.environ.get("TRACI_SUMO_BINARY", "sumo-gui")
+OUTPUT_PREFIX = os.environ.get("TRACI_OUTPUT_PREFIX", "")
+SIM_TIME = float(os.environ.get("TRACI_SIM_TIME", "1800"))
+PROGRESS_EVERY = float(os.environ.get("TRACI_PROGRESS_EVERY") or (10.0 if SIM_TIME <= 3600 else 600.0))
+
+# 附加在各控制器 SUMO 啟動參數後面
+SUMO_EXTRA_ARGS = ["--seed", str(SEED)]
+if OUTPUT_PREFIX:
+    SUMO_EXTRA_ARGS += ["--output-prefix", OUTPUT_PREFIX]
+if ROUTE_FILE:
+    SUMO_EXTRA_ARGS += ["--route-files", os.path.abspath(ROUTE_FILE)]
+
+
+def load_traci():
+    """
+    延遲載入 traci：把 $SUMO_HOME/tools 加入 sys.path 後 import。
+    各控制器在 main() 才呼叫，import 控制器模組本身不需要 SUMO。
+    """
+    if "SUMO_HOME" not in os.environ:
+        sys.exit("Please declare environment variable 'SUMO_HOME'")
+    tools = os.path.join(os.environ["SUMO_HOME"], "tools")
+    if tools not in sys.path:
+        sys.path.append(tools)
+    import traci
+    from profiling import PROFILE, instrument
+    return instrument(traci) if PROFILE else traci
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+合成情境產生器：參數化需求 → SUMO route 檔（依參數 hash 快取）
+
+Traci.rou.xml 只有情境 S1（四向各 1200 veh/h、左/直/右 15/75/10、0~3600 s 固定）。
+這裡把需求拆成參數：
+- volumes  : 各 approach 基準流量 veh/h，例如 {"EB": 1200, "WB": 900, ...}
+- turns    : 各 approach 的 (左, 直, 右) 比例（或 "*" 套用全部）
+- profile  : 時段曲線（PROFILES 的名稱，或 [(hour, 倍率), ...]），配合 start_hour
+- peaks    : 額外的單向尖峰 [{"approach": "EB", "center": 秒, "width": 秒, "factor": 倍}]
+- duration / bin : 總秒數、每段 flow 的長度（秒）
+
+每段 bin 依倍率寫成一組 <flow>（起訖 edge 由 network_index 推導）。
+檔名 = 參數（含 GENERATOR_VERSION）的 sha1，已存在就直接沿用，
+同一組參數在所有控制器 / seed 之間只產生一次。
+
+用法：
+    python scenario_gen.py one --volume 1500 --left 0.2 --profile am_peak
+    python scenario_gen.py sweep --volume 600 900 1200 1500 --left 0.1 0.2 --profile flat am_peak
+    TRACI_ROUTE_FILE=scenarios/<id>.rou.xml python -m traci_run max_pressure
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+
+from network_index import MOVEMENTS, load_index
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIO_DIR = os.path.join(SCRIPT_DIR, "scenarios")
+
+# 產生邏輯有變動時加 1（舊的快取檔就不會被誤用）
+GENERATOR_VERSION = 1
+
+APPROACHES = ("EB", "WB", "SB", "NB")
+TURNS = ("left", "straight", "right")
+
+# 時段倍率曲線：(小時, 倍率)，中間線性內插、跨午夜循環
+PROFILES = {
+    "flat": [(0, 1.0)],
+    "am_peak": [(0, 0.2), (5, 0.3), (7, 0.9), (8, 1.0), (9, 0.8), (11, 0.6),
+                (16, 0.6), (20, 0.4), (23, 0.2)],
+    "pm_peak": [(0, 0.2), (5, 0.3), (9, 0.6), (15, 0.7), (17, 1.0), (18, 0.9),
+                (20, 0.5), (23, 0.2)],
+    "am_pm": [(0, 0.15), (5, 0.25), (7, 0.9), (8, 1.0), (9, 0.75), (12, 0.6),
+              (15, 0.7), (17, 1.0), (18, 0.9), (20, 0.5), (23, 0.2)],
+}
+
+# S1（Traci.rou.xml）
+S1 = {
+    "volumes": {a: 1200 for a in APPROACHES},
+    "turns": {"*": (0.15, 0.75, 0.10)},
+    "profile": "flat",
+    "start_hour": 0.0,
+    "peaks": [],
+    "duration": 3600.0,
+    "bin": 3600.0,
+}
+
+
+def normalize(params):
+    """補上預設值並整理成固定格式（hash 與產生都用這個版本）。"""
+    p = dict(S1)
+    p.update(params or {})
+    turns = dict(p["turns"])
+    default = turns.pop("*", S1["turns"]["*"])
+    p["turns"] = {a: tuple(float(x) for x in turns.get(a, default)) for a in APPROACHES}
+    for a, split in p["turns"].items():
+        if len(split) != 3 or min(split) < 0 or abs(sum(split) - 1.0) > 1e-6:
+            raise ValueError(f"turning ratios for {a} must be 3 non-negative numbers summing to 1: {split}")
+    p["volumes"] = {a: float(p["volumes"].get(a, 0.0)) for a in APPROACHES}
+    if isinstance(p["profile"], str) and p["profile"] not in PROFILES:
+        raise ValueError(f"unknown profile '{p['profile']}' (choices: {sorted(PROFILES)})")
+    p["peaks"] = [dict(pk) for pk in p["peaks"]]
+    p["duration"] = float(p["duration"])
+    p["bin"] = float(min(p["bin"], p["duration"]))
+    p["start_hour"] = float(p["start_hour"])
+    return p
+
+
+def scenario_id(params):
+    blob = json.dumps({"v": GENERATOR_VERSION, "params": normalize(params)},
+                      sort_keys=True, default=list)
+    return "g" + hashlib.sha1(blob.encode("utf-8")).hexdigest()[:12]
+
+
+def profile_factor(profile, hour):
+    """時段倍率（hour 可超過 24，會循環）。"""
+    points = PROFILES[profile] if isinstance(profile, str) else [tuple(x) for x in profile]
+    if len(points) == 1:
+        return float(points[0][1])
+    hour = hour % 24.0
+    pts = sorted(points) + [(points[0][0] + 24.0, points[0][1])]
+    if hour < pts[0][0]:
+        hour += 24.0
+    for (h0, f0), (h1, f1) in zip(pts, pts[1:]):
+        if h0 <= hour <= h1:
+            return f0 + (f1 - f0) * (hour - h0) / (h1 - h0) if h1 > h0 else f0
+    return float(pts[-1][1])
+
+
+def peak_factor(peaks, approach, t):
+    factor = 1.0
+    for pk in peaks:
+        if pk.get("approach", "*") not in ("*", approach):
+            continue
+        z = (t - float(pk["center"])) / float(pk["width"])
+        factor *= 1.0 + (float(pk["factor"]) - 1.0) * math.exp(-0.5 * z * z)
+    return factor
+
+
+def turn_targets(index=None):
+    """{approach: {turn: (from_edge, to_edge)}}，由路網索引推導。"""
+    index = index or load_index()
+    targets = {}
+    for a in index.approaches:
+        edge = index.approach_edge[a]
+        by_turn = {}
+        for i in index.approach_links[a]:
+            turn = MOVEMENTS[int(index.link_movement[i])]
+            by_turn.setdefault(turn, (edge, index.link_to_edge[i]))
+        targets[a] = by_turn
+    return targets
+
+
+def build_flows(params, targets=None):
+    """回傳 [(flow id, from, to, begin, end, vehsPerHour), ...]。"""
+    p = normalize(params)
+    targets = targets or turn_targets()
+    flows = []
+    n_bins = max(1, int(math.ceil(p["duration"] / p["bin"] - 1e-9)))
+    for k in range(n_bins):
+        begin = k * p["bin"]
+        end = min(p["duration"], begin + p["bin"])
+        mid = 0.5 * (begin + end)
+        tod = profile_factor(p["profile"], p["start_hour"] + mid / 3600.0)
+        for a in APPROACHES:
+            if a not in targets:
+                continue
+            vph = p["volumes"][a] * tod * peak_factor(p["peaks"], a, mid)
+            for turn, share in zip(TURNS, p["turns"][a]):
+                if share <= 0 or turn not in targets[a] or vph * share <= 0:
+                    continue
+                src, dst = targets[a][turn]
+                flows.append((f"f_{a}_{turn}_{k}", src, dst, begin, end, vph * share))
+    return flows
+
+
+def write_routes(path, params, flows):
+    p = normalize(params)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n\n')
+        f.write("<!-- generated by scenario_gen.py\n")
+        f.write(json.dumps(p, sort_keys=True, default=list, ensure_ascii=False, indent=2))
+        f.write("\n-->\n\n")
+        f.write('<routes xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
+                '        xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/routes_file.xsd">\n')
+        for fid, src, dst, begin, end, vph in flows:
+            f.write(f'    <flow id="{fid}" begin="{begin:.2f}" end="{end:.2f}" '
+                    f'from="{src}" to="{dst}" vehsPerHour="{vph:.2f}"/>\n')
+        f.write("</routes>\n")
+    os.replace(tmp, path)
+
+
+def generate(params, out_dir=SCENARIO_DIR, force=False):
+    """產生（或沿用快取的）route 檔，回傳 (scenario id, 路徑)。"""
+    sid = scenario_id(params)
+    path = os.path.join(out_dir, f"{sid}.rou.xml")
+    if force or not os.path.exists(path):
+        os.makedirs(out_dir, exist_ok=True)
+        write_routes(path, params, build_flows(params))
+        meta_tmp = os.path.join(out_dir, f"{sid}.json.{os.getpid()}.tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(normalize(params), f, sort_keys=True, default=list, indent=2)
+        os.replace(meta_tmp, os.path.join(out_dir, f"{sid}.json"))
+    return sid, path
+
+
+def sweep(grid, base=None, out_dir=SCENARIO_DIR):
+    """
+    grid: {參數名: [值, ...]} 的笛卡兒積（參數名見 params_from_args）。
+    回傳 [(scenario id, 路徑, params), ...]。
+    """
+    keys = list(grid)
+    out = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = params_from_args(dict(zip(keys, values)), base)
+        sid, path = generate(params, out_dir)
+        out.append((sid, path, params))
+    return out
+
+
+def params_from_args(values, base=None):
+    """
+    扁平參數 → params：
+    volume（四向同值）、volume_EB / ...、left / right（其餘為直行）、
+    profile、start_hour、duration、bin、peak_approach / peak_center / peak_width / peak_factor。
+    """
+    p = json.loads(json.dumps(base or S1, default=list))
+    vols = dict(p["volumes"])
+    if values.get("volume") is not None:
+        vols = {a: values["volume"] for a in APPROACHES}
+    for a in APPROACHES:
+        if values.get(f"volume_{a}") is not None:
+            vols[a] = values[f"volume_{a}"]
+    p["volumes"] = vols
+    if values.get("left") is not None or values.get("right") is not None:
+        left = values.get("left", S1["turns"]["*"][0]) or 0.0
+        right = values.get("right", S1["turns"]["*"][2]) or 0.0
+        p["turns"] = {"*": (left, 1.0 - left - right, right)}
+    for key in ("profile", "start_hour", "duration", "bin"):
+        if values.get(key) is not None:
+            p[key] = values[key]
+    if values.get("peak_factor") not in (None, 1.0):
+        p["peaks"] = [{
+            "approach": values.get("peak_approach") or "*",
+            "center": values.get("peak_center", p["duration"] / 2.0),
+            "width": values.get("peak_width", 600.0),
+            "factor": values["peak_factor"],
+        }]
+    return p
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate parameterized route files")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def add_params(p, many):
+        nargs = "+" if many else None
+        p.add_argument("--volume", type=float, nargs=nargs, help="四向基準流量 veh/h")
+        for a in APPROACHES:
+            p.add_argument(f"--volume-{a}", dest=f"volume_{a}", type=float, nargs=nargs)
+        p.add_argument("--left", type=float, nargs=nargs, help="左轉比例")
+        p.add_argument("--right", type=float, nargs=nargs, help="右轉比例")
+        p.add_argument("--profile", nargs=nargs, help=f"時段曲線 {sorted(PROFILES)}")
+        p.add_argument("--start-hour", dest="start_hour", type=float, nargs=nargs)
+        p.add_argument("--duration", type=float, nargs=nargs, help="秒")
+        p.add_argument("--bin", type=float, nargs=nargs, help="每段 flow 秒數")
+        p.add_argument("--peak-approach", dest="peak_approach", nargs=nargs)
+        p.add_argument("--peak-center", dest="peak_center", type=float, nargs=nargs)
+        p.add_argument("--peak-width", dest="peak_width", type=float, nargs=nargs)
+        p.add_argument("--peak-factor", dest="peak_factor", type=float, nargs=nargs)
+        p.add_argument("--out", default=SCENARIO_DIR)
+
+    add_params(sub.add_parser("one", help="產生單一情境"), many=False)
+    add_params(sub.add_parser("sweep", help="參數笛卡兒積"), many=True)
+    args = parser.parse_args()
+
+    keys = ["volume", *(f"volume_{a}" for a in APPROACHES), "left", "right", "profile",
+            "start_hour", "duration", "bin", "peak_approach", "peak_center",
+            "peak_width", "peak_factor"]
+    given = {k: getattr(args, k) for k in keys if getattr(args, k) is not None}
+
+    if args.cmd == "one":
+        sid, path = generate(params_from_args(given), args.out)
+        print(f"{sid}  {path}")
+        return
+
+    results = sweep(given, out_dir=args.out)
+    for sid, path, _ in results:
+        print(f"{sid}  {path}")
+    print(f"\n{len(results)} scenarios ({len({r[0] for r in results})} unique) in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy 代理路口模型（point queue），用來在 SUMO 之前先預訓練 PPO
+
+- 4 個 approach × 3 車道，每條車道一個點狀佇列 n（車輛數）
+- 到達率 λ、飽和流率 μ、偵測器容量、通過偵測區段的自由流時間由 e2 輸出校正
+  （calibrate_from_e2），沒有 e2 輸出時由 route 檔需求推估（calibrate_from_routes）
+- 相位 / 決策與 traci_ppo_signal_control.py 相同：PHASE_CYCLE、group 邊界做
+  keep / switch 決策、25 維 state（EB, SB, WB, NB 各 3 車道的 queue + halting + phase index）
+- 一個 phase 內到達量為 Poisson，佇列線性變化 n(t) = max(0, n0 + (λ' − μ·g)·t)，
+  queue / halting 的時間積分用封閉解，不需逐 0.1 s 模擬
+    halting(t) = clip(n(t) − 行進中車輛, 0, 容量)；行進中 = 綠燈 μ·T、紅燈 λ·T
+- reward = 該 group 期間平均每步的 −halting（與 SUMO 每步 reward 同尺度）
+- BatchSurrogate：M 個路口的狀態都放在 (M, N_lane) 陣列，一次推進各自目前的 phase，
+  綠燈由編譯好的 phase 遮罩套用；fixed / Webster / Max-Pressure / PPO 都以
+  policy(S, group) 評估，screen 在上千個需求樣本上排名，只把前幾名送 SUMO 驗證
+
+用法：
+    python surrogate.py calibrate                         # 由 Traci.rou.xml 推估
+    python surrogate.py calibrate --e2 runs/r001          # 由 e2 輸出校正
+    python surrogate.py pretrain --episodes 2000 --out runs/ppo_pretrained.npz
+    python surrogate.py screen --samples 2000 --ppo runs/ppo_pretrained.npz
+    TRACI_PPO_WEIGHTS=runs/ppo_pretrained.npz python traci_ppo_signal_control.py
+"""
+
+import argparse
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import webster
+import webster_solver
+from detector_outputs import ADD_PATH, load_e2_run, read_detectors
+from network_index import load_index
+from phase_plan import DEFAULT_PLAN
+from run_config import SIM_TIME
+
+STATE_APPROACHES = ("EB", "SB", "WB", "NB")   # get_state 的 approach 順序
+VEH_SPACING = 7.5          # m/veh，偵測器容量
+FREE_SPEED = 13.89         # m/s，e2 沒有速度資料時使用
+BIN_SECONDS = 300.0        # 到達率時間解析度（與 e2 period 相同）
+SAT_QUANTILE = 0.9         # 以飽和 interval 的 nVehLeft / 綠燈時間之分位數估 μ
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+@dataclass(frozen=True, eq=False)
+class Calibration:
+    """代理模型參數（與 NetworkIndex.lanes 對齊，唯讀）。"""
+
+    lanes: tuple
+    bin_seconds: float
+    arrivals: np.ndarray      # (K, N_lane) veh/s，第 k 個時段的到達率（超出範圍沿用最後一段）
+    sat_flow: np.ndarray      # (N_lane,) veh/s
+    capacity: np.ndarray      # (N_lane,) veh
+    travel_time: np.ndarray   # (N_lane,) s
+    source: str
+
+    def arrival_rate(self, t):
+        k = min(int(t // self.bin_seconds), len(self.arrivals) - 1)
+        return self.arrivals[k]
+
+
+# -------------------------
+# 校正
+# -------------------------
+
+def _detector_geometry(index, add_path=ADD_PATH):
+    """(N_lane,) 主要偵測器長度 (m)；缺少時 0。"""
+    length = {d["id"]: float(d.get("length", 0.0)) for d in read_detectors(add_path)}
+    return np.array([length.get(det, 0.0) if det else 0.0 for det in index.detector_ids])
+
+
+def lane_green_share(plan, index):
+    """(N_lane,) 每條車道的代表 movement 在週期中綠燈的比例。"""
+    green = plan.link_green[:, webster.lane_primary_links(index)]     # (P, N_lane)
+    return (plan.durations[:, None] * green).sum(axis=0) / plan.cycle_steps
+
+
+def calibrate_from_routes(route_path=webster_solver.ROUTE_FILE, index=None,
+                          bin_seconds=BIN_SECONDS, horizon=SIM_TIME,
+                          sat_flow=webster.SAT_FLOW):
+    """route 檔需求 → 各時段車道到達率；μ 用 Webster 的飽和流率、T 用偵測器長度 / 速限。"""
+    index = index or load_index()
+    intervals, _ = webster_solver.read_demand(route_path)
+    n_bins = max(1, int(np.ceil(horizon / bin_seconds)))
+    arrivals = np.zeros((n_bins, len(index.lanes)))
+    for k in range(n_bins):
+        rates = webster_solver.od_rates(intervals, k * bin_seconds, (k + 1) * bin_seconds)
+        arrivals[k] = webster_solver.lane_flows(rates, index)[0] / 3600.0
+    length = _detector_geometry(index)
+    return Calibration(
+        lanes=index.lanes,
+        bin_seconds=float(bin_seconds),
+        arrivals=_readonly(arrivals),
+        sat_flow=_readonly(np.full(len(index.lanes), sat_flow / 3600.0)),
+        capacity=_readonly(np.maximum(length / VEH_SPACING, 1.0)),
+        travel_time=_readonly(length / FREE_SPEED),
+        source=os.path.basename(route_path),
+    )
+
+
+def calibrate_from_e2(run_dir, index=None, plan=DEFAULT_PLAN, sat_flow=webster.SAT_FLOW):
+    """
+    e2 輸出（固定時制 run）→ 校正參數：
+    - λ：每個 interval 的 nVehEntered / 長度
+    - μ：有排隊的 interval 中 nVehLeft / (長度 × 該車道綠燈比例) 的 SAT_QUANTILE 分位數
+    - T：偵測器長度 / 最大平均速度
+    """
+    index = index or load_index()
+    table = load_e2_run(run_dir)
+    if len(table) == 0:
+        raise FileNotFoundError(f"no e2 outputs in {run_dir}")
+    length = _detector_geometry(index)
+    share = lane_green_share(plan, index)
+    begins = np.unique(table["begin"])
+    bin_seconds = float(np.median(table["end"] - table["begin"]))
+    N = len(index.lanes)
+    arrivals = np.zeros((len(begins), N))
+    mu = np.full(N, sat_flow / 3600.0)
+    speed = np.full(N, FREE_SPEED)
+    for k, det in enumerate(index.detector_ids):
+        rows = table[table["detector"] == det] if det else table[:0]
+        if len(rows) == 0:
+            continue
+        span = rows["end"] - rows["begin"]
+        arrivals[np.searchsorted(begins, rows["begin"]), k] = rows["nVehEntered"] / span
+        queued = rows["maxJamLengthInVehicles"] > 0
+        if queued.any() and share[k] > 0:
+            mu[k] = np.quantile(rows["nVehLeft"][queued] / (span[queued] * share[k]), SAT_QUANTILE)
+        if (rows["meanSpeed"] > 0).any():
+            speed[k] = rows["meanSpeed"].max()
+    return Calibration(
+        lanes=index.lanes,
+        bin_seconds=bin_seconds,
+        arrivals=_readonly(arrivals),
+        sat_flow=_readonly(np.maximum(mu, 1e-3)),
+        capacity=_readonly(np.maximum(length / VEH_SPACING, 1.0)),
+        travel_time=_readonly(length / np.maximum(speed, 0.1)),
+        source=os.path.normpath(run_dir),
+    )
+
+
+# -------------------------
+# 代理路口
+# -------------------------
+
+def _clip_antiderivative(x, cap):
+    """∫_0^x clip(u, 0, cap) du（逐元素）。"""
+    x = np.maximum(x, 0.0)
+    m = np.minimum(x, cap)
+    return 0.5 * m * m + cap * (x - m)
+
+
+def clip_ramp_integral(a, rate, d, cap):
+    """∫_0^d clip(a + rate·t, 0, cap) dt（逐元素；rate = 0 時直接相乘）。"""
+    flat = np.abs(rate) < 1e-12
+    safe = np.where(flat, 1.0, rate)
+    ramp = (_clip_antiderivative(a + rate * d, cap) - _clip_antiderivative(a, cap)) / safe
+    return np.where(flat, np.clip(a, 0.0, cap) * d, ramp)
+
+
+class SurrogateIntersection:
+    """
+    單一路口的代理環境，介面對應 PPO 的 group 決策：
+    reset() → state；step(action) → (state, reward, done)
+    action 0 = 保持主方向、1 = 切換（與 traci_ppo_signal_control.ACTIONS 相同）。
+    """
+
+    def __init__(self, calib, plan=DEFAULT_PLAN, index=None, step_length=0.1,
+                 sim_time=SIM_TIME, seed=None):
+        index = index or load_index()
+        self.calib = calib
+        self.plan = plan
+        self.step_length = step_length
+        self.sim_time = sim_time
+        self.rng = np.random.default_rng(seed)
+        self.phase_green = plan.link_green[:, webster.lane_primary_links(index)]   # (P, N_lane)
+        self.phase_seconds = plan.durations * step_length
+        self.state_lanes = np.array([index.lanes.index(lane) for a in STATE_APPROACHES
+                                     for lane in index.approach_lanes[a]])
+        self.ns_group = plan.group_index("NS")
+        self.ew_group = plan.group_index("EW")
+        self.reset()
+
+    def reset(self):
+        self.t = 0.0
+        self.n = np.zeros(len(self.calib.lanes))
+        self.group = self.ns_group
+        self.phase = int(self.plan.group_start[self.group])
+        self.halting_integral = 0.0
+        self.queue_integral = 0.0
+        self.departed = 0.0
+        self._run_group()
+        return self.state()
+
+    def observe(self):
+        """(queue, halting)：與 NetworkIndex.lanes 對齊、以偵測器容量截斷。"""
+        cap = self.calib.capacity
+        moving = np.where(self.phase_green[self.phase], self.calib.sat_flow,
+                          self.calib.arrival_rate(self.t)) * self.calib.travel_time
+        return np.minimum(self.n, cap), np.clip(self.n - moving, 0.0, cap)
+
+    def state(self):
+        """25 維 state，與 traci_ppo_signal_control.get_state 的順序相同。"""
+        q, h = self.observe()
+        return tuple(np.floor(q[self.state_lanes]).astype(int).tolist()
+                     + np.floor(h[self.state_lanes]).astype(int).tolist() + [self.phase])
+
+    def _run_phase(self):
+        d = float(self.phase_seconds[self.phase])
+        lam = self.calib.arrival_rate(self.t)
+        green = self.phase_green[self.phase]
+        mu = self.calib.sat_flow * green
+        arrived = self.rng.poisson(lam * d)
+        rate = arrived / d - mu
+        moving = np.where(green, self.calib.sat_flow, lam) * self.calib.travel_time
+        # queue 與 halting 的積分一起算（同一個 rate，起點差 moving）
+        both = clip_ramp_integral(np.concatenate((self.n, self.n - moving)), np.tile(rate, 2), d,
+                                  np.tile(self.calib.capacity, 2))
+        n_lane = len(self.n)
+        halting = float(both[n_lane:].sum())
+        self.queue_integral += float(both[:n_lane].sum())
+        self.halting_integral += halting
+        n_end = np.maximum(self.n + rate * d, 0.0)
+        self.departed += float((self.n + arrived - n_end).sum())
+        self.n = n_end
+        self.t += d
+        return halting
+
+    def _run_group(self):
+        """跑完目前 group 的所有 phase（停在 group 結尾的 phase），回傳 (halting 積分, 秒數)。"""
+        halting, seconds = 0.0, 0.0
+        while True:
+            seconds += self.phase_seconds[self.phase]
+            halting += self._run_phase()
+            if self.plan.group_end[self.phase]:
+                return halting, seconds
+            self.phase = int(self.plan.group_next[self.phase])
+
+    def step(self, action):
+        if action == 1:
+            self.group = self.ew_group if self.group == self.ns_group else self.ns_group
+        self.phase = int(self.plan.group_start[self.group])
+        halting, seconds = self._run_group()
+        reward = -halting / seconds          # 平均每步 halting
+        return self.state(), reward, self.t >= self.sim_time
+
+    def summary(self):
+        """與 SUMO 控制器相同定義的統計（時間以秒計）。"""
+        steps = self.t / self.step_length
+        total_waiting_time = self.halting_integral
+        return {
+            "avg_queue_total": self.queue_integral / max(self.t, 1e-9),
+            "total_arrived": int(round(self.departed)),
+            "total_waiting_time": total_waiting_time,
+            "avg_delay_time": total_waiting_time / self.departed if self.departed > 0 else 0.0,
+            "sim_steps": int(steps),
+        }
+
+
+# -------------------------
+# 批次代理模型：M 個獨立路口一起推進
+# -------------------------
+
+def sample_demands(calib, M, spread=0.3, index=None, seed=0):
+    """(M, K, N_lane) 到達率：校正值 × 每個樣本的總量倍數 × 各 approach 倍數（lognormal）。"""
+    index = index or load_index()
+    rng = np.random.default_rng(seed)
+    total = rng.lognormal(0.0, spread, size=(M, 1, 1))
+    per_approach = rng.lognormal(0.0, spread, size=(M, 1, len(index.approaches)))
+    return calib.arrivals[None] * total * per_approach[:, :, index.lane_approach]
+
+
+def webster_durations(arrivals, plan=DEFAULT_PLAN, index=None, step_length=0.1,
+                      sat_flow=webster.SAT_FLOW):
+    """(M, P) steps：每個需求樣本以平均到達率求解的 Webster 時制（黃燈不變）。"""
+    index = index or load_index()
+    mask = webster.stage_lane_mask(plan, index)
+    yellows = webster.stage_yellows(plan, step_length)
+    stages = webster.stage_phases(plan)
+    out = np.tile(plan.durations, (len(arrivals), 1))
+    for m, flows in enumerate(arrivals.mean(axis=1) * 3600.0):
+        timing = webster.solve(webster.stage_flow_ratios(flows, mask, sat_flow), yellows)
+        out[m, stages] = np.maximum(1, np.rint(np.array(timing.greens) / step_length))
+    return out
+
+
+class BatchSurrogate:
+    """
+    M 個代理路口（同一路網、各自的需求與時制），狀態都是 (M, N_lane) 陣列。
+    每次推進「各自目前的 phase」；到 group 結尾時以 policy(S, group) 一次決定所有
+    到達決策點的路口（S 為 (m, 25) 的 PPO state，回傳 0 = 保持、1 = 切換）。
+    """
+
+    def __init__(self, calib, arrivals=None, durations=None, plan=DEFAULT_PLAN, index=None,
+                 step_length=0.1, sim_time=SIM_TIME, seed=None):
+        index = index or load_index()
+        self.calib = calib
+        self.plan = plan
+        self.step_length = step_length
+        self.sim_time = sim_time
+        self.rng = np.random.default_rng(seed)
+        self.arrivals = calib.arrivals[None] if arrivals is None else np.asarray(arrivals)
+        self.M = len(self.arrivals)
+        durations = plan.durations if durations is None else durations
+        self.phase_seconds = np.broadcast_to(durations, (self.M, plan.n_phases)) * step_length
+        self.phase_green = plan.link_green[:, webster.lane_primary_links(index)]   # (P, N_lane)
+        self.state_lanes = np.array([index.lanes.index(lane) for a in STATE_APPROACHES
+                                     for lane in index.approach_lanes[a]])
+        self.ns_group = plan.group_index("NS")
+        self.ew_group = plan.group_index("EW")
+        self.reset()
+
+    def reset(self):
+        M, N = self.M, len(self.calib.lanes)
+        self.t = np.zeros(M)
+        self.n = np.zeros((M, N))
+        self.group = np.full(M, self.ns_group, dtype=np.int64)
+        self.phase = self.plan.group_start[self.group].copy()
+        self.halting_integral = np.zeros(M)
+        self.queue_integral = np.zeros(M)
+        self.departed = np.zeros(M)
+
+    def _arrival_rate(self, rows):
+        k = np.minimum((self.t[rows] // self.calib.bin_seconds).astype(np.int64),
+                       self.arrivals.shape[1] - 1)
+        return self.arrivals[rows, k]
+
+    def state(self, rows):
+        """(len(rows), 25) float32，與 get_state 相同順序。"""
+        lam = self._arrival_rate(rows)
+        green = self.phase_green[self.phase[rows]]
+        moving = np.where(green, self.calib.sat_flow, lam) * self.calib.travel_time
+        n = self.n[rows]
+        q = np.minimum(n, self.calib.capacity)[:, self.state_lanes]
+        h = np.clip(n - moving, 0.0, self.calib.capacity)[:, self.state_lanes]
+        return np.hstack((np.floor(q), np.floor(h), self.phase[rows, None])).astype(np.float32)
+
+    def _advance(self, rows):
+        """rows 中每個路口跑完目前的 phase。"""
+        phase = self.phase[rows]
+        d = self.phase_seconds[rows, phase][:, None]
+        lam = self._arrival_rate(rows)
+        green = self.phase_green[phase]
+        arrived = self.rng.poisson(lam * d)
+        rate = arrived / d - self.calib.sat_flow * green
+        moving = np.where(green, self.calib.sat_flow, lam) * self.calib.travel_time
+        n = self.n[rows]
+        cap = self.calib.capacity
+        self.queue_integral[rows] += clip_ramp_integral(n, rate, d, cap).sum(axis=1)
+        self.halting_integral[rows] += clip_ramp_integral(n - moving, rate, d, cap).sum(axis=1)
+        n_end = np.maximum(n + rate * d, 0.0)
+        self.departed[rows] += (n + arrived - n_end).sum(axis=1)
+        self.n[rows] = n_end
+        self.t[rows] += d[:, 0]
+
+    def run(self, policy):
+        """從頭跑完所有路口，回傳 summary()。"""
+        self.reset()
+        active = np.arange(self.M)
+        while active.size:
+            self._advance(active)
+            at_end = self.plan.group_end[self.phase[active]]
+            inner, dec = active[~at_end], active[at_end]
+            self.phase[inner] = self.plan.group_next[self.phase[inner]]
+            if dec.size:
+                switch = np.asarray(policy(self.state(dec), self.group[dec])) == 1
+                g = self.group[dec]
+                self.group[dec] = np.where(switch, self.ns_group + self.ew_group - g, g)
+                self.phase[dec] = self.plan.group_start[self.group[dec]]
+            active = active[self.t[active] < self.sim_time]
+        return self.summary()
+
+    def summary(self):
+        """各路口的統計（(M,) 陣列，定義同 SurrogateIntersection.summary）。"""
+        return {
+            "avg_queue_total": self.queue_integral / np.maximum(self.t, 1e-9),
+            "total_arrived": self.departed,
+            "total_waiting_time": self.halting_integral,
+            "avg_delay_time": np.where(self.departed > 0,
+                                       self.halting_integral / np.maximum(self.departed, 1e-9), 0.0),
+        }
+
+
+# 策略：policy(S, group) → (m,) action（0 = 保持主方向、1 = 切換）
+
+def cycle_policy():
+    """固定 / Webster 時制：每個 group 結尾都切換（即 PHASE_CYCLE 順序）。"""
+    return lambda S, group: np.ones(len(S), dtype=np.int64)
+
+
+def max_pressure_policy(threshold=10.0, plan=DEFAULT_PLAN):
+    """與 traci.maxpreesure.py group 模式相同：NS / EW 排隊差超過 threshold 才換方向。"""
+    ns = plan.group_index("NS")
+    k = len(STATE_APPROACHES)
+    lanes = 3
+
+    def policy(S, group):
+        q = S[:, :k * lanes].reshape(len(S), k, lanes).sum(axis=2)     # EB, SB, WB, NB
+        q_ns, q_ew = q[:, 1] + q[:, 3], q[:, 0] + q[:, 2]
+        diff = np.where(group == ns, q_ew - q_ns, q_ns - q_ew)         # 另一方向多出的排隊
+        return (diff > threshold).astype(np.int64)
+    return policy
+
+
+def ppo_policy(weights_path):
+    """線性 PPO policy（npz: policy_W, policy_b），評估時取 argmax。"""
+    data = np.load(weights_path)
+    W, b = data["policy_W"].astype(np.float32), data["policy_b"].astype(np.float32)
+    return lambda S, group: np.argmax(S @ W + b, axis=1)
+
+
+def screen(calib, samples=1000, spread=0.3, thresholds=(5.0, 10.0, 20.0), ppo_weights=(),
+           plan=DEFAULT_PLAN, index=None, seed=0):
+    """
+    在同一組 samples 個需求樣本上評估各策略，回傳 {名稱: summary}（各為 (M,) 陣列）。
+    各策略使用相同的 Poisson 亂數種子。
+    """
+    index = index or load_index()
+    arrivals = sample_demands(calib, samples, spread, index, seed)
+    candidates = {"fixed": (cycle_policy(), None),
+                  "webster": (cycle_policy(), webster_durations(arrivals, plan, index))}
+    for thr in thresholds:
+        candidates[f"max_pressure(thr={thr:g})"] = (max_pressure_policy(thr, plan), None)
+    for path in ppo_weights:
+        candidates[f"ppo({os.path.basename(path)})"] = (ppo_policy(path), None)
+    results = {}
+    for name, (policy, durations) in candidates.items():
+        env = BatchSurrogate(calib, arrivals, durations, plan, index, seed=seed)
+        results[name] = env.run(policy)
+    return results
+
+
+# -------------------------
+# PPO 預訓練
+# -------------------------
+
+def pretrain(calib, episodes, seed=0, weights_path=None, verbose=True):
+    """
+    在代理模型上訓練 traci_ppo_signal_control 的線性 PPO（共用其 buffer / ppo_update），
+    回傳每個 episode 的平均 delay。
+    """
+    import traci_ppo_signal_control as ppo
+
+    np.random.seed(seed)
+    ppo.init_networks(weights_path)
+    env = SurrogateIntersection(calib, ppo.PLAN, ppo.load_network(), ppo.STEP_LENGTH, seed=seed)
+    delays = []
+    t0 = time.perf_counter()
+    for ep in range(episodes):
+        state = env.reset()
+        done = False
+        while not done:
+            action, logprob, value = ppo.get_action_from_policy(state)
+            next_state, reward, done = env.step(action)
+            ppo.states_buffer.append(np.array(state, dtype=np.float32))
+            ppo.actions_buffer.append(ppo.ACTIONS.index(action))
+            ppo.rewards_buffer.append(reward)
+            ppo.old_logprobs_buffer.append(logprob)
+            ppo.values_buffer.append(value)
+            if len(ppo.states_buffer) >= ppo.PPO_UPDATE_INTERVAL:
+                ppo.ppo_update()
+            state = next_state
+        delays.append(env.summary()["avg_delay_time"])
+        if verbose and (ep + 1) % max(1, episodes // 10) == 0:
+            rate = (ep + 1) / (time.perf_counter() - t0)
+            print(f"[pretrain] episode {ep + 1}/{episodes} | avg delay (last 10%) "
+                  f"{np.mean(delays[-max(1, episodes // 10):]):.2f} s/veh | {rate:.0f} episodes/s")
+    ppo.ppo_update()
+    return ppo, delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point-queue surrogate of Node2 for PPO pre-training")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    parsers = {}
+    for name in ("calibrate", "pretrain", "screen"):
+        p = parsers[name] = sub.add_parser(name)
+        p.add_argument("--e2", default=None, help="e2 輸出所在資料夾（預設由 route 檔推估）")
+        p.add_argument("--routes", default=webster_solver.ROUTE_FILE)
+        p.add_argument("--seed", type=int, default=0)
+    p = parsers["pretrain"]
+    p.add_argument("--episodes", type=int, default=1000)
+    p.add_argument("--init", default=None, help="起始權重 npz")
+    p.add_argument("--out", default=os.path.join("runs", "ppo_pretrained.npz"))
+    p = parsers["screen"]
+    p.add_argument("--samples", type=int, default=1000, help="需求樣本數（批次路口數 M）")
+    p.add_argument("--spread", type=float, default=0.3, help="需求倍數的 lognormal σ")
+    p.add_argument("--thresholds", type=float, nargs="*", default=[5.0, 10.0, 20.0],
+                   help="Max-Pressure 排隊差門檻候選")
+    p.add_argument("--ppo", nargs="*", default=[], help="PPO 權重 npz 候選")
+    p.add_argument("--top", type=int, default=3, help="列出建議送 SUMO 驗證的前幾名")
+    args = parser.parse_args()
+
+    index = load_index()
+    calib = calibrate_from_e2(args.e2, index) if args.e2 else calibrate_from_routes(args.routes, index)
+
+    if args.cmd == "calibrate":
+        print(f"source: {calib.source} ({len(calib.arrivals)} bins × {calib.bin_seconds:.0f} s)")
+        print("| lane | λ mean (veh/h) | μ (veh/h) | capacity (veh) | T (s) |")
+        print("|---|---:|---:|---:|---:|")
+        for k, lane in enumerate(calib.lanes):
+            print(f"| {lane} | {calib.arrivals[:, k].mean() * 3600:.0f} | {calib.sat_flow[k] * 3600:.0f} "
+                  f"| {calib.capacity[k]:.1f} | {calib.travel_time[k]:.1f} |")
+        return
+
+    if args.cmd == "screen":
+        t0 = time.perf_counter()
+        results = screen(calib, args.samples, args.spread, args.thresholds, args.ppo,
+                         index=index, seed=args.seed)
+        dt = time.perf_counter() - t0
+        names = list(results)
+        delay = np.stack([results[n]["avg_delay_time"] for n in names])      # (policies, M)
+        wins = np.bincount(delay.argmin(axis=0), minlength=len(names)) / delay.shape[1]
+        order = np.argsort(delay.mean(axis=1))
+        print(f"{len(names)} policies × {args.samples} demand samples in {dt:.2f} s "
+              f"({len(names) * args.samples / dt:.0f} episodes/s)")
+        print("| policy | mean delay (s/veh) | p50 | p90 | best on |")
+        print("|---|---:|---:|---:|---:|")
+        for i in order:
+            d = delay[i]
+            print(f"| {names[i]} | {d.mean():.2f} | {np.percentile(d, 50):.2f} "
+                  f"| {np.percentile(d, 90):.2f} | {wins[i] * 100:.0f}% |")
+        print(f"SUMO 驗證候選: {', '.join(names[i] for i in order[:args.top])}")
+        return
+
+    t0 = time.perf_counter()
+    ppo, delays = pretrain(calib, args.episodes, args.seed, args.init)
+    dt = time.perf_counter() - t0
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    ppo.save_networks(args.out)
+    print(f"{args.episodes} surrogate episodes in {dt:.1f} s ({args.episodes / dt:.0f} episodes/s)")
+    print(f"avg delay first/last 10%: {np.mean(delays[:max(1, len(delays) // 10)]):.2f} → "
+          f"{np.mean(delays[-max(1, len(delays) // 10):]):.2f} s/veh")
+    print(f"weights → {args.out}  (TRACI_PPO_WEIGHTS={args.out} python traci_ppo_signal_control.py)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+PPO 超參數 sweep：搜尋空間 + 平行 SUMO trial + ASHA（非同步 successive halving）
+
+- 每個 trial = 一組超參數，以環境變數（TRACI_PPO_GAMMA 等）啟動 traci_ppo_signal_control.py
+- rung k 的預算為 min_episodes · eta^k 個 episode；trial 從上一個 rung 存下的權重繼續訓練
+  （TRACI_PPO_WEIGHTS / TRACI_PPO_SAVE），不重跑已經跑過的 episode
+- ASHA：有空的 worker 時，先找「在 rung k 排前 1/eta 且還沒晉級」的 trial 往上一個 rung 跑；
+  沒有可晉級的才開新 trial。排不上前段的 trial 不再分配 episode（等於提早結束）
+- 指標：該 rung 最後一個 episode 的 avg_delay_time（越小越好）；每個 episode 都照常寫入 results store，
+  sweep 的 trial / rung 紀錄另存成 results/sweeps/<name>.json
+
+用法：
+    python sweep.py --trials 27 --jobs 4 --eta 3 --max-rung 2
+    python sweep.py --trials 9 --jobs 2 --sim-time 600 --name quick
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+import results_store
+from benchmark import POLL_INTERVAL, RUNS_DIR, launch_run
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SWEEP_DIR = os.path.join(SCRIPT_DIR, "results", "sweeps")
+
+# 參數 → 候選值（grid；trial 從中不重複抽樣）
+SEARCH_SPACE = {
+    "gamma": (0.8, 0.9, 0.95, 0.99),
+    "lambda": (0.9, 0.95, 0.98),
+    "policy_lr": (1e-5, 3e-5, 1e-4, 3e-4, 1e-3),
+    "value_lr": (1e-5, 1e-4, 1e-3),
+    "ppo_epochs": (2, 4, 8),
+    "ppo_update_interval": (256, 512, 1024),
+}
+
+PARAM_ENV = {
+    "gamma": "TRACI_PPO_GAMMA",
+    "lambda": "TRACI_PPO_LAMBDA",
+    "policy_lr": "TRACI_PPO_POLICY_LR",
+    "value_lr": "TRACI_PPO_VALUE_LR",
+    "ppo_epochs": "TRACI_PPO_EPOCHS",
+    "ppo_batch_size": "TRACI_PPO_BATCH_SIZE",
+    "ppo_update_interval": "TRACI_PPO_UPDATE_INTERVAL",
+}
+
+METRIC = "avg_delay_time"
+
+
+def grid_size(space=SEARCH_SPACE):
+    return math.prod(len(v) for v in space.values())
+
+
+def sample_configs(n, space=SEARCH_SPACE, seed=0):
+    """從 grid 不重複抽 n 組（n ≥ grid 大小時回傳整個 grid）。"""
+    keys = list(space)
+    grid = list(itertools.product(*(space[k] for k in keys)))
+    rng = np.random.default_rng(seed)
+    pick = rng.permutation(len(grid))[:n]
+    return [dict(zip(keys, grid[i])) for i in pick]
+
+
+# -------------------------
+# ASHA
+# -------------------------
+
+class Trial:
+    """一組超參數的訓練進度。"""
+
+    def __init__(self, trial_id, params):
+        self.trial_id = trial_id
+        self.params = params
+        self.episodes = 0          # 已訓練的 episode 數
+        self.weights = None        # 最近一次存下的權重
+        self.metrics = {}          # rung → 指標
+        self.run_ids = {}          # rung → run id
+        self.promoted = set()      # 已從哪些 rung 晉級
+
+    def to_dict(self):
+        return {"trial_id": self.trial_id, "params": self.params, "episodes": self.episodes,
+                "metrics": {str(k): v for k, v in self.metrics.items()},
+                "run_ids": {str(k): v for k, v in self.run_ids.items()}}
+
+
+class ASHA:
+    """非同步 successive halving：budget(k) = min_episodes · eta^k。"""
+
+    def __init__(self, min_episodes=1, eta=3, max_rung=2):
+        self.min_episodes = min_episodes
+        self.eta = eta
+        self.max_rung = max_rung
+
+    def budget(self, rung):
+        return self.min_episodes * self.eta ** rung
+
+    def promotable(self, trials, busy=()):
+        """回傳 (trial, 新 rung)；沒有可晉級的則 None。由高 rung 往低 rung 找。"""
+        for rung in range(self.max_rung - 1, -1, -1):
+            done = sorted((t for t in trials if rung in t.metrics), key=lambda t: t.metrics[rung])
+            for t in done[:len(done) // self.eta]:
+                if rung not in t.promoted and t.trial_id not in busy:
+                    return t, rung + 1
+        return None
+
+
+# -------------------------
+# 執行
+# -------------------------
+
+def _episode_metric(run_id, db_path):
+    """該 rung 最後一個 episode 的指標（失敗則 inf）。"""
+    runs = results_store.load_final_runs([run_id], controller="ppo", db_path=db_path)
+    return float(runs[-1][METRIC]) if runs else math.inf
+
+
+def run_sweep(configs, scheduler, jobs, db_path, name, seed=1, sim_time=None,
+              sumo_binary="sumo", log_dir=None):
+    """跑完 sweep，回傳 trials。"""
+    weights_dir = os.path.join(SCRIPT_DIR, RUNS_DIR, f"sweep-{name}")
+    os.makedirs(weights_dir, exist_ok=True)
+    trials = []
+    pending = list(configs)
+    running = {}      # trial_id → (trial, rung, run_id, n_episodes, proc, save_path)
+    while True:
+        # 分配工作：先晉級，再開新 trial
+        while len(running) < jobs:
+            job = scheduler.promotable(trials, busy=running)
+            if job is not None:
+                trial, rung = job
+                trial.promoted.add(rung - 1)
+            elif pending:
+                trial, rung = Trial(len(trials), pending.pop(0)), 0
+                trials.append(trial)
+            else:
+                break
+            n_episodes = scheduler.budget(rung) - trial.episodes
+            run_id = f"sweep-{name}-t{trial.trial_id}-r{rung}"
+            save_path = os.path.join(weights_dir, f"t{trial.trial_id}-r{rung}.npz")
+            env = {PARAM_ENV[k]: v for k, v in trial.params.items()}
+            env.update({"TRACI_PPO_EPISODES": n_episodes, "TRACI_PPO_SAVE": save_path})
+            if trial.weights:
+                env["TRACI_PPO_WEIGHTS"] = trial.weights
+            _, proc = launch_run("ppo", seed, db_path, sumo_binary, log_dir,
+                                 sim_time=sim_time, extra_env=env, run_id=run_id)
+            running[trial.trial_id] = (trial, rung, run_id, n_episodes, proc, save_path)
+            print(f"[sweep] trial {trial.trial_id} → rung {rung} ({n_episodes} episodes) {trial.params}",
+                  file=sys.stderr)
+
+        if not running:
+            return trials
+
+        time.sleep(POLL_INTERVAL)
+        for tid, (trial, rung, run_id, n_episodes, proc, save_path) in list(running.items()):
+            rc = proc.poll()
+            if rc is None:
+                continue
+            del running[tid]
+            trial.episodes += n_episodes
+            trial.run_ids[rung] = run_id
+            trial.metrics[rung] = _episode_metric(run_id, db_path) if rc == 0 else math.inf
+            if os.path.exists(save_path):
+                trial.weights = save_path
+            print(f"[sweep] trial {tid} rung {rung}: {METRIC} = {trial.metrics[rung]:.2f} (exit {rc})",
+                  file=sys.stderr)
+
+
+def write_report(trials, scheduler, name, path=None):
+    """sweep 結果存成 JSON，回傳 (路徑, 最佳 trial, 使用的 episode 數)。"""
+    used = sum(t.episodes for t in trials)
+    top = scheduler.max_rung
+    finished = [t for t in trials if top in t.metrics] or trials
+    best = min(finished, key=lambda t: t.metrics.get(max(t.metrics, default=0), math.inf))
+    report = {
+        "name": name,
+        "eta": scheduler.eta, "min_episodes": scheduler.min_episodes, "max_rung": top,
+        "episodes_used": used,
+        "episodes_full_budget": len(trials) * scheduler.budget(top),
+        "episodes_full_grid": grid_size() * scheduler.budget(top),
+        "best": best.to_dict(),
+        "trials": [t.to_dict() for t in trials],
+    }
+    path = path or os.path.join(SWEEP_DIR, f"{name}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, default=float)
+    return path, best, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PPO hyperparameter sweep with ASHA")
+    parser.add_argument("--trials", type=int, default=27, help="抽樣的超參數組數")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="同時執行的 SUMO 數")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--min-episodes", type=int, default=1)
+    parser.add_argument("--max-rung", type=int, default=2)
+    parser.add_argument("--sim-time", type=float, default=None, help="每個 episode 的模擬秒數")
+    parser.add_argument("--seed", type=int, default=1, help="SUMO seed（所有 trial 相同）")
+    parser.add_argument("--sample-seed", type=int, default=0)
+    parser.add_argument("--name", default=time.strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--sumo-binary", default="sumo")
+    parser.add_argument("--log-dir", default=None)
+    parser.add_argument("--db", default=results_store.DEFAULT_DB)
+    args = parser.parse_args()
+
+    scheduler = ASHA(args.min_episodes, args.eta, args.max_rung)
+    configs = sample_configs(args.trials, seed=args.sample_seed)
+    t0 = time.perf_counter()
+    trials = run_sweep(configs, scheduler, args.jobs, args.db, args.name, args.seed,
+                       args.sim_time, args.sumo_binary, args.log_dir)
+    path, best, used = write_report(trials, scheduler, args.name)
+
+    print(f"\n| trial | {' | '.join(SEARCH_SPACE)} | episodes | " +
+          " | ".join(f"rung {k}" for k in range(args.max_rung + 1)) + " |")
+    print("|---:|" + "---:|" * (len(SEARCH_SPACE) + 1 + args.max_rung + 1))
+    for t in sorted(trials, key=lambda t: (-max(t.metrics, default=0),
+                                           t.metrics.get(max(t.metrics, default=0), math.inf))):
+        cells = " | ".join(f"{t.metrics[k]:.2f}" if k in t.metrics else "" for k in range(args.max_rung + 1))
+        print(f"| {t.trial_id} | {' | '.join(f'{t.params[k]:g}' for k in SEARCH_SPACE)} "
+              f"| {t.episodes} | {cells} |")
+    full = len(trials) * scheduler.budget(args.max_rung)
+    print(f"\nbest: trial {best.trial_id} {best.params}")
+    print(f"episodes used: {used} / {full} for the same {len(trials)} trials at full budget "
+          f"({used / max(full, 1) * 100:.0f}%), full grid would be {grid_size() * scheduler.budget(args.max_rung)}")
+    print(f"wall time: {time.perf_counter() - t0:.0f} s; report → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+長時間執行的即時 telemetry：本機 HTTP 提供 Prometheus text 格式（/metrics）
+
+- TRACI_TELEMETRY_PORT=<port>：啟用；背景 daemon thread 跑 ThreadingHTTPServer（預設只綁 127.0.0.1，
+  TRACI_TELEMETRY_HOST 可改）。port 被占用時往上找（最多 PORT_TRIES 個），實際 port 印在 stderr，
+  同一台機器平行跑多個 run 時可設同一個起始 port
+- 主迴圈每 TRACI_TELEMETRY_EVERY 模擬秒（預設 1 s）呼叫一次 observe()：組一個新的 dict 後整個替換
+  （單一參考賦值），HTTP thread 只讀取當下的 dict 來輸出，不需要 lock，也不會卡住主迴圈；
+  其餘步數 due(step) 只是一個整數比較
+- 多 episode 訓練：每個 episode 結束呼叫 reset(該 episode 步數)，step 從 0 重新計數，
+  steps_total 仍跨 episode 累加（counter 不會倒退）
+- 指標：模擬時間、步數、steps/s、模擬 / 實際時間比、各 approach queue、目前 phase，
+  以及控制器自己的計數（PPO 決策 / 切換 / 更新、LLM 呼叫 / fallback / API 時間、
+  感應式 gap-out / max-out、MPC 決策數與 lookahead 延遲等）；
+  每個指標都帶 run_id / controller / scenario label，方便同時監看一批 run
+- 未設定時 start() 回傳 NullTelemetry，due() 永遠 False
+
+用法：
+    TRACI_TELEMETRY_PORT=9100 python traci_ppo_signal_control.py
+    curl -s localhost:9100/metrics
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from run_config import RUN_ID, SCENARIO
+
+TELEMETRY_PORT = int(os.environ.get("TRACI_TELEMETRY_PORT") or 0)
+TELEMETRY_HOST = os.environ.get("TRACI_TELEMETRY_HOST", "127.0.0.1")
+TELEMETRY_EVERY = float(os.environ.get("TRACI_TELEMETRY_EVERY", "1.0"))   # 模擬秒
+PORT_TRIES = 64
+PREFIX = "traci_"
+
+# 指標 → 說明（名稱以 _total 結尾者為 counter，其餘 gauge）
+METRIC_HELP = {
+    "up": "1 while the control loop is running, 0 after it finished",
+    "sim_time_seconds": "Current simulation time",
+    "steps_total": "Simulation steps executed in this run",
+    "steps_per_second": "Simulation steps per wall second since the previous update",
+    "sim_wall_ratio": "Simulated seconds per wall second since the run started",
+    "queue_vehicles": "Vehicles on the approach e2 detectors",
+    "phase_index": "Current phase index of the signal plan",
+    "episode": "Current training episode",
+}
+
+
+class NullTelemetry:
+    """未啟用時使用。"""
+
+    enabled = False
+
+    def due(self, step):
+        return False
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def reset(self, steps_done=0):
+        pass
+
+    def finish(self):
+        pass
+
+
+class Telemetry:
+    def __init__(self, controller, step_length, port=TELEMETRY_PORT, host=TELEMETRY_HOST,
+                 every=TELEMETRY_EVERY):
+        self.controller = controller
+        self.step_length = float(step_length)
+        self.every_steps = max(1, int(round(every / step_length)))
+        self.labels = {"run_id": RUN_ID, "controller": controller, "scenario": SCENARIO}
+        self._state = {"up": 1}
+        self._next = 0
+        self._steps_before = 0       # 先前 episode 累計的步數（steps_total 用）
+        self._wall0 = time.perf_counter()
+        self._last = (0, self._wall0)
+        self.server = self._bind(host, port)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="telemetry", daemon=True)
+        self.thread.start()
+        print(f"[telemetry] http://{host}:{self.port}/metrics", file=sys.stderr, flush=True)
+
+    def _bind(self, host, port):
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):   # 不在 stderr 印每一次 scrape
+                pass
+
+        for p in range(port, port + PORT_TRIES):
+            try:
+                server = ThreadingHTTPServer((host, p), Handler)
+                server.daemon_threads = True
+                return server
+            except OSError:
+                continue
+        raise OSError(f"no free telemetry port in {port}-{port + PORT_TRIES - 1}")
+
+    # -------------------------
+    # 主迴圈端
+    # -------------------------
+
+    def due(self, step):
+        return step >= self._next
+
+    def observe(self, step, queues=None, phase=None, phase_name=None, **values):
+        """
+        更新指標（主迴圈呼叫）。queues = {approach: 車數}；values 為控制器自己的數值，
+        名稱以 _total 結尾的輸出成 counter。
+        """
+        self._next = step + self.every_steps
+        now = time.perf_counter()
+        last_step, last_wall = self._last
+        rate = (step - last_step) / (now - last_wall) if step > last_step and now > last_wall else 0.0
+        self._last = (step, now)
+        sim_time = step * self.step_length
+        state = {
+            "up": 1,
+            "sim_time_seconds": sim_time,
+            "steps_total": self._steps_before + step,
+            "steps_per_second": rate,
+            "sim_wall_ratio": sim_time / (now - self._wall0) if now > self._wall0 else 0.0,
+        }
+        if queues:
+            state["queue_vehicles"] = {("approach", a): q for a, q in queues.items()}
+        if phase is not None:
+            state["phase_index"] = {("phase", phase_name or str(phase)): phase}
+        state.update(values)
+        self._state = state          # 整個替換：HTTP thread 看到的永遠是完整的一組
+
+    def reset(self, steps_done=0):
+        """episode 結束：下一段的 step 從 0 開始；steps_done 累加到 steps_total。"""
+        self._steps_before += int(steps_done)
+        self._next = 0
+        self._wall0 = time.perf_counter()
+        self._last = (0, self._wall0)
+
+    def finish(self):
+        self._state = dict(self._state, up=0)
+
+    # -------------------------
+    # HTTP thread 端
+    # -------------------------
+
+    def render(self):
+        state = self._state
+        base = ",".join(f'{k}="{_escape(v)}"' for k, v in self.labels.items())
+        lines = []
+        for name, value in state.items():
+            metric = PREFIX + name
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name.replace('_', ' '))}")
+            lines.append(f"# TYPE {metric} {kind}")
+            if isinstance(value, dict):
+                for (key, label), v in value.items():
+                    lines.append(f'{metric}{{{base},{key}="{_escape(label)}"}} {float(v)!r}')
+            else:
+                lines.append(f"{metric}{{{base}}} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def start(controller, step_length):
+    """TRACI_TELEMETRY_PORT 有設定時啟動 HTTP thread，否則回傳 NullTelemetry。"""
+    if not TELEMETRY_PORT:
+        return NullTelemetry()
+    try:
+        return Telemetry(controller, step_length)
+    except OSError as e:
+        print(f"[telemetry] disabled: {e}", file=sys.stderr)
+        return NullTelemetry()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""pressure.py 在真實 Node2 路網上的逐 movement 壓力（手算對照）。"""
+
+import numpy as np
+
+from network_index import load_index
+from phase_plan import DEFAULT_PLAN
+from pressure import build_pressure_model
+
+
+def _model():
+    index = load_index(cache_dir=None)
+    return index, build_pressure_model(DEFAULT_PLAN, index)
+
+
+def test_shared_lane_links_split_upstream_and_pay_full_downstream():
+    index, model = _model()
+    q = np.zeros(len(model.in_lanes))
+    x = np.zeros(len(model.out_lanes))
+    q[model.in_lanes.index("Node2_4_SB_0")] = 6.0      # 右轉 + 直行共用車道
+    x[model.out_lanes.index("Node1_2_WB_0")] = 4.0     # 右轉（link 0）的下游
+    x[model.out_lanes.index("Node2_5_SB_0")] = 1.0     # 直行（link 1）的下游
+
+    assert index.link_from_lane[0] == index.link_from_lane[1] == "Node2_4_SB_0"
+    pressure = model.link_pressure(q, x)
+    # 右轉：6 / 2 − 4 = −1；直行：6 / 2 − 1 = 2
+    assert pressure[0] == -1.0
+    assert pressure[1] == 2.0
+
+
+def test_downstream_lane_shared_by_several_links_is_not_normalized():
+    index, model = _model()
+    q = np.zeros(len(model.in_lanes))
+    x = np.zeros(len(model.out_lanes))
+    x[model.out_lanes.index("Node1_2_WB_0")] = 3.0     # link 0（SB 右轉）與 link 6（WB 直行）匯入
+    pressure = model.link_pressure(q, x)
+    assert pressure[0] == pressure[6] == -3.0
+
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+時段（time-of-day, TOD）計畫排程：固定時制控制器的全天多計畫切換
+
+- 排程 = [(開始時間, 計畫), ...]；計畫可為
+    fixed      : phase_plan.DEFAULT_PLAN（traci.fixed_4phase.py 的計畫）
+    permissive : phase_plan.PERMISSIVE_4
+    webster    : 以該時段的 route 需求求解 Webster（webster_solver.py）
+    <檔案>.json : 相位 list（與 PHASE_CYCLE 相同格式）
+- 啟動後以 setProgramLogic 一次安裝所有計畫為 SUMO program（相同計畫只裝一次），
+  之後由 SUMO 原生執行；Python 只在切換點 simulationStep(t) 跳過去、setProgram
+- 切換時機：到達時段邊界後，等目前計畫跑完當下週期（最後一個 phase 是黃燈）才換，
+  並檢查舊計畫最後 state → 新計畫第一個 state 沒有綠燈直接變紅
+- 統計改由 SUMO 輸出取得（e2 偵測器輸出 + --statistic-output），迴圈內不讀偵測器；
+  TRACI_TOD_DISCIPLINE_EVERY > 0 時每隔該秒數做一次車道紀律（與其他控制器相同，但會變慢）
+
+環境變數：
+- TRACI_TOD_SCHEDULE : 例如 "0=webster,6.5=webster,9.5=fixed"（小時=計畫），預設 DEFAULT_SCHEDULE
+- TRACI_TOD_DISCIPLINE_EVERY : 車道紀律間隔（秒），預設 0（不做）
+
+用法：
+    python -m traci_run tod --sim-time 86400 --route-file scenarios/<id>.rou.xml
+    python tod_scheduler.py --show --schedule "0=fixed,7=webster,9=fixed"
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import profiling
+import results_store
+import webster_solver
+from detector_outputs import load_e2_run
+from network_index import load_index
+from phase_conflicts import validate_plan
+from phase_plan import DEFAULT_PLAN, GREEN_CHARS, PERMISSIVE_4, PhasePlanError, compile_plan
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, OUTPUT_PREFIX, ROUTE_FILE
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# traci 於 main() 才載入（需要 SUMO_HOME）
+traci = None
+
+sumocfg_path = os.path.join(SCRIPT_DIR, 'Traci.sumocfg')
+
+STEP_LENGTH = 0.10
+TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+STATS_FILE = "tod_statistics.xml"
+
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID。"""
+    global NET, TLS_ID
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+    return NET
+
+
+# 預設全天排程（小時, 計畫）：離峰 / 早峰 / 日間 / 晚峰 / 晚間，各時段以需求求解 Webster
+DEFAULT_SCHEDULE = "0=webster,6.5=webster,9.5=webster,16=webster,19.5=webster"
+SCHEDULE = os.environ.get("TRACI_TOD_SCHEDULE", DEFAULT_SCHEDULE)
+DISCIPLINE_EVERY = float(os.environ.get("TRACI_TOD_DISCIPLINE_EVERY", "0"))
+
+PLAN_NAMES = ("fixed", "permissive", "webster")
+
+
+# -------------------------
+# 排程
+# -------------------------
+
+def parse_schedule(spec):
+    """ "0=webster,6.5=fixed" → [(開始秒, 計畫名稱), ...]（依時間排序，第一段必須從 0 開始）。"""
+    entries = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        hour, _, name = item.partition("=")
+        if not name:
+            raise ValueError(f"schedule entry '{item}' must be <hour>=<plan>")
+        name = name.strip()
+        if name not in PLAN_NAMES and not name.endswith(".json"):
+            raise ValueError(f"unknown plan '{name}' (choices: {PLAN_NAMES} or a .json file)")
+        entries.append((float(hour) * 3600.0, name))
+    entries.sort()
+    if not entries or entries[0][0] != 0.0:
+        raise ValueError("schedule must start at hour 0")
+    return entries
+
+
+def resolve_plans(entries, route_file, sim_time=SIM_TIME):
+    """
+    每個時段 → PhasePlan。webster 以時段 [開始, 下一段開始) 的需求求解
+    （超過 24 h 的模擬，排程每天重複）。
+    回傳 [(開始秒, 結束秒, 名稱, PhasePlan), ...]，涵蓋 [0, sim_time)。
+    """
+    day = 86400.0
+    out = []
+    n_days = int(np.ceil(sim_time / day)) if sim_time > 0 else 1
+    for d in range(n_days):
+        for k, (start, name) in enumerate(entries):
+            begin = d * day + start
+            end = d * day + (entries[k + 1][0] if k + 1 < len(entries) else day)
+            if begin >= sim_time:
+                break
+            end = min(end, sim_time)
+            if name == "fixed":
+                plan = DEFAULT_PLAN
+            elif name == "permissive":
+                plan = compile_plan(PERMISSIVE_4)
+            elif name == "webster":
+                plan, _ = webster_solver.solve_routes(route_file, DEFAULT_PLAN, NET,
+                                                      window=(begin, end), step_length=STEP_LENGTH)
+            else:
+                with open(name, "r", encoding="utf-8") as f:
+                    plan = compile_plan(json.load(f))
+            out.append((begin, end, name, plan))
+    return out
+
+
+def check_transition(old, new):
+    """舊計畫週期結尾 → 新計畫第一個 phase 不可有綠燈直接變紅。"""
+    a, b = old.states[-1], new.states[0]
+    for link, (x, y) in enumerate(zip(a, b)):
+        if x in GREEN_CHARS and y in "rR":
+            raise PhasePlanError(
+                f"link {link}: green at the end of the old plan goes straight to red")
+
+
+def switch_steps(periods):
+    """
+    計算實際切換步數：到達邊界後等舊計畫跑完當下週期。
+    回傳 [(切換步, program 索引), ...] 與 programs（不重複的 PhasePlan）。
+    """
+    programs, prog_of = [], []
+    for _, _, _, plan in periods:
+        for i, p in enumerate(programs):
+            if p.states == plan.states and np.array_equal(p.durations, plan.durations):
+                prog_of.append(i)
+                break
+        else:
+            programs.append(plan)
+            prog_of.append(len(programs) - 1)
+
+    switches = [(0, prog_of[0])]
+    active_since, active = 0, prog_of[0]
+    for (begin, _, _, _), prog in zip(periods[1:], prog_of[1:]):
+        if prog == active:
+            continue
+        boundary = int(round(begin / STEP_LENGTH))
+        cycle = programs[active].cycle_steps
+        n_cycles = -(-max(boundary - active_since, 0) // cycle)     # ceil
+        at = active_since + n_cycles * cycle
+        if at >= TOTAL_STEPS:
+            break
+        check_transition(programs[active], programs[prog])
+        switches.append((at, prog))
+        active_since, active = at, prog
+    return switches, programs
+
+
+def to_logic(plan, program_id):
+    """PhasePlan → traci Logic（duration 以秒計）。"""
+    phases = [traci.trafficlight.Phase(float(d) * STEP_LENGTH, s)
+              for d, s in zip(plan.durations, plan.states)]
+    return traci.trafficlight.Logic(program_id, 0, 0, phases)
+
+
+# -------------------------
+# 車道紀律（選用，與其他控制器相同）
+# -------------------------
+
+def enforce_lane_discipline():
+    """
+    - 直行車不在左轉車道
+    - 左轉車導向左轉車道
+    """
+    for edge in NET.in_edges:
+        for vid in traci.edge.getLastStepVehicleIDs(edge):
+            try:
+                route = traci.vehicle.getRoute(vid)
+                cur_idx = route.index(edge)
+                if cur_idx + 1 >= len(route):
+                    continue
+                nxt = route[cur_idx + 1]
+                lane = traci.vehicle.getLaneIndex(vid)
+                if nxt == NET.straight_next.get(edge) and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif nxt == NET.left_next.get(edge) and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
+            except Exception:
+                pass
+
+
+# -------------------------
+# 事後統計（SUMO 輸出）
+# -------------------------
+
+def read_statistics(path):
+    """--statistic-output → dict（檔案不存在則回傳空 dict）。"""
+    if not os.path.exists(path):
+        return {}
+    out = {}
+    root = ET.parse(path).getroot()
+    for tag in ("vehicles", "vehicleTripStatistics"):
+        elem = root.find(tag)
+        if elem is not None:
+            out.update({f"{tag}.{k}": float(v) for k, v in elem.attrib.items()
+                        if v.replace(".", "", 1).replace("-", "", 1).isdigit()})
+    return out
+
+
+def detector_summary(out_dir, periods):
+    """e2 輸出 → 各 approach 平均排隊與各時段總平均排隊。"""
+    table = load_e2_run(out_dir)
+    if len(table) == 0:
+        return {}
+    summary = {}
+    total = 0.0
+    for a in NET.approaches:
+        dets = [d for d in NET.approach_detectors[a] if d]
+        sel = table[np.isin(table["detector"], dets)]
+        q = 0.0
+        if len(sel):
+            # 每條車道的時間加權平均，再加總
+            for d in dets:
+                rows = sel[sel["detector"] == d]
+                span = (rows["end"] - rows["begin"]).sum()
+                if span > 0:
+                    q += float((rows["meanVehicleNumber"] * (rows["end"] - rows["begin"])).sum() / span)
+        summary[f"avg_q{a}"] = q
+        total += q
+    summary["avg_queue_total"] = total
+    main = [d for d in NET.detector_ids if d]
+    sel = table[np.isin(table["detector"], main)]
+    summary["period_avg_queue"] = []
+    for begin, end, name, _ in periods:
+        rows = sel[(sel["begin"] >= begin) & (sel["begin"] < end)]
+        n_int = len(np.unique(rows["begin"]))
+        q = float(rows["meanVehicleNumber"].sum() / n_int) if n_int else 0.0
+        summary["period_avg_queue"].append([begin, end, name, q])
+    return summary
+
+
+# -------------------------
+# 主程式
+# -------------------------
+
+def main():
+    global traci
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
+
+    entries = parse_schedule(SCHEDULE)
+    periods = resolve_plans(entries, ROUTE_FILE or webster_solver.ROUTE_FILE)
+    for plan in {id(p): p for _, _, _, p in periods}.values():
+        validate_plan(plan)
+    switches, programs = switch_steps(periods)
+
+    # 輸出放在 runs/<...>/（SUMO 不會自己建資料夾）
+    prefix = OUTPUT_PREFIX or f"runs/tod-{RUN_ID}/"
+    out_dir = os.path.join(SCRIPT_DIR, prefix)
+    os.makedirs(out_dir, exist_ok=True)
+    sumo_config = [
+        SUMO_BINARY,
+        '-c', sumocfg_path,
+        '--step-length', str(STEP_LENGTH),
+        '--delay', '0',
+        '--lateral-resolution', '0',
+        '--end', str(int(SIM_TIME)),
+        '--statistic-output', os.path.join(SCRIPT_DIR, STATS_FILE),
+        *SUMO_EXTRA_ARGS,
+    ]
+    if not OUTPUT_PREFIX:
+        sumo_config += ['--output-prefix', prefix]
+
+    print(f"\n=== Starting Time-of-Day Fixed-Time Control ({SIM_TIME:.0f} sec, "
+          f"{len(programs)} programs, {len(switches) - 1} switches) ===\n")
+    for begin, end, name, plan in periods:
+        print(f"  {begin / 3600:5.2f}h - {end / 3600:5.2f}h  {name:10s} cycle={plan.cycle_steps * STEP_LENGTH:.0f}s")
+
+    traci.start(sumo_config)
+    try:
+        traci.gui.setSchema("View #0", "real world")
+    except Exception:
+        pass
+
+    # 號誌由 SUMO 自己跑 program：沒有逐步的 observe / decide，只有跳躍推進、切換 program 與車道紀律
+    prof.mark("actuate")
+    for i, plan in enumerate(programs):
+        traci.trafficlight.setProgramLogic(TLS_ID, to_logic(plan, f"tod{i}"))
+
+    # 事件：program 切換 + （選用）車道紀律
+    events = [(at, "switch", prog) for at, prog in switches]
+    if DISCIPLINE_EVERY > 0:
+        every = max(1, int(round(DISCIPLINE_EVERY / STEP_LENGTH)))
+        events += [(s, "discipline", None) for s in range(0, TOTAL_STEPS, every)]
+    events.sort(key=lambda e: (e[0], e[1] != "switch"))
+
+    wall_start = time.perf_counter()
+    for at, kind, prog in events:
+        if at > 0:
+            prof.mark("step")
+            traci.simulationStep(at * STEP_LENGTH)
+        if kind == "switch":
+            prof.mark("actuate")
+            traci.trafficlight.setProgram(TLS_ID, f"tod{prog}")
+            traci.trafficlight.setPhase(TLS_ID, 0)
+            if at > 0:
+                print(f"[t={at * STEP_LENGTH:7.1f}s] switch → tod{prog} "
+                      f"(cycle {programs[prog].cycle_steps * STEP_LENGTH:.0f}s)")
+        else:
+            prof.mark("lane_discipline")
+            enforce_lane_discipline()
+    prof.mark("step")
+    traci.simulationStep(SIM_TIME)
+    prof.mark("teardown")
+    wall_time = time.perf_counter() - wall_start
+    traci.close()
+    print("\nSimulation completed.\n")
+
+    stats = read_statistics(os.path.join(out_dir, STATS_FILE))
+    summary = detector_summary(out_dir, periods)
+    arrived = stats.get("vehicleTripStatistics.count", 0.0)
+    summary.update({
+        "total_arrived": int(arrived),
+        "avg_delay_time": stats.get("vehicleTripStatistics.timeLoss", 0.0),
+        "avg_waiting_time": stats.get("vehicleTripStatistics.waitingTime", 0.0),
+        "total_waiting_time": stats.get("vehicleTripStatistics.waitingTime", 0.0) * arrived,
+        "switches": len(switches) - 1,
+    })
+
+    print("========== Time-of-Day Summary ==========")
+    for a in NET.approaches:
+        if f"avg_q{a}" in summary:
+            print(f"{a} 平均排隊 (Queue) = {summary[f'avg_q{a}']:.2f} veh")
+    if "avg_queue_total" in summary:
+        print(f"Total Avg Queue     = {summary['avg_queue_total']:.2f} veh")
+    print(f"Total Arrived Veh   = {summary['total_arrived']}")
+    print(f"Avg Delay Time      = {summary['avg_delay_time']:.2f} sec/veh (time loss)")
+    print(f"Avg Waiting Time    = {summary['avg_waiting_time']:.2f} sec/veh")
+    print(f"Wall time           = {wall_time:.1f} s ({TOTAL_STEPS / max(wall_time, 1e-9):.0f} steps/s)")
+    print("=========================================\n")
+
+    if RECORD_RESULTS:
+        config = {
+            "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+            "schedule": [[b, e, n, list(p.durations.tolist())] for b, e, n, p in periods],
+            "discipline_every": DISCIPLINE_EVERY,
+        }
+        results_store.record_run(
+            "tod_fixed", summary, config, seed=SEED, wall_time=wall_time,
+            sim_steps=TOTAL_STEPS, run_id=RUN_ID, scenario=SCENARIO,
+        )
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Time-of-day fixed-time plan scheduler")
+    parser.add_argument("--schedule", default=None, help=f"預設 {DEFAULT_SCHEDULE}")
+    parser.add_argument("--show", action="store_true", help="只列出各時段計畫與切換點，不執行")
+    args = parser.parse_args()
+    global SCHEDULE
+    if args.schedule:
+        SCHEDULE = args.schedule
+    if not args.show:
+        main()
+        return
+    load_network()
+    periods = resolve_plans(parse_schedule(SCHEDULE), ROUTE_FILE or webster_solver.ROUTE_FILE)
+    switches, programs = switch_steps(periods)
+    for begin, end, name, plan in periods:
+        greens = ", ".join(f"{d * STEP_LENGTH:.0f}" for d in plan.durations)
+        print(f"{begin / 3600:5.2f}h - {end / 3600:5.2f}h  {name:10s} "
+              f"cycle={plan.cycle_steps * STEP_LENGTH:.0f}s  [{greens}]")
+    print("\nswitches: " + ", ".join(f"{at * STEP_LENGTH:.0f}s→tod{p}" for at, p in switches))
+
+
+if __name__ == "__main__":
+    cli()
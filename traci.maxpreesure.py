@@ -1,82 +1,106 @@
 # ================================
 # Max-Pressure Traffic Light Control (Protected Left, 8 Phases, Safe)
 # ================================
+# TRACI_MP_MODE=group    : group 結尾比較 NS / EW 上游排隊和（預設，原本的做法）
+# TRACI_MP_MODE=movement : 每個綠燈 phase 結尾，以逐 movement 壓力
+#                          （上游車道排隊 − 下游車道車輛數，見 pressure.py）在 4 個綠燈 phase 中選最大者
+# TRACI_BC_LOG=<資料夾>   : group 模式下記錄每個決策的 (state, action) 供 behavior cloning（behavior_cloning.py）
+# TRACI_MP_ACTUATED=1    : 綠燈長度改為感應式（每秒看停止線區段，gap-out / max-out，見 actuated.py），
+#                          綠燈結束後的選擇仍照上述模式；黃燈照計畫秒數
 
 import os
 import sys
+import time
 from collections import defaultdict
 
+import numpy as np
+
+import profiling
+import results_store
+import telemetry
+from pressure import build_pressure_model
+from phase_plan import DEFAULT_PLAN
+from phase_conflicts import validate_plan
+from network_index import load_index
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, PROGRESS_EVERY
+from metrics import RunMonitor
+from actuated import ActuatedPhase, StopBarZone
+from behavior_cloning import open_writer, read_state
+
 # ★ Script directory
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Step 1: SUMO_HOME
-if 'SUMO_HOME' in os.environ:
-    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-    sys.path.append(tools)
-else:
-    sys.exit("Please declare environment variable 'SUMO_HOME'")
-
-# Step 2: import TraCI
-import traci
+# TraCI 於 main() 才載入（需要 SUMO_HOME）
+traci = None
 
-# Step 3: Load SUMO config
+# SUMO config
 sumocfg_path = os.path.join(SCRIPT_DIR, 'Traci.sumocfg')
-if not os.path.exists(sumocfg_path):
-    sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
 
 Sumo_config = [
-    'sumo-gui',
+    SUMO_BINARY,
     '-c', sumocfg_path,
     '--step-length', '0.10',
     '--delay', '0',
-    '--lateral-resolution', '0'
+    '--lateral-resolution', '0',
+    *SUMO_EXTRA_ARGS
 ]
 
-TLS_ID = "Node2"
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+DETECTORS = None   # approach → 每條車道的 e2 id
+PRESSURE = None    # 逐 movement 壓力矩陣（見 pressure.py）
 
 # -------------------------
 # 模擬參數
 # -------------------------
 
 STEP_LENGTH = 0.10
-SIM_TIME = 1800.0
 TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+PROGRESS_STEPS = max(1, int(round(PROGRESS_EVERY / STEP_LENGTH)))   # 進度列印間隔（步）
 
 # PHASE_CYCLE（完全由程式端控制，不使用 SUMO 內建號誌程序）
-# 索引對應: SB(0-4), WB(5-9), NB(10-14), EB(15-19)
-PHASE_CYCLE = [
-    # 0: NS Straight (Green)
-    {"duration": 300, "state": "GGGGrrrrrrGGGGrrrrrr", "name": "NS Straight"},
-    # 1: NS Straight (Yellow)
-    {"duration": 30,  "state": "yyyyrrrrrryyyyrrrrrr", "name": "NS Straight (Y)"},
-    # 2: NS Left (Green)
-    {"duration": 150, "state": "rrrrGrrrrrrrrrGrrrrr", "name": "NS Left"},
-    # 3: NS Left (Yellow)
-    {"duration": 30,  "state": "rrrryrrrrrrrrryrrrrr", "name": "NS Left (Y)"},
-    # 4: EW Straight (Green)
-    {"duration": 300, "state": "rrrrrGGGGrrrrrGGGGrr", "name": "EW Straight"},
-    # 5: EW Straight (Yellow)
-    {"duration": 30,  "state": "rrrrryyyyrrrrryyyyrr", "name": "EW Straight (Y)"},
-    # 6: EW Left (Green)
-    {"duration": 150, "state": "rrrrrrrrrGrrrrrrrrrG", "name": "EW Left"},
-    # 7: EW Left (Yellow)
-    {"duration": 30,  "state": "rrrrrrrrryrrrrrrrrry", "name": "EW Left (Y)"}
-]
+# link 索引對應見 NET.approach_links；定義與編譯見 phase_plan.py
+PLAN = DEFAULT_PLAN
+PHASE_CYCLE = PLAN.phases
 
-# NS / EW group 定義
-NS_GROUP_PHASES = [0, 1, 2, 3]
-EW_GROUP_PHASES = [4, 5, 6, 7]
+# NS / EW group
+NS_GROUP = PLAN.group_index("NS")
+EW_GROUP = PLAN.group_index("EW")
+NS_GREEN = PLAN.group_green("NS")
+EW_GREEN = PLAN.group_green("EW")
 
 # 壓力差門檻
 PRESSURE_DIFF_THRESHOLD = 10  # vehicles
 
+# 決策模式：group（NS / EW 排隊和）或 movement（逐 movement 壓力）
+MP_MODE = os.environ.get("TRACI_MP_MODE", "group")
+MP_MODES = ("group", "movement")
+
+# 感應式綠燈長度（actuated.py）
+MP_ACTUATED = os.environ.get("TRACI_MP_ACTUATED", "0") == "1"
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID / DETECTORS / PRESSURE。"""
+    global NET, TLS_ID, DETECTORS, PRESSURE
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+        DETECTORS = NET.approach_detectors
+        PRESSURE = build_pressure_model(PLAN, NET)
+    return NET
+
+
 # -------------------------
 # 工具函式
 # -------------------------
 
 def enforce_lane_discipline():
     """依照固定規則強制車道切換（左轉/直行）。"""
-    edges = ["Node1_2_EB", "Node2_3_WB", "Node2_4_SB", "Node2_5_NB"]
+    edges = NET.in_edges
     for edge in edges:
         for vid in traci.edge.getLastStepVehicleIDs(edge):
             try:
@@ -90,24 +114,14 @@ def enforce_lane_discipline():
                 lane = traci.vehicle.getLaneIndex(vid)
 
                 # 直行判斷
-                straight = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_3_WB" and nxt == "Node1_2_WB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_5_NB" and nxt == "Node2_4_NB")
-                )
+                straight = (nxt == NET.straight_next.get(edge))
                 # 左轉判斷
-                left = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_4_NB") or
-                    (edge == "Node2_3_WB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_5_NB" and nxt == "Node1_2_WB")
-                )
-
-                if straight and lane == 2:
-                    traci.vehicle.changeLane(vid, 1, 3.0)
-                elif left and lane != 2:
-                    traci.vehicle.changeLane(vid, 2, 3.0)
+                left = (nxt == NET.left_next.get(edge))
+
+                if straight and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif left and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
             except Exception:
                 pass
 
@@ -115,20 +129,20 @@ def enforce_lane_discipline():
 def get_queues_and_halting():
     """讀取四個方向的 queue / halting，回傳 dict。"""
     # EB
-    q_EB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node1_2_EB_{i}") for i in range(3))
-    h_EB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node1_2_EB_{i}") for i in range(3))
+    q_EB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["EB"])
+    h_EB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["EB"])
 
     # SB
-    q_SB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_4_SB_{i}") for i in range(3))
-    h_SB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_4_SB_{i}") for i in range(3))
+    q_SB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["SB"])
+    h_SB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["SB"])
 
     # WB
-    q_WB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_3_WB_{i}") for i in range(3))
-    h_WB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_3_WB_{i}") for i in range(3))
+    q_WB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["WB"])
+    h_WB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["WB"])
 
     # NB
-    q_NB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_5_NB_{i}") for i in range(3))
-    h_NB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_5_NB_{i}") for i in range(3))
+    q_NB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["NB"])
+    h_NB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["NB"])
 
     return {
         "q_EB": q_EB, "h_EB": h_EB,
@@ -138,6 +152,15 @@ def get_queues_and_halting():
     }
 
 
+def read_pressure_inputs():
+    """逐車道的上游排隊（e2）與下游車道車輛數，供 PRESSURE.best_phase。"""
+    q_up = np.array([traci.lanearea.getLastStepVehicleNumber(det) if det else 0
+                     for det in PRESSURE.in_detectors], dtype=np.float64)
+    x_down = np.array([traci.lane.getLastStepVehicleNumber(lane) for lane in PRESSURE.out_lanes],
+                      dtype=np.float64)
+    return q_up, x_down
+
+
 def get_reward_from_halting(stats):
     """reward = - (全部停等車輛數)，目標：最小化停等時間。"""
     return -float(stats["h_EB"] + stats["h_SB"] + stats["h_WB"] + stats["h_NB"])
@@ -148,20 +171,37 @@ def get_reward_from_halting(stats):
 # -------------------------
 
 def main():
+    global traci
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
+    if MP_MODE not in MP_MODES:
+        sys.exit(f"TRACI_MP_MODE must be one of {MP_MODES}, got '{MP_MODE}'")
+    # 啟動 SUMO 前先依路口 foes 矩陣檢查相位計畫（衝突綠燈直接中止）
+    validate_plan(PLAN)
+
     traci.start(Sumo_config)
     try:
         traci.gui.setSchema("View #0", "real world")
     except Exception:
         pass
 
-    print("\n=== Starting Max-Pressure (Protected Left, 8 Phases) Simulation (1800 sec) ===\n")
+    print(f"\n=== Starting Max-Pressure (Protected Left, 8 Phases) Simulation ({SIM_TIME:.0f} sec) ===\n")
 
     # 初始狀態：先跑 NS group
-    current_group = "NS"  # 或 "EW"
-    current_phase_idx = NS_GROUP_PHASES[0]
+    current_group = NS_GROUP  # 或 EW_GROUP
+    current_phase_idx = int(PLAN.group_start[current_group])
     steps_in_phase = 0
+    target_phase = current_phase_idx    # movement 模式：黃燈結束後要進入的綠燈 phase
+    decisions = 0
+    decision_time = 0.0
+    bc_writer = open_writer("max_pressure") if MP_MODE == "group" else None
+    green_timer = ActuatedPhase(PLAN, NET, STEP_LENGTH) if MP_ACTUATED else None
+    zone = StopBarZone(traci, NET) if MP_ACTUATED else None
 
-    traci.trafficlight.setRedYellowGreenState(TLS_ID, PHASE_CYCLE[current_phase_idx]["state"])
+    traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
 
     # 統計變數
     sum_qEB = sum_qSB = 0.0
@@ -177,15 +217,22 @@ def main():
     eb_green_steps = 0
     sb_green_steps = 0
 
+    wall_start = time.perf_counter()
+    monitor = RunMonitor(TOTAL_STEPS, STEP_LENGTH)
+    tel = telemetry.start("max_pressure", STEP_LENGTH)
     for step in range(TOTAL_STEPS):
+        monitor.tick(step)
         # 每秒強制一次車道紀律
         if step % int(1.0 / STEP_LENGTH) == 0:
+            prof.mark("lane_discipline")
             enforce_lane_discipline()
 
         # 推進 SUMO
+        prof.mark("step")
         traci.simulationStep()
 
         # 讀取 queue / halting
+        prof.mark("observe")
         stats = get_queues_and_halting()
         q_EB = stats["q_EB"]
         q_SB = stats["q_SB"]
@@ -197,6 +244,7 @@ def main():
         h_NB = stats["h_NB"]
 
         # 累計
+        prof.mark("record")
         sum_qEB += q_EB
         sum_qSB += q_SB
         sum_hEB += h_EB
@@ -210,69 +258,93 @@ def main():
         cumulative_reward += reward
 
         # Phase 統計
-        phase_name = PHASE_CYCLE[current_phase_idx]["name"]
+        phase_name = PLAN.names[current_phase_idx]
         phase_counts[phase_name] += 1
 
         # 黃燈判斷
-        if current_phase_idx in [1, 3, 5, 7]:
+        if PLAN.is_yellow[current_phase_idx]:
             yellow_steps += 1
 
         # 綠燈比例：SB 看 NS Straight / NS Left；EB 看 EW Straight / EW Left
-        if current_phase_idx in [0, 2]:
+        if NS_GREEN[current_phase_idx]:
             sb_green_steps += 1
-        if current_phase_idx in [4, 6]:
+        if EW_GREEN[current_phase_idx]:
             eb_green_steps += 1
 
-        # 每 100 step 印一次
-        if step % 100 == 0:
+        if tel.due(step):
+            tel.observe(step, {"EB": q_EB, "SB": q_SB, "WB": q_WB, "NB": q_NB},
+                        current_phase_idx, phase_name, cumulative_reward=cumulative_reward,
+                        group_index=current_group)
+
+        # 每 PROGRESS_EVERY 模擬秒印一次
+        if step % PROGRESS_STEPS == 0:
             sim_time = step * STEP_LENGTH
             print(f"[t={sim_time:4.1f}s] Phase: {phase_name} | "
                   f"qEB={q_EB:3d}, qWB={q_WB:3d}, qSB={q_SB:3d}, qNB={q_NB:3d}")
 
         # 更新相位時間
+        prof.mark("decide")
         steps_in_phase += 1
-        phase_duration = PHASE_CYCLE[current_phase_idx]["duration"]
+        if green_timer is not None and green_timer.is_green(current_phase_idx):
+            phase_done = green_timer.poll(current_phase_idx, steps_in_phase, zone)
+        else:
+            phase_done = steps_in_phase >= PLAN.durations[current_phase_idx]
 
-        if steps_in_phase >= phase_duration:
+        if phase_done:
             # 結束當前 phase
             steps_in_phase = 0
 
+            if MP_MODE == "movement":
+                if PLAN.is_green[current_phase_idx]:
+                    # 綠燈結束：選壓力最大的綠燈 phase；相同就延長，不同就先進黃燈
+                    q_up, x_down = read_pressure_inputs()
+                    t_dec = time.perf_counter()
+                    target_phase = PRESSURE.best_phase(q_up, x_down)
+                    decision_time += time.perf_counter() - t_dec   # 只計矩陣運算
+                    decisions += 1
+                    if target_phase != current_phase_idx:
+                        nxt = int(PLAN.movement_next[current_phase_idx])
+                        current_phase_idx = nxt if PLAN.is_yellow[nxt] else target_phase
+                else:
+                    # 黃燈結束 → 進入選定的綠燈
+                    current_phase_idx = target_phase
             # 判斷是否為 group 結尾（NS Left (Y) or EW Left (Y)）
-            if current_phase_idx in [3, 7]:
+            elif PLAN.group_end[current_phase_idx]:
                 # 計算 NS / EW 壓力
                 q_NS = q_SB + q_NB
                 q_EW = q_EB + q_WB
 
                 if q_NS - q_EW > PRESSURE_DIFF_THRESHOLD:
-                    next_group = "NS"
+                    next_group = NS_GROUP
                 elif q_EW - q_NS > PRESSURE_DIFF_THRESHOLD:
-                    next_group = "EW"
+                    next_group = EW_GROUP
                 else:
                     # 壓力差不大 → 維持原 group
                     next_group = current_group
 
-                current_group = next_group
+                # behavior cloning 記錄（action 0 = 保持、1 = 切換，同 PPO）
+                if bc_writer is not None:
+                    bc_writer.append(read_state(traci, DETECTORS, current_phase_idx),
+                                     int(next_group != current_group))
 
-                if current_group == "NS":
-                    current_phase_idx = NS_GROUP_PHASES[0]
-                else:
-                    current_phase_idx = EW_GROUP_PHASES[0]
+                current_group = next_group
+                current_phase_idx = int(PLAN.group_start[current_group])
             else:
                 # group 內部，照順序跳下一個 phase
-                if current_group == "NS":
-                    group = NS_GROUP_PHASES
-                else:
-                    group = EW_GROUP_PHASES
-                pos = group.index(current_phase_idx)
-                next_pos = (pos + 1) % len(group)
-                current_phase_idx = group[next_pos]
+                current_phase_idx = int(PLAN.group_next[current_phase_idx])
 
             # 套用新 phase 的 RYG state
-            traci.trafficlight.setRedYellowGreenState(
-                TLS_ID, PHASE_CYCLE[current_phase_idx]["state"]
-            )
+            prof.mark("actuate")
+            traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
 
+    prof.mark("teardown")
+    monitor.finish()
+    tel.finish()
+    wall_time = time.perf_counter() - wall_start
     traci.close()
+    if bc_writer is not None:
+        bc_writer.close()
+        print(f"behavior cloning: {bc_writer.total} (state, action) pairs → {bc_writer.out_dir}")
     print("\nSimulation completed.\n")
 
     # ====== 統計結果輸出（Max-Pressure Summary 格式） ======
@@ -323,8 +395,48 @@ def main():
     print(f"Avg Delay Time      = {avg_delay_time:.2f} sec/veh")
     print(f"Total Waiting Time  = {total_waiting_time:.2f} veh·sec")
     print(f"Cumulative reward   = {cumulative_reward:.2f}")
+    if green_timer is not None:
+        print(f"Gap-out / Max-out   = {green_timer.gap_outs} / {green_timer.max_outs}")
     print("========================================================================\n")
 
+    if RECORD_RESULTS:
+        summary = {
+            "avg_qEB": avg_qEB, "avg_qSB": avg_qSB,
+            "avg_hEB": avg_hEB, "avg_hSB": avg_hSB,
+            "avg_queue_total": avg_queue_total,
+            "eb_green_ratio": eb_green_ratio, "sb_green_ratio": sb_green_ratio,
+            "yellow_ratio": yellow_ratio,
+            "total_arrived": total_arrived_vehicles,
+            "avg_delay_time": avg_delay_time,
+            "total_waiting_time": total_waiting_time,
+            "cumulative_reward": cumulative_reward,
+        }
+        summary.update(monitor.summary())
+        config = {
+            "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+            "phase_cycle": PHASE_CYCLE,
+            "pressure_diff_threshold": PRESSURE_DIFF_THRESHOLD,
+        }
+        controller = "max_pressure"
+        if MP_MODE == "movement":
+            controller = "max_pressure_movement"
+            summary["decisions"] = decisions
+            summary["decision_us_mean"] = decision_time / decisions * 1e6 if decisions else 0.0
+            config = {
+                "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+                "phase_cycle": PHASE_CYCLE, "mp_mode": MP_MODE,
+            }
+        if green_timer is not None:
+            summary["gap_outs"] = green_timer.gap_outs
+            summary["max_outs"] = green_timer.max_outs
+            config["green_actuated"] = {"min_green": green_timer.min_green.tolist(),
+                                        "max_green": green_timer.max_green.tolist(),
+                                        "gap": green_timer.gap, "stopbar_zone": zone.zone}
+        results_store.record_run(
+            controller, summary, config, seed=SEED, wall_time=wall_time,
+            sim_steps=total_steps, run_id=RUN_ID, scenario=SCENARIO,
+        )
+
 
 if __name__ == "__main__":
     main()
@@ -5,125 +5,89 @@ Webster Fixed-Time Control (Protected Left, via RYG States)
 - 固定時制號誌控制（Webster 設定）
 - 與 PPO / Max-Pressure 使用相同的 PHASE_CYCLE（含左轉保護）
 - 目標式：最小停等時間（以統計指標比較）
+- TRACI_WEBSTER_MODE=offline：啟動前由 route 檔需求求解 Webster 週期與綠燈
+  （webster_solver.py，依情境 hash 快取），整段模擬使用該計畫
+- TRACI_WEBSTER_MODE=adaptive：每秒以 e2 偵測器計數估計各車道流量（滾動視窗），
+  每 RECOMPUTE_EVERY 個週期依 Webster 公式重算週期與綠燈分配（見 webster.py），
+  流量比變化超過門檻才換上新計畫，不需重啟模擬
 """
 
 import os
 import sys
+import time
 from collections import defaultdict
 
+import numpy as np
+
+import profiling
+import results_store
+import telemetry
+import webster
+import webster_solver
+from phase_plan import DEFAULT_PLAN
+from phase_conflicts import validate_plan
+from network_index import load_index
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, PROGRESS_EVERY, ROUTE_FILE
+from metrics import RunMonitor
+
 # -------------------------
 # SUMO / TraCI 初始化
 # -------------------------
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-if 'SUMO_HOME' in os.environ:
-    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-    sys.path.append(tools)
-else:
-    sys.exit("Please declare environment variable 'SUMO_HOME'")
-
-import traci  # noqa: E402
+# traci 於 main() 才載入（需要 SUMO_HOME）
+traci = None
 
 sumocfg_path = os.path.join(SCRIPT_DIR, 'Traci.sumocfg')
-if not os.path.exists(sumocfg_path):
-    sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}，請確認檔名與位置是否正確。")
 
 STEP_LENGTH = 0.10
-SIM_TIME = 1800.0
 TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+PROGRESS_STEPS = max(1, int(round(PROGRESS_EVERY / STEP_LENGTH)))   # 進度列印間隔（步）
 
 Sumo_config = [
-    'sumo-gui',
+    SUMO_BINARY,
     '-c', sumocfg_path,
     '--step-length', str(STEP_LENGTH),
     '--delay', '0',
     '--lateral-resolution', '0',
-    '--end', str(int(SIM_TIME))
+    '--end', str(int(SIM_TIME)),
+    *SUMO_EXTRA_ARGS
 ]
 
-TLS_ID = "Node2"
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+DETECTORS = None   # approach → 每條車道的 e2 id
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID / DETECTORS。"""
+    global NET, TLS_ID, DETECTORS
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+        DETECTORS = NET.approach_detectors
+    return NET
+
 
 # -------------------------
 # Webster 固定時制：保護左轉 8 相位
 # -------------------------
-# 這裡的 duration 單位是「step」，1 step = 0.1 秒
-# 對應你原本固定時制程式：
-#   NS 直行 G: 30s → 300 steps
-#   NS 直行 Y:  3s →  30 steps
-#   NS 左轉 G: 15s → 150 steps
-#   NS 左轉 Y:  3s →  30 steps
-#   EW 直行 G: 30s → 300 steps
-#   EW 直行 Y:  3s →  30 steps
-#   EW 左轉 G: 15s → 150 steps
-#   EW 左轉 Y:  3s →  30 steps
-
-PHASE_CYCLE = [
-    {
-        "name": "NS Straight",
-        "state": "GGGGrrrrrrGGGGrrrrrr",
-        "group": "NS",
-        "is_green": True,
-        "is_yellow": False,
-        "duration": 300,
-    },
-    {
-        "name": "NS Straight (Y)",
-        "state": "yyyyrrrrrryyyyrrrrrr",
-        "group": "NS",
-        "is_green": False,
-        "is_yellow": True,
-        "duration": 30,
-    },
-    {
-        "name": "NS Left",
-        "state": "rrrrGrrrrrrrrrGrrrrr",
-        "group": "NS",
-        "is_green": True,
-        "is_yellow": False,
-        "duration": 150,
-    },
-    {
-        "name": "NS Left (Y)",
-        "state": "rrrryrrrrrrrrryrrrrr",
-        "group": "NS",
-        "is_green": False,
-        "is_yellow": True,
-        "duration": 30,
-    },
-    {
-        "name": "EW Straight",
-        "state": "rrrrrGGGGrrrrrGGGGrr",
-        "group": "EW",
-        "is_green": True,
-        "is_yellow": False,
-        "duration": 300,
-    },
-    {
-        "name": "EW Straight (Y)",
-        "state": "rrrrryyyyrrrrryyyyrr",
-        "group": "EW",
-        "is_green": False,
-        "is_yellow": True,
-        "duration": 30,
-    },
-    {
-        "name": "EW Left",
-        "state": "rrrrrrrrrGrrrrrrrrrG",
-        "group": "EW",
-        "is_green": True,
-        "is_yellow": False,
-        "duration": 150,
-    },
-    {
-        "name": "EW Left (Y)",
-        "state": "rrrrrrrrryrrrrrrrrry",
-        "group": "EW",
-        "is_green": False,
-        "is_yellow": True,
-        "duration": 30,
-    },
-]
+# duration 單位是「step」，1 step = 0.1 秒；定義與編譯見 phase_plan.py
+
+PLAN = DEFAULT_PLAN
+PHASE_CYCLE = PLAN.phases
+
+# 綠燈比例：EW 算 EB 綠燈，NS 算 SB 綠燈
+EW_GREEN = PLAN.group_green("EW")
+NS_GREEN = PLAN.group_green("NS")
+
+# fixed：PLAN 原樣循環；offline：由 route 檔求解；adaptive：線上重算 Webster 時制
+WEBSTER_MODE = os.environ.get("TRACI_WEBSTER_MODE", "fixed")
+WEBSTER_MODES = ("fixed", "offline", "adaptive")
 
 # -------------------------
 # 統計變數（比照 Max-Pressure / PPO）
@@ -155,7 +119,7 @@ def enforce_lane_discipline():
     - 直行車不在左轉車道
     - 左轉車導向左轉車道
     """
-    edges = ["Node1_2_EB", "Node2_3_WB", "Node2_4_SB", "Node2_5_NB"]
+    edges = NET.in_edges
     for edge in edges:
         veh_ids = traci.edge.getLastStepVehicleIDs(edge)
         for vid in veh_ids:
@@ -176,25 +140,15 @@ def enforce_lane_discipline():
                 lane = traci.vehicle.getLaneIndex(vid)
 
                 # 直行判斷
-                straight = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_3_WB" and nxt == "Node1_2_WB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_5_NB" and nxt == "Node2_4_NB")
-                )
+                straight = (nxt == NET.straight_next.get(edge))
 
                 # 左轉判斷
-                left = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_4_NB") or
-                    (edge == "Node2_3_WB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_5_NB" and nxt == "Node1_2_WB")
-                )
-
-                if straight and lane == 2:
-                    traci.vehicle.changeLane(vid, 1, 3.0)
-                elif left and lane != 2:
-                    traci.vehicle.changeLane(vid, 2, 3.0)
+                left = (nxt == NET.left_next.get(edge))
+
+                if straight and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif left and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
 
             except Exception:
                 pass
@@ -205,24 +159,24 @@ def get_state():
     讀取 EB / SB 的排隊與停等（與 Max-Pressure / PPO 對齊）
     """
     # EB queue
-    q_EB_0 = traci.lanearea.getLastStepVehicleNumber("Node1_2_EB_0")
-    q_EB_1 = traci.lanearea.getLastStepVehicleNumber("Node1_2_EB_1")
-    q_EB_2 = traci.lanearea.getLastStepVehicleNumber("Node1_2_EB_2")
+    q_EB_0 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["EB"][0])
+    q_EB_1 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["EB"][1])
+    q_EB_2 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["EB"][2])
 
     # SB queue
-    q_SB_0 = traci.lanearea.getLastStepVehicleNumber("Node2_4_SB_0")
-    q_SB_1 = traci.lanearea.getLastStepVehicleNumber("Node2_4_SB_1")
-    q_SB_2 = traci.lanearea.getLastStepVehicleNumber("Node2_4_SB_2")
+    q_SB_0 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["SB"][0])
+    q_SB_1 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["SB"][1])
+    q_SB_2 = traci.lanearea.getLastStepVehicleNumber(DETECTORS["SB"][2])
 
     # EB halting
-    h_EB_0 = traci.lanearea.getLastStepHaltingNumber("Node1_2_EB_0")
-    h_EB_1 = traci.lanearea.getLastStepHaltingNumber("Node1_2_EB_1")
-    h_EB_2 = traci.lanearea.getLastStepHaltingNumber("Node1_2_EB_2")
+    h_EB_0 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["EB"][0])
+    h_EB_1 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["EB"][1])
+    h_EB_2 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["EB"][2])
 
     # SB halting
-    h_SB_0 = traci.lanearea.getLastStepHaltingNumber("Node2_4_SB_0")
-    h_SB_1 = traci.lanearea.getLastStepHaltingNumber("Node2_4_SB_1")
-    h_SB_2 = traci.lanearea.getLastStepHaltingNumber("Node2_4_SB_2")
+    h_SB_0 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["SB"][0])
+    h_SB_1 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["SB"][1])
+    h_SB_2 = traci.lanearea.getLastStepHaltingNumber(DETECTORS["SB"][2])
 
     q_EB = q_EB_0 + q_EB_1 + q_EB_2
     q_SB = q_SB_0 + q_SB_1 + q_SB_2
@@ -232,6 +186,25 @@ def get_state():
     return q_EB, q_SB, h_EB, h_SB
 
 
+def approach_queues():
+    """四個 approach 的 e2 排隊車數（telemetry 用；get_state 只讀 EB / SB）。"""
+    return {a: sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS[a])
+            for a in ("EB", "SB", "WB", "NB")}
+
+
+def count_new_vehicles(prev_ids, counts):
+    """
+    每條受控車道的 e2 上新出現的車輛數累加到 counts（與上次取樣比較 id）。
+    每秒取樣一次即可：車輛通過 150 m 偵測器需數秒。
+    """
+    for k, det in enumerate(NET.detector_ids):
+        if det is None:
+            continue
+        ids = set(traci.lanearea.getLastStepVehicleIDs(det))
+        counts[k] += len(ids - prev_ids[k])
+        prev_ids[k] = ids
+
+
 def get_reward(q_EB, q_SB):
     """
     reward = - (EB + SB 總排隊車數)
@@ -248,29 +221,66 @@ def main():
     global sum_qEB, sum_qSB, sum_hEB, sum_hSB, sum_halting
     global yellow_steps, total_arrived_vehicles, total_steps
     global eb_green_steps, sb_green_steps, cumulative_reward
+    global traci
+
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}，請確認檔名與位置是否正確。")
+    if WEBSTER_MODE not in WEBSTER_MODES:
+        sys.exit(f"TRACI_WEBSTER_MODE must be one of {WEBSTER_MODES}, got '{WEBSTER_MODE}'")
+    plan = PLAN
+    if WEBSTER_MODE == "offline":
+        plan, solved = webster_solver.solve_routes(ROUTE_FILE or webster_solver.ROUTE_FILE,
+                                                   PLAN, NET, step_length=STEP_LENGTH)
+        print(f"Webster (offline): C={solved['cycle']:.0f}s Y={solved['Y']:.2f} "
+              f"greens={', '.join(f'{g:.0f}' for g in solved['greens'])} "
+              f"(design window {solved['window'][0]:.0f}-{solved['window'][1]:.0f}s)")
+
+    # 啟動 SUMO 前先依路口 foes 矩陣檢查相位計畫（衝突綠燈直接中止）
+    validate_plan(plan)
+
+    adaptive = None
+    if WEBSTER_MODE == "adaptive":
+        adaptive = webster.AdaptiveWebster(PLAN, NET, STEP_LENGTH)
+        lane_counts = np.zeros(len(NET.lanes))
+        prev_ids = [set() for _ in NET.lanes]
+        cycle_start = 0
 
     traci.start(Sumo_config)
-    traci.gui.setSchema("View #0", "real world")
+    try:
+        traci.gui.setSchema("View #0", "real world")
+    except Exception:
+        pass
 
-    print("\n=== Starting Webster Fixed-Time Control (Protected Left, 1800 sec) ===\n")
+    print(f"\n=== Starting Webster Fixed-Time Control (Protected Left, {SIM_TIME:.0f} sec) ===\n")
 
     current_phase_idx = 0
     phase_elapsed = 0
 
     # 設定初始相位
-    traci.trafficlight.setRedYellowGreenState(
-        TLS_ID, PHASE_CYCLE[current_phase_idx]["state"]
-    )
+    traci.trafficlight.setRedYellowGreenState(TLS_ID, plan.states[current_phase_idx])
 
+    wall_start = time.perf_counter()
+    monitor = RunMonitor(TOTAL_STEPS, STEP_LENGTH)
+    tel = telemetry.start("webster", STEP_LENGTH)
     for step in range(TOTAL_STEPS):
+        monitor.tick(step)
         # 每 1 秒執行一次車道紀律
         if step % int(1.0 / STEP_LENGTH) == 0:
+            prof.mark("lane_discipline")
             enforce_lane_discipline()
+            if adaptive is not None:
+                prof.mark("observe")
+                count_new_vehicles(prev_ids, lane_counts)
 
         # 讀取狀態
+        prof.mark("observe")
         q_EB, q_SB, h_EB, h_SB = get_state()
 
         # 統計
+        prof.mark("record")
         sum_qEB += q_EB
         sum_qSB += q_SB
         sum_hEB += h_EB
@@ -280,17 +290,14 @@ def main():
         total_arrived_vehicles += traci.simulation.getArrivedNumber()
         total_steps += 1
 
-        phase_info = PHASE_CYCLE[current_phase_idx]
-
         # 綠燈比例：EW 算 EB 綠燈，NS 算 SB 綠燈
-        if phase_info["is_green"]:
-            if phase_info["group"] == "EW":
-                eb_green_steps += 1
-            elif phase_info["group"] == "NS":
-                sb_green_steps += 1
+        if EW_GREEN[current_phase_idx]:
+            eb_green_steps += 1
+        elif NS_GREEN[current_phase_idx]:
+            sb_green_steps += 1
 
         # 黃燈步數
-        if phase_info["is_yellow"]:
+        if PLAN.is_yellow[current_phase_idx]:
             yellow_steps += 1
 
         # Phase 使用比例
@@ -300,26 +307,45 @@ def main():
         reward = get_reward(q_EB, q_SB)
         cumulative_reward += reward
 
-        # 每 100 step 印一次狀態
-        if step % 100 == 0:
+        if tel.due(step):
+            tel.observe(step, approach_queues(), current_phase_idx,
+                        PLAN.names[current_phase_idx], cumulative_reward=cumulative_reward)
+
+        # 每 PROGRESS_EVERY 模擬秒印一次狀態
+        if step % PROGRESS_STEPS == 0:
             sim_time = step * STEP_LENGTH
             print(
-                f"[t={sim_time:4.1f}s] Phase: {PHASE_CYCLE[current_phase_idx]['name']} | "
+                f"[t={sim_time:4.1f}s] Phase: {PLAN.names[current_phase_idx]} | "
                 f"qEB={q_EB:3d}, qSB={q_SB:3d} | hEB={h_EB:3d}, hSB={h_SB:3d}"
             )
 
         # 時制邏輯：固定時間到就切換下一個 phase（Webster）
+        prof.mark("decide")
         phase_elapsed += 1
-        if phase_elapsed >= PHASE_CYCLE[current_phase_idx]["duration"]:
-            current_phase_idx = (current_phase_idx + 1) % len(PHASE_CYCLE)
+        if phase_elapsed >= plan.durations[current_phase_idx]:
+            current_phase_idx = int(plan.next_phase[current_phase_idx])
             phase_elapsed = 0
-            traci.trafficlight.setRedYellowGreenState(
-                TLS_ID, PHASE_CYCLE[current_phase_idx]["state"]
-            )
+            # 週期結束：自適應模式更新流量視窗，必要時換上新的 duration
+            if adaptive is not None and current_phase_idx == 0:
+                new_plan = adaptive.end_cycle(lane_counts, (step + 1 - cycle_start) * STEP_LENGTH)
+                lane_counts[:] = 0.0
+                cycle_start = step + 1
+                if new_plan is not None:
+                    plan = new_plan
+                    t = adaptive.timing
+                    print(f"[t={(step + 1) * STEP_LENGTH:4.1f}s] Webster update: C={t.cycle:.0f}s "
+                          f"Y={t.Y:.2f} greens={', '.join(f'{g:.0f}' for g in t.greens)}")
+            prof.mark("actuate")
+            traci.trafficlight.setRedYellowGreenState(TLS_ID, plan.states[current_phase_idx])
 
         # 推進 SUMO 一步
+        prof.mark("step")
         traci.simulationStep()
 
+    prof.mark("teardown")
+    monitor.finish()
+    tel.finish()
+    wall_time = time.perf_counter() - wall_start
     traci.close()
     print("\nSimulation completed.\n")
 
@@ -365,7 +391,7 @@ def main():
     print("各時相比例 (Phase Ratios):")
     for p_idx in sorted(phase_counts.keys()):
         ratio = phase_counts[p_idx] / total_steps
-        print(f"  Phase {p_idx} ({PHASE_CYCLE[p_idx]['name']}): {ratio:.2f}")
+        print(f"  Phase {p_idx} ({PLAN.names[p_idx]}): {ratio:.2f}")
     print("")
     print(f"Total Arrived Veh   = {total_arrived_vehicles}")
     print(f"Avg Delay Time      = {avg_delay_time:.2f} sec/veh")
@@ -373,6 +399,46 @@ def main():
     print(f"Cumulative reward   = {cumulative_reward:.2f}")
     print("========================================================================\n")
 
+    if RECORD_RESULTS:
+        summary = {
+            "avg_qEB": avg_qEB, "avg_qSB": avg_qSB,
+            "avg_hEB": avg_hEB, "avg_hSB": avg_hSB,
+            "avg_queue_total": avg_queue_total,
+            "eb_green_ratio": eb_green_ratio, "sb_green_ratio": sb_green_ratio,
+            "yellow_ratio": yellow_ratio,
+            "total_arrived": total_arrived_vehicles,
+            "avg_delay_time": avg_delay_time,
+            "total_waiting_time": total_waiting_time,
+            "cumulative_reward": cumulative_reward,
+        }
+        summary.update(monitor.summary())
+        config = {
+            "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+            "phase_cycle": PHASE_CYCLE,
+        }
+        controller = "webster"
+        if WEBSTER_MODE == "offline":
+            controller = "webster_offline"
+            summary["cycle"] = plan.cycle_steps * STEP_LENGTH
+            config.update({
+                "phase_cycle": plan.phases, "solver_key": solved["key"],
+                "sat_flow": webster.SAT_FLOW, "lost_per_stage": webster.LOST_PER_STAGE,
+            })
+        if adaptive is not None:
+            controller = "webster_adaptive"
+            summary["webster_updates"] = adaptive.updates
+            summary["final_cycle"] = plan.cycle_steps * STEP_LENGTH
+            config.update({
+                "sat_flow": webster.SAT_FLOW, "lost_per_stage": webster.LOST_PER_STAGE,
+                "window_cycles": webster.WINDOW_CYCLES,
+                "recompute_every": webster.RECOMPUTE_EVERY,
+                "ratio_threshold": webster.RATIO_THRESHOLD,
+            })
+        results_store.record_run(
+            controller, summary, config, seed=SEED, wall_time=wall_time,
+            sim_steps=total_steps, run_id=RUN_ID, scenario=SCENARIO,
+        )
+
 
 if __name__ == "__main__":
     main()
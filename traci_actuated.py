@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Actuated Control (Protected Left, min/max green + gap-out, 1 s resolution)
+
+- 與其他控制器相同的 8 相位計畫（含左轉保護），綠燈長度改由偵測器決定（見 actuated.py）
+- 所有 e2 一次 subscribe（車輛數 / 停等數 / 車輛 id），結果隨 simulationStep 一起回傳，
+  每步統計不再逐一呼叫 getLastStep*
+- 控制邏輯每 1 秒（10 steps）評估一次：未達最短綠燈不切換、gap-out / max-out 才結束綠燈；
+  gap-out 只看目前綠燈車道停止線前 TRACI_ACT_ZONE 公尺（預設 30 m）內有沒有車
+- TRACI_ACTUATED_NEXT=pressure：黃燈後的下一個綠燈改由 Max-Pressure 決定（pressure.py），
+  預設 cycle 為依序跳過沒有車的階段
+- 額外回報控制開銷（每模擬小時的控制耗時）與 gap-out / max-out 次數
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import profiling
+import results_store
+import telemetry
+from actuated import ActuatedController, StopBarZone, ACT_MIN_GREEN, ACT_MAX_FACTOR, ACT_GAP, ACT_ZONE
+from phase_plan import DEFAULT_PLAN
+from phase_conflicts import validate_plan
+from network_index import load_index
+from pressure import build_pressure_model
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, PROGRESS_EVERY
+from metrics import RunMonitor
+
+# -------------------------
+# SUMO / TraCI 初始化
+# -------------------------
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# traci 於 main() 才載入（需要 SUMO_HOME）
+traci = None
+
+sumocfg_path = os.path.join(SCRIPT_DIR, 'Traci.sumocfg')
+
+STEP_LENGTH = 0.10
+TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+PROGRESS_STEPS = max(1, int(round(PROGRESS_EVERY / STEP_LENGTH)))   # 進度列印間隔（步）
+DECISION_STEPS = int(round(1.0 / STEP_LENGTH))                       # 控制評估間隔（1 秒）
+
+Sumo_config = [
+    SUMO_BINARY,
+    '-c', sumocfg_path,
+    '--step-length', str(STEP_LENGTH),
+    '--delay', '0',
+    '--lateral-resolution', '0',
+    *SUMO_EXTRA_ARGS
+]
+
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+DETECTORS = None   # approach → 每條車道的 e2 id
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID / DETECTORS。"""
+    global NET, TLS_ID, DETECTORS
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+        DETECTORS = NET.approach_detectors
+    return NET
+
+
+PLAN = DEFAULT_PLAN
+PHASE_CYCLE = PLAN.phases
+
+# cycle：依序跳過沒車的階段；pressure：Max-Pressure 決定下一個綠燈
+ACTUATED_NEXT = os.environ.get("TRACI_ACTUATED_NEXT", "cycle")
+ACTUATED_NEXT_MODES = ("cycle", "pressure")
+
+
+# -------------------------
+# 工具函式
+# -------------------------
+
+def enforce_lane_discipline():
+    """
+    - 直行車不在左轉車道
+    - 左轉車導向左轉車道
+    """
+    for edge in NET.in_edges:
+        for vid in traci.edge.getLastStepVehicleIDs(edge):
+            try:
+                route = traci.vehicle.getRoute(vid)
+                cur_idx = route.index(edge)
+                if cur_idx + 1 >= len(route):
+                    continue
+                nxt = route[cur_idx + 1]
+                lane = traci.vehicle.getLaneIndex(vid)
+                if nxt == NET.straight_next.get(edge) and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif nxt == NET.left_next.get(edge) and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
+            except Exception:
+                pass
+
+
+def pressure_chooser():
+    """回傳 choose_next(vehicles)：上游用 subscription 的車道車輛數，下游讀 traci.lane。"""
+    model = build_pressure_model(PLAN, NET)
+
+    def choose(vehicles):
+        x_down = np.array([traci.lane.getLastStepVehicleNumber(lane) for lane in model.out_lanes],
+                          dtype=np.float64)
+        return model.best_phase(vehicles, x_down)
+    return choose
+
+
+# -------------------------
+# 主程式
+# -------------------------
+
+def main():
+    global traci
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
+    if ACTUATED_NEXT not in ACTUATED_NEXT_MODES:
+        sys.exit(f"TRACI_ACTUATED_NEXT 必須是 {ACTUATED_NEXT_MODES} 之一: {ACTUATED_NEXT}")
+    validate_plan(PLAN)
+    tc = traci.constants
+
+    controller = ActuatedController(
+        PLAN, NET, STEP_LENGTH, min_green=ACT_MIN_GREEN, max_green_factor=ACT_MAX_FACTOR,
+        gap=ACT_GAP,
+        choose_next=pressure_chooser() if ACTUATED_NEXT == "pressure" else None,
+    )
+
+    # 統計變數（與固定時制相同的 approach 分項）
+    approaches = ("EB", "SB", "WB", "NB")
+    sum_q = dict.fromkeys(approaches, 0.0)
+    sum_h = dict.fromkeys(approaches, 0.0)
+    sum_halting = 0.0
+    total_arrived_vehicles = 0
+    total_steps = 0
+    cumulative_reward = 0.0
+    phase_counts = defaultdict(int)
+    control_time = 0.0
+    decisions = 0
+
+    traci.start(Sumo_config)
+    try:
+        traci.gui.setSchema("View #0", "real world")
+    except Exception:
+        pass
+
+    # 所有 e2 一次訂閱；之後每步只讀本地的 subscription 結果
+    VARS = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER, tc.LAST_STEP_VEHICLE_ID_LIST)
+    all_dets = sorted({d for dets in DETECTORS.values() for d in dets} |
+                      {d for d in NET.detector_ids if d})
+    for det in all_dets:
+        traci.lanearea.subscribe(det, VARS)
+    lane_dets = [(k, det) for k, det in enumerate(NET.detector_ids) if det]
+    vehicles = np.zeros(len(NET.lanes), dtype=np.float64)
+    zone = StopBarZone(traci, NET, ACT_ZONE)
+
+    print("\n" + "="*70)
+    print(f"Starting Actuated Control Simulation ({SIM_TIME:.0f} sec, "
+          f"min {ACT_MIN_GREEN:.0f}s / gap {ACT_GAP:.0f}s / max ×{ACT_MAX_FACTOR:g}, next={ACTUATED_NEXT})")
+    print("="*70 + "\n")
+
+    current_phase_idx = controller.phase
+    traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
+
+    wall_start = time.perf_counter()
+    monitor = RunMonitor(TOTAL_STEPS, STEP_LENGTH)
+    tel = telemetry.start("actuated", STEP_LENGTH)
+    for step in range(TOTAL_STEPS):
+        monitor.tick(step)
+        prof.mark("step")
+        traci.simulationStep()
+        prof.mark("observe")
+        res = traci.lanearea.getAllSubscriptionResults()
+
+        # 每 1 秒評估一次感應式邏輯
+        if step % DECISION_STEPS == 0:
+            prof.mark("lane_discipline")
+            enforce_lane_discipline()
+            prof.mark("decide")
+            t0 = time.perf_counter()
+            for k, det in lane_dets:
+                vehicles[k] = res[det][VARS[0]]
+            occupied = zone.occupied(controller.green_lanes(), lambda d: res[d][VARS[2]])
+            new_phase = controller.update(occupied, vehicles, DECISION_STEPS * STEP_LENGTH)
+            if new_phase is not None:
+                prof.mark("actuate")
+                current_phase_idx = new_phase
+                traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
+            control_time += time.perf_counter() - t0
+            decisions += 1
+
+        # 收集統計數據
+        prof.mark("record")
+        q = {a: sum(res[d][VARS[0]] for d in DETECTORS[a]) for a in approaches}
+        h = {a: sum(res[d][VARS[1]] for d in DETECTORS[a]) for a in approaches}
+        for a in approaches:
+            sum_q[a] += q[a]
+            sum_h[a] += h[a]
+        halting = sum(h.values())
+        sum_halting += halting
+        total_steps += 1
+        total_arrived_vehicles += traci.simulation.getArrivedNumber()
+        cumulative_reward += -halting
+        phase_counts[PLAN.names[current_phase_idx]] += 1
+
+        if tel.due(step):
+            tel.observe(step, q, current_phase_idx, PLAN.names[current_phase_idx],
+                        cumulative_reward=cumulative_reward, decisions_total=decisions,
+                        gap_outs_total=controller.gap_outs, max_outs_total=controller.max_outs,
+                        control_seconds_total=control_time)
+
+        if step % PROGRESS_STEPS == 0:
+            sim_time = step * STEP_LENGTH
+            print(f"[t={sim_time:4.1f}s] Phase: {PLAN.names[current_phase_idx]} | "
+                  f"qEB={q['EB']:3d}, qWB={q['WB']:3d}, qSB={q['SB']:3d}, qNB={q['NB']:3d}")
+
+    prof.mark("teardown")
+    monitor.finish()
+    tel.finish()
+    wall_time = time.perf_counter() - wall_start
+    print("\nSimulation completed.\n")
+
+    # ====== 統計結果輸出 ======
+    n = max(total_steps, 1)
+    avg_q = {a: sum_q[a] / n for a in approaches}
+    avg_h = {a: sum_h[a] / n for a in approaches}
+    avg_queue_total = sum(sum_q.values()) / n
+    total_waiting_time = sum_halting * STEP_LENGTH
+    avg_delay_time = total_waiting_time / total_arrived_vehicles if total_arrived_vehicles > 0 else 0.0
+    sim_hours = total_steps * STEP_LENGTH / 3600.0
+    overhead_per_hour = control_time / sim_hours if sim_hours > 0 else 0.0
+    greens = controller.green_seconds
+
+    print("\n=== Phase Proportions ===")
+    for name, cnt in phase_counts.items():
+        print(f"{name}: {cnt / n * 100:.2f}% ({cnt} steps)")
+
+    print("\n========== Actuated Traffic Signal Summary (Protected Left) ==========")
+    for a in ("EB", "WB", "SB", "NB"):
+        print(f"{a} 平均排隊 (Queue) = {avg_q[a]:.2f} veh")
+    print(f"Total Avg Queue     = {avg_queue_total:.2f} veh")
+    for a in ("EB", "WB", "SB", "NB"):
+        print(f"{a} 平均停等 (Halt)  = {avg_h[a]:.2f} veh")
+    print("")
+    print(f"Total Arrived Veh   = {total_arrived_vehicles}")
+    print(f"Avg Delay Time      = {avg_delay_time:.2f} sec/veh")
+    print(f"Total Waiting Time  = {total_waiting_time:.2f} veh·sec")
+    print(f"Cumulative reward   = {cumulative_reward:.2f}")
+    print(f"Gap-out / Max-out   = {controller.gap_outs} / {controller.max_outs}")
+    if greens:
+        print(f"Mean green (last {len(greens)}) = {np.mean(greens):.1f} s")
+    print(f"Control overhead    = {overhead_per_hour * 1e3:.1f} ms per simulated hour "
+          f"({decisions} decisions, {control_time / max(wall_time, 1e-9) * 100:.2f}% of wall time)")
+    print("=====================================================================\n")
+
+    if RECORD_RESULTS:
+        summary = {f"avg_q{a}": avg_q[a] for a in ("EB", "WB", "SB", "NB")}
+        summary.update({f"avg_h{a}": avg_h[a] for a in ("EB", "WB", "SB", "NB")})
+        summary.update({
+            "avg_queue_total": avg_queue_total,
+            "total_arrived": total_arrived_vehicles,
+            "avg_delay_time": avg_delay_time,
+            "total_waiting_time": total_waiting_time,
+            "cumulative_reward": cumulative_reward,
+            "gap_outs": controller.gap_outs,
+            "max_outs": controller.max_outs,
+            "decisions": decisions,
+            "control_overhead_s_per_sim_hour": overhead_per_hour,
+        })
+        summary.update(monitor.summary())
+        config = {
+            "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+            "phase_cycle": PHASE_CYCLE,
+            "min_green": ACT_MIN_GREEN, "max_green_factor": ACT_MAX_FACTOR,
+            "gap": ACT_GAP, "stopbar_zone": ACT_ZONE, "next": ACTUATED_NEXT,
+            "decision_interval": DECISION_STEPS * STEP_LENGTH,
+        }
+        results_store.record_run(
+            "actuated", summary, config, seed=SEED, wall_time=wall_time,
+            sim_steps=total_steps, run_id=RUN_ID, scenario=SCENARIO,
+        )
+
+    traci.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+MPC Control (Protected Left, SUMO lookahead in parallel workers)
+
+- 每個綠燈結束時（決策點）主模擬 saveState 到 tmpfs（/dev/shm），
+  每個候選 movement（NS_STRAIGHT / NS_LEFT / EW_STRAIGHT / EW_LEFT）交給一個 worker SUMO：
+  loadState → 執行「（黃燈）→ 候選綠燈 → 之後照 PHASE_CYCLE」HORIZON 秒 → 回報停等總量
+- 選預測停等最少的 movement；與目前相同就延長綠燈，不同就先進黃燈（同 Max-Pressure movement 模式）
+- worker 是各自獨立的 SUMO process，每個 worker 一條 TraCI 連線、一個 thread，
+  lookahead 以 1 秒為單位 simulationStep(t) 跳躍、停等數由 subscription 取得，減少來回次數
+- 另外回報每次決策的 lookahead 耗時與「lookahead wall time / 預測的模擬時間」比例
+
+環境變數：
+- TRACI_MPC_HORIZON : 預測長度（秒），預設 45
+- TRACI_MPC_WORKERS : worker SUMO 數量，預設 4（= 候選數）
+- TRACI_MPC_WORKER_BINARY : worker 用的 SUMO 執行檔，預設 sumo（headless）
+
+worker 的 e2 等輸出寫到 runs/mpc-<run_id>/w<k>_*（相對 prefix，SUMO 會接在各輸出檔的資料夾之後），
+結束時連同快照一起刪除，不覆蓋主模擬的輸出。
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import profiling
+import results_store
+import telemetry
+from phase_plan import DEFAULT_PLAN
+from phase_conflicts import validate_plan
+from network_index import load_index
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, PROGRESS_EVERY, ROUTE_FILE
+from metrics import RunMonitor, RunningStats
+
+# -------------------------
+# SUMO / TraCI 初始化
+# -------------------------
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# traci 於 main() 才載入（需要 SUMO_HOME）
+traci = None
+
+sumocfg_path = os.path.join(SCRIPT_DIR, 'Traci.sumocfg')
+
+STEP_LENGTH = 0.10
+TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+PROGRESS_STEPS = max(1, int(round(PROGRESS_EVERY / STEP_LENGTH)))   # 進度列印間隔（步）
+
+Sumo_config = [
+    SUMO_BINARY,
+    '-c', sumocfg_path,
+    '--step-length', str(STEP_LENGTH),
+    '--delay', '0',
+    '--lateral-resolution', '0',
+    *SUMO_EXTRA_ARGS
+]
+
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+DETECTORS = None   # approach → 每條車道的 e2 id
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID / DETECTORS。"""
+    global NET, TLS_ID, DETECTORS
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+        DETECTORS = NET.approach_detectors
+    return NET
+
+
+PLAN = DEFAULT_PLAN
+PHASE_CYCLE = PLAN.phases
+CANDIDATES = [int(p) for p in PLAN.movement_start]   # 各 movement 的綠燈 phase
+
+MPC_HORIZON = float(os.environ.get("TRACI_MPC_HORIZON", "45"))
+MPC_WORKERS = int(os.environ.get("TRACI_MPC_WORKERS", str(len(CANDIDATES))))
+MPC_WORKER_BINARY = os.environ.get("TRACI_MPC_WORKER_BINARY", "sumo")
+LOOKAHEAD_DT = 1.0      # worker 每次 simulationStep 前進的秒數
+
+# 快照放在 tmpfs（Linux /dev/shm），沒有就用系統暫存資料夾
+SNAPSHOT_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# worker 輸出資料夾（相對於 SCRIPT_DIR）；--output-prefix 必須是相對路徑，
+# 因為 SUMO 會把 prefix 插在輸出檔本身的資料夾（Traci.add.xml 所在的 SCRIPT_DIR）之後
+WORKER_OUTPUT_DIR = f"runs/mpc-{RUN_ID}"
+
+
+# -------------------------
+# 工具函式
+# -------------------------
+
+def enforce_lane_discipline():
+    """
+    - 直行車不在左轉車道
+    - 左轉車導向左轉車道
+    """
+    for edge in NET.in_edges:
+        for vid in traci.edge.getLastStepVehicleIDs(edge):
+            try:
+                route = traci.vehicle.getRoute(vid)
+                cur_idx = route.index(edge)
+                if cur_idx + 1 >= len(route):
+                    continue
+                nxt = route[cur_idx + 1]
+                lane = traci.vehicle.getLaneIndex(vid)
+                if nxt == NET.straight_next.get(edge) and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif nxt == NET.left_next.get(edge) and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
+            except Exception:
+                pass
+
+
+def candidate_schedule(current, candidate, horizon_steps):
+    """
+    決策點（current 綠燈結束）選 candidate 後的 [(phase, steps)]，總長 horizon_steps：
+    相同 → 延長 current；不同 → current 的黃燈 → candidate；之後照 next_phase 循環。
+    """
+    if candidate == current:
+        seq = [current]
+    else:
+        yellow = int(PLAN.movement_next[current])
+        seq = [yellow, candidate] if PLAN.is_yellow[yellow] else [candidate]
+    out, left = [], horizon_steps
+    p = seq[0]
+    while left > 0:
+        steps = min(int(PLAN.durations[p]), left)
+        out.append((p, steps))
+        left -= steps
+        p = seq[len(out)] if len(out) < len(seq) else int(PLAN.next_phase[p])
+    return out
+
+
+class LookaheadPool:
+    """一組 worker SUMO（各自的 TraCI 連線），在同一個快照上平行評估候選 movement。"""
+
+    def __init__(self, n_workers, snapshot_dir, output_dir=WORKER_OUTPUT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.labels = [f"mpc{k}" for k in range(n_workers)]
+        tc = traci.constants
+        self.var = tc.LAST_STEP_VEHICLE_HALTING_NUMBER
+        self.dets = sorted({d for dets in DETECTORS.values() for d in dets})
+        for k, label in enumerate(self.labels):
+            cmd = [MPC_WORKER_BINARY, '-c', sumocfg_path, '--step-length', str(STEP_LENGTH),
+                   '--lateral-resolution', '0', '--no-step-log', 'true', '--no-warnings', 'true',
+                   '--seed', str(SEED),
+                   # worker 的 e2 輸出寫到 output_dir，不覆蓋主模擬的輸出
+                   '--output-prefix', f"{output_dir}/w{k}_"]
+            if ROUTE_FILE:
+                cmd += ['--route-files', os.path.abspath(ROUTE_FILE)]
+            traci.start(cmd, label=label)
+        self.conns = [traci.getConnection(label) for label in self.labels]
+        self.executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    def _evaluate(self, conn, snapshot, schedule):
+        """loadState 後照 schedule 執行，回傳停等車輛數 × 秒（每 LOOKAHEAD_DT 取樣）。"""
+        conn.simulation.loadState(snapshot)
+        for det in self.dets:
+            conn.lanearea.subscribe(det, (self.var,))
+        t = conn.simulation.getTime()
+        cost = 0.0
+        for phase, steps in schedule:
+            conn.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[phase])
+            end = t + steps * STEP_LENGTH
+            while t < end - 1e-6:
+                dt = min(LOOKAHEAD_DT, end - t)
+                t += dt
+                conn.simulationStep(t)
+                res = conn.lanearea.getAllSubscriptionResults()
+                cost += dt * sum(res[d][self.var] for d in self.dets)
+        return cost
+
+    def evaluate(self, snapshot, schedules):
+        """schedules 依序分配給 worker（候選數 > worker 數時輪流），回傳各候選的 cost。"""
+        n = len(self.conns)
+        costs = [0.0] * len(schedules)
+        for start in range(0, len(schedules), n):
+            batch = schedules[start:start + n]
+            futures = [self.executor.submit(self._evaluate, self.conns[k], snapshot, s)
+                       for k, s in enumerate(batch)]
+            for k, fut in enumerate(futures):
+                costs[start + k] = fut.result()
+        return costs
+
+    def close(self):
+        self.executor.shutdown()
+        for conn in self.conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+# -------------------------
+# 主程式
+# -------------------------
+
+def main():
+    global traci
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
+    validate_plan(PLAN)
+    tc = traci.constants
+
+    approaches = ("EB", "SB", "WB", "NB")
+    sum_q = dict.fromkeys(approaches, 0.0)
+    sum_h = dict.fromkeys(approaches, 0.0)
+    sum_halting = 0.0
+    total_arrived_vehicles = 0
+    total_steps = 0
+    cumulative_reward = 0.0
+    phase_counts = defaultdict(int)
+    lookahead = RunningStats()    # 每次決策的 lookahead 耗時（秒），全天執行也只佔固定記憶體
+    horizon_steps = max(1, int(round(MPC_HORIZON / STEP_LENGTH)))
+
+    snapshot_dir = tempfile.mkdtemp(prefix="traci_mpc_", dir=SNAPSHOT_ROOT)
+    snapshot = os.path.join(snapshot_dir, "state.xml")
+    worker_output_dir = os.path.join(SCRIPT_DIR, WORKER_OUTPUT_DIR)
+    os.makedirs(worker_output_dir, exist_ok=True)    # SUMO 不會自己建資料夾
+
+    traci.start(Sumo_config, label="main")
+    try:
+        traci.gui.setSchema("View #0", "real world")
+    except Exception:
+        pass
+    pool = LookaheadPool(max(1, MPC_WORKERS), snapshot_dir)
+    traci.switch("main")
+
+    VARS = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_VEHICLE_HALTING_NUMBER)
+    for det in sorted({d for dets in DETECTORS.values() for d in dets}):
+        traci.lanearea.subscribe(det, VARS)
+
+    print("\n" + "="*70)
+    print(f"Starting MPC Simulation ({SIM_TIME:.0f} sec, horizon {MPC_HORIZON:.0f}s, "
+          f"{len(pool.conns)} workers, snapshots in {SNAPSHOT_ROOT})")
+    print("="*70 + "\n")
+
+    current_phase_idx = CANDIDATES[0]
+    target_phase = current_phase_idx
+    steps_in_phase = 0
+    traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
+
+    wall_start = time.perf_counter()
+    monitor = RunMonitor(TOTAL_STEPS, STEP_LENGTH)
+    tel = telemetry.start("mpc", STEP_LENGTH)
+    lookahead_last = 0.0
+    try:
+        for step in range(TOTAL_STEPS):
+            monitor.tick(step)
+            if step % int(1.0 / STEP_LENGTH) == 0:
+                prof.mark("lane_discipline")
+                enforce_lane_discipline()
+            prof.mark("step")
+            traci.simulationStep()
+            prof.mark("observe")
+            res = traci.lanearea.getAllSubscriptionResults()
+
+            q = {a: sum(res[d][VARS[0]] for d in DETECTORS[a]) for a in approaches}
+            h = {a: sum(res[d][VARS[1]] for d in DETECTORS[a]) for a in approaches}
+            prof.mark("record")
+            for a in approaches:
+                sum_q[a] += q[a]
+                sum_h[a] += h[a]
+            halting = sum(h.values())
+            sum_halting += halting
+            total_steps += 1
+            total_arrived_vehicles += traci.simulation.getArrivedNumber()
+            cumulative_reward += -halting
+            phase_counts[PLAN.names[current_phase_idx]] += 1
+
+            if tel.due(step):
+                tel.observe(step, q, current_phase_idx, PLAN.names[current_phase_idx],
+                            cumulative_reward=cumulative_reward, decisions_total=lookahead.n,
+                            lookahead_seconds_total=lookahead.mean * lookahead.n,
+                            lookahead_seconds_last=lookahead_last,
+                            lookahead_seconds_max=lookahead.max if lookahead.n else 0.0)
+
+            if step % PROGRESS_STEPS == 0:
+                sim_time = step * STEP_LENGTH
+                print(f"[t={sim_time:4.1f}s] Phase: {PLAN.names[current_phase_idx]} | "
+                      f"qEB={q['EB']:3d}, qWB={q['WB']:3d}, qSB={q['SB']:3d}, qNB={q['NB']:3d}")
+
+            prof.mark("decide")
+            steps_in_phase += 1
+            if steps_in_phase < PLAN.durations[current_phase_idx]:
+                continue
+            steps_in_phase = 0
+            if PLAN.is_green[current_phase_idx]:
+                # 決策點：快照 → worker 平行預測各候選 → 取停等最少者
+                # （worker 的 TraCI 連線不計入 profiling，lookahead 時間算在 decide 的 self time）
+                t0 = time.perf_counter()
+                traci.simulation.saveState(snapshot)
+                schedules = [candidate_schedule(current_phase_idx, c, horizon_steps) for c in CANDIDATES]
+                costs = pool.evaluate(snapshot, schedules)
+                lookahead_last = time.perf_counter() - t0
+                lookahead.add(lookahead_last)
+                target_phase = CANDIDATES[int(np.argmin(costs))]
+                if target_phase != current_phase_idx:
+                    nxt = int(PLAN.movement_next[current_phase_idx])
+                    current_phase_idx = nxt if PLAN.is_yellow[nxt] else target_phase
+            else:
+                current_phase_idx = target_phase
+            prof.mark("actuate")
+            traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
+    finally:
+        prof.mark("teardown")
+        pool.close()
+        traci.switch("main")
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        shutil.rmtree(worker_output_dir, ignore_errors=True)
+
+    monitor.finish()
+    tel.finish()
+    wall_time = time.perf_counter() - wall_start
+    print("\nSimulation completed.\n")
+
+    # ====== 統計結果輸出 ======
+    n = max(total_steps, 1)
+    avg_q = {a: sum_q[a] / n for a in approaches}
+    avg_h = {a: sum_h[a] / n for a in approaches}
+    avg_queue_total = sum(sum_q.values()) / n
+    total_waiting_time = sum_halting * STEP_LENGTH
+    avg_delay_time = total_waiting_time / total_arrived_vehicles if total_arrived_vehicles > 0 else 0.0
+    lookahead_mean = lookahead.mean
+    realtime_ratio = lookahead_mean / MPC_HORIZON
+
+    print("\n=== Phase Proportions ===")
+    for name, cnt in phase_counts.items():
+        print(f"{name}: {cnt / n * 100:.2f}% ({cnt} steps)")
+
+    print("\n========== MPC Traffic Signal Summary (Protected Left) ==========")
+    for a in ("EB", "WB", "SB", "NB"):
+        print(f"{a} 平均排隊 (Queue) = {avg_q[a]:.2f} veh")
+    print(f"Total Avg Queue     = {avg_queue_total:.2f} veh")
+    for a in ("EB", "WB", "SB", "NB"):
+        print(f"{a} 平均停等 (Halt)  = {avg_h[a]:.2f} veh")
+    print("")
+    print(f"Total Arrived Veh   = {total_arrived_vehicles}")
+    print(f"Avg Delay Time      = {avg_delay_time:.2f} sec/veh")
+    print(f"Total Waiting Time  = {total_waiting_time:.2f} veh·sec")
+    print(f"Cumulative reward   = {cumulative_reward:.2f}")
+    print(f"Lookahead           = {lookahead.n} decisions, {lookahead_mean * 1e3:.1f} ms each "
+          f"({realtime_ratio:.3f} × real time of the {MPC_HORIZON:.0f}s horizon)")
+    print("=================================================================\n")
+
+    if RECORD_RESULTS:
+        summary = {f"avg_q{a}": avg_q[a] for a in ("EB", "WB", "SB", "NB")}
+        summary.update({f"avg_h{a}": avg_h[a] for a in ("EB", "WB", "SB", "NB")})
+        summary.update({
+            "avg_queue_total": avg_queue_total,
+            "total_arrived": total_arrived_vehicles,
+            "avg_delay_time": avg_delay_time,
+            "total_waiting_time": total_waiting_time,
+            "cumulative_reward": cumulative_reward,
+            "decisions": lookahead.n,
+            "lookahead_ms_mean": lookahead_mean * 1e3,
+            "lookahead_ms_max": (lookahead.max if lookahead.n else 0.0) * 1e3,
+            "lookahead_ms_std": lookahead.std * 1e3,
+            "lookahead_realtime_ratio": realtime_ratio,
+        })
+        summary.update(monitor.summary())
+        config = {
+            "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+            "phase_cycle": PHASE_CYCLE,
+            "horizon": MPC_HORIZON, "workers": len(pool.conns),
+            "lookahead_dt": LOOKAHEAD_DT, "snapshot_root": SNAPSHOT_ROOT,
+        }
+        results_store.record_run(
+            "mpc", summary, config, seed=SEED, wall_time=wall_time,
+            sim_steps=total_steps, run_id=RUN_ID, scenario=SCENARIO,
+        )
+
+    traci.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,37 @@ PPO Traffic Light Control (Protected Left, 8 Phases, Safe)
 - 使用自寫 PPO（numpy）
 - 由程式端直接控制 8 個相位的 RYG state（含左轉保護）
 - 不使用 SUMO 內建號誌程序，避免衝突號誌
+- TRACI_PPO_ACTUATED=1：綠燈長度改為感應式（停止線區段 gap-out / max-out，見 actuated.py），
+  PPO 仍只在 group 結尾決定保持 / 切換，action 空間（2 個）、權重與 rollout 格式不變
 """
 
 import os
 import sys
+import time
 from collections import defaultdict
 
 import numpy as np
 
+import profiling
+import results_store
+import telemetry
+from phase_plan import DEFAULT_PLAN
+from phase_conflicts import validate_plan
+from network_index import load_index
+from run_config import SEED, RUN_ID, SCENARIO, RECORD_RESULTS, SUMO_BINARY, SUMO_EXTRA_ARGS, load_traci
+from run_config import SIM_TIME, PROGRESS_EVERY
+from metrics import RunMonitor
+from rollout_archive import ROLLOUT_ARCHIVE, open_archive, last_episode
+from policy_table import open_decider
+from actuated import ActuatedPhase, StopBarZone
+
 # -------------------------
 # 模擬 / PPO 參數
 # -------------------------
 
-SIM_TIME = 1800.0
 STEP_LENGTH = 0.10
 TOTAL_STEPS = int(SIM_TIME / STEP_LENGTH)
+PROGRESS_STEPS = max(1, int(round(PROGRESS_EVERY / STEP_LENGTH)))   # 進度列印間隔（步）
 
 # 決策層級：在「一個方向的 Straight+Left 結束」這種 group 邊界，決定下一輪主方向
 # action = 0 → 保持當前主方向；1 → 切換主方向
@@ -29,22 +45,40 @@ ACTION_DIM = len(ACTIONS)
 # state = 4*3 queue + 4*3 halting + current_phase_idx = 25
 STATE_DIM = 25
 
-# PPO 超參數（簡易版）
-GAMMA = 0.9
-LAMBDA = 0.95
-POLICY_LR = 1e-4
-VALUE_LR = 1e-4
-PPO_EPOCHS = 4
-PPO_BATCH_SIZE = 64
-PPO_UPDATE_INTERVAL = 512
+# PPO 超參數（簡易版），可用環境變數覆寫（sweep.py 以此啟動各 trial）
+GAMMA = float(os.environ.get("TRACI_PPO_GAMMA", "0.9"))
+LAMBDA = float(os.environ.get("TRACI_PPO_LAMBDA", "0.95"))
+POLICY_LR = float(os.environ.get("TRACI_PPO_POLICY_LR", "1e-4"))
+VALUE_LR = float(os.environ.get("TRACI_PPO_VALUE_LR", "1e-4"))
+PPO_EPOCHS = int(os.environ.get("TRACI_PPO_EPOCHS", "4"))
+PPO_BATCH_SIZE = int(os.environ.get("TRACI_PPO_BATCH_SIZE", "64"))
+PPO_UPDATE_INTERVAL = int(os.environ.get("TRACI_PPO_UPDATE_INTERVAL", "512"))
+EPISODES = int(os.environ.get("TRACI_PPO_EPISODES", "1"))
+
+# 感應式綠燈長度（actuated.py）；決策點與 action 不變
+PPO_ACTUATED = os.environ.get("TRACI_PPO_ACTUATED", "0") == "1"
+
+# 初始權重（npz: policy_W, policy_b, value_W, value_b），例如 surrogate.py pretrain 的輸出；
+# 未設定則隨機初始化；TRACI_PPO_SAVE 有值時訓練結束後把權重存到該路徑
+PPO_WEIGHTS = os.environ.get("TRACI_PPO_WEIGHTS", "")
+PPO_SAVE = os.environ.get("TRACI_PPO_SAVE", "")
+
+# TRACI_POLICY_TABLE=<npz>（policy_table.py build --ppo 的輸出）：只在 group 結尾查表決策、不訓練；
+# 表中沒有樣本的 cell 改用網路的 greedy action（權重同樣由 TRACI_PPO_WEIGHTS 載入）
 
-# Policy / Value 網路（線性）
-policy_W = np.random.randn(STATE_DIM, ACTION_DIM).astype(np.float32) * 0.01
-policy_b = np.zeros(ACTION_DIM, dtype=np.float32)
+# TRACI_ROLLOUT_ARCHIVE 有值時，每次 ppo_update 前把 buffer 寫入 rollout_archive（main() 開啟）
+archive = None
 
-value_W = np.random.randn(STATE_DIM).astype(np.float32) * 0.01
+# Policy / Value 網路（線性），由 init_networks() 初始化
+policy_W = None
+policy_b = None
+
+value_W = None
 value_b = 0.0
 
+# ppo_update 累計次數（telemetry 用）
+updates_done = 0
+
 # PPO 緩衝區
 states_buffer = []
 actions_buffer = []
@@ -58,52 +92,48 @@ values_buffer = []
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-if "SUMO_HOME" not in os.environ:
-    sys.exit("請先設定環境變數 SUMO_HOME")
-tools = os.path.join(os.environ["SUMO_HOME"], "tools")
-sys.path.append(tools)
-
-import traci  # noqa: E402
+# traci 於 main() 才載入（需要 SUMO_HOME）
+traci = None
 
 sumocfg_path = os.path.join(SCRIPT_DIR, "Traci.sumocfg")
-if not os.path.exists(sumocfg_path):
-    sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
 
 SUMO_CONFIG = [
-    "sumo-gui",
+    SUMO_BINARY,
     "-c", sumocfg_path,
     "--step-length", str(STEP_LENGTH),
     "--delay", "0",
-    "--lateral-resolution", "0"
+    "--lateral-resolution", "0",
+    *SUMO_EXTRA_ARGS
 ]
 
-TLS_ID = "Node2"
+# 號誌 / 車道 / 偵測器對應由 Traci.net.xml + Traci.add.xml 推導（見 network_index.py），
+# 於 main() 呼叫 load_network() 才建立，import 本模組不會解析 XML 或寫入 .cache
+NET = None
+TLS_ID = None
+DETECTORS = None   # approach → 每條車道的 e2 id
+
+
+def load_network():
+    """建立（或取用已建立的）路網索引並設定 NET / TLS_ID / DETECTORS。"""
+    global NET, TLS_ID, DETECTORS
+    if NET is None:
+        NET = load_index()
+        TLS_ID = NET.tls_id
+        DETECTORS = NET.approach_detectors
+    return NET
+
 
 # -------------------------
-# 8 相位（含左轉保護）
+# 8 相位（含左轉保護），定義與編譯見 phase_plan.py
 # -------------------------
 
-PHASE_CYCLE = [
-    # 0: NS Straight (Green)
-    {"duration": 300, "state": "GGGGrrrrrrGGGGrrrrrr", "name": "NS Straight"},
-    # 1: NS Straight (Yellow)
-    {"duration": 30,  "state": "yyyyrrrrrryyyyrrrrrr", "name": "NS Straight (Y)"},
-    # 2: NS Left (Green)
-    {"duration": 150, "state": "rrrrGrrrrrrrrrGrrrrr", "name": "NS Left"},
-    # 3: NS Left (Yellow)
-    {"duration": 30,  "state": "rrrryrrrrrrrrryrrrrr", "name": "NS Left (Y)"},
-    # 4: EW Straight (Green)
-    {"duration": 300, "state": "rrrrrGGGGrrrrrGGGGrr", "name": "EW Straight"},
-    # 5: EW Straight (Yellow)
-    {"duration": 30,  "state": "rrrrryyyyrrrrryyyyrr", "name": "EW Straight (Y)"},
-    # 6: EW Left (Green)
-    {"duration": 150, "state": "rrrrrrrrrGrrrrrrrrrG", "name": "EW Left"},
-    # 7: EW Left (Yellow)
-    {"duration": 30,  "state": "rrrrrrrrryrrrrrrrrry", "name": "EW Left (Y)"}
-]
+PLAN = DEFAULT_PLAN
+PHASE_CYCLE = PLAN.phases
 
-NS_GROUP_PHASES = [0, 1, 2, 3]
-EW_GROUP_PHASES = [4, 5, 6, 7]
+NS_GROUP = PLAN.group_index("NS")
+EW_GROUP = PLAN.group_index("EW")
+NS_GREEN = PLAN.group_green("NS")
+EW_GREEN = PLAN.group_green("EW")
 
 
 # -------------------------
@@ -111,7 +141,7 @@ EW_GROUP_PHASES = [4, 5, 6, 7]
 # -------------------------
 
 def enforce_lane_discipline():
-    edges = ["Node1_2_EB", "Node2_3_WB", "Node2_4_SB", "Node2_5_NB"]
+    edges = NET.in_edges
     for edge in edges:
         for vid in traci.edge.getLastStepVehicleIDs(edge):
             try:
@@ -124,27 +154,42 @@ def enforce_lane_discipline():
                 nxt = route[cur_idx + 1]
                 lane = traci.vehicle.getLaneIndex(vid)
 
-                straight = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_3_WB" and nxt == "Node1_2_WB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_5_NB" and nxt == "Node2_4_NB")
-                )
-                left = (
-                    (edge == "Node1_2_EB" and nxt == "Node2_4_NB") or
-                    (edge == "Node2_3_WB" and nxt == "Node2_5_SB") or
-                    (edge == "Node2_4_SB" and nxt == "Node2_3_EB") or
-                    (edge == "Node2_5_NB" and nxt == "Node1_2_WB")
-                )
-
-                if straight and lane == 2:
-                    traci.vehicle.changeLane(vid, 1, 3.0)
-                elif left and lane != 2:
-                    traci.vehicle.changeLane(vid, 2, 3.0)
+                straight = (nxt == NET.straight_next.get(edge))
+                left = (nxt == NET.left_next.get(edge))
+
+                if straight and lane == NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge] - 1, 3.0)
+                elif left and lane != NET.left_lane[edge]:
+                    traci.vehicle.changeLane(vid, NET.left_lane[edge], 3.0)
             except Exception:
                 pass
 
 
+def init_networks(weights_path=None):
+    """
+    初始化 policy / value 權重（import 時不做，main() 才呼叫）。
+    weights_path（或 TRACI_PPO_WEIGHTS）有值時從 npz 載入，否則隨機初始化。
+    """
+    global policy_W, policy_b, value_W, value_b
+    weights_path = weights_path or PPO_WEIGHTS
+    if weights_path:
+        data = np.load(weights_path)
+        policy_W = data["policy_W"].astype(np.float32)
+        policy_b = data["policy_b"].astype(np.float32)
+        value_W = data["value_W"].astype(np.float32)
+        value_b = float(data["value_b"])
+        return
+    policy_W = np.random.randn(STATE_DIM, ACTION_DIM).astype(np.float32) * 0.01
+    policy_b = np.zeros(ACTION_DIM, dtype=np.float32)
+    value_W = np.random.randn(STATE_DIM).astype(np.float32) * 0.01
+    value_b = 0.0
+
+
+def save_networks(path):
+    """目前的 policy / value 權重存成 npz（init_networks / multi_tls --ppo-weights 可讀）。"""
+    np.savez(path, policy_W=policy_W, policy_b=policy_b, value_W=value_W, value_b=value_b)
+
+
 def stable_softmax(logits: np.ndarray) -> np.ndarray:
     logits = logits - np.max(logits)
     exp = np.exp(logits)
@@ -153,17 +198,17 @@ def stable_softmax(logits: np.ndarray) -> np.ndarray:
 
 def get_queues_and_halting():
     # EB
-    q_EB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node1_2_EB_{i}") for i in range(3))
-    h_EB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node1_2_EB_{i}") for i in range(3))
+    q_EB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["EB"])
+    h_EB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["EB"])
     # SB
-    q_SB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_4_SB_{i}") for i in range(3))
-    h_SB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_4_SB_{i}") for i in range(3))
+    q_SB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["SB"])
+    h_SB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["SB"])
     # WB
-    q_WB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_3_WB_{i}") for i in range(3))
-    h_WB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_3_WB_{i}") for i in range(3))
+    q_WB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["WB"])
+    h_WB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["WB"])
     # NB
-    q_NB = sum(traci.lanearea.getLastStepVehicleNumber(f"Node2_5_NB_{i}") for i in range(3))
-    h_NB = sum(traci.lanearea.getLastStepHaltingNumber(f"Node2_5_NB_{i}") for i in range(3))
+    q_NB = sum(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["NB"])
+    h_NB = sum(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["NB"])
 
     return {
         "q_EB": q_EB, "h_EB": h_EB,
@@ -180,16 +225,16 @@ def get_state(current_phase_idx: int):
              current_phase_idx]
     """
     q = [
-        *(traci.lanearea.getLastStepVehicleNumber(f"Node1_2_EB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepVehicleNumber(f"Node2_4_SB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepVehicleNumber(f"Node2_3_WB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepVehicleNumber(f"Node2_5_NB_{i}") for i in range(3)),
+        *(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["EB"]),
+        *(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["SB"]),
+        *(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["WB"]),
+        *(traci.lanearea.getLastStepVehicleNumber(det) for det in DETECTORS["NB"]),
     ]
     h = [
-        *(traci.lanearea.getLastStepHaltingNumber(f"Node1_2_EB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepHaltingNumber(f"Node2_4_SB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepHaltingNumber(f"Node2_3_WB_{i}") for i in range(3)),
-        *(traci.lanearea.getLastStepHaltingNumber(f"Node2_5_NB_{i}") for i in range(3)),
+        *(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["EB"]),
+        *(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["SB"]),
+        *(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["WB"]),
+        *(traci.lanearea.getLastStepHaltingNumber(det) for det in DETECTORS["NB"]),
     ]
     return tuple(q + h + [current_phase_idx])
 
@@ -208,11 +253,17 @@ def get_action_from_policy(state):
     return ACTIONS[act_idx], logprob, value
 
 
-def ppo_update():
-    global policy_W, policy_b, value_W, value_b
+def get_greedy_action(state):
+    """網路的 greedy action index（查表 miss 時的 fallback）。"""
+    return int(np.argmax(np.asarray(state, dtype=np.float32) @ policy_W + policy_b))
+
+
+def ppo_update(episode=0):
+    global policy_W, policy_b, value_W, value_b, updates_done
 
     if len(states_buffer) == 0:
         return
+    updates_done += 1
 
     states = np.array(states_buffer, dtype=np.float32)
     actions_idx = np.array(actions_buffer, dtype=np.int64)
@@ -220,6 +271,11 @@ def ppo_update():
     old_logprobs = np.array(old_logprobs_buffer, dtype=np.float32)
     values = np.array(values_buffer, dtype=np.float32)
 
+    if archive is not None:
+        archive.append(states=states, actions=actions_idx, rewards=rewards,
+                       logprobs=old_logprobs, values=values,
+                       episode=np.full(len(states), episode, dtype=np.int32))
+
     N = len(rewards)
     advantages = np.zeros(N, dtype=np.float32)
     gae = 0.0
@@ -283,8 +339,26 @@ def ppo_update():
 # -------------------------
 
 def main():
-    EPISODES = 1
-    print("\n=== PPO Training ({} Episode) ===".format(EPISODES))
+    global traci, archive
+    traci = load_traci()
+    load_network()
+    prof = profiling.get()
+    if not os.path.exists(sumocfg_path):
+        sys.exit(f"找不到 SUMO 設定檔: {sumocfg_path}")
+    # 啟動 SUMO 前先依路口 foes 矩陣檢查相位計畫（衝突綠燈直接中止）
+    validate_plan(PLAN)
+    if policy_W is None:
+        init_networks()
+    decider = open_decider(ACTION_DIM, PLAN.n_phases, shadow=True)
+    archive = open_archive() if decider is None else None
+    episode_base = last_episode(archive) if archive is not None else 0
+
+    if decider is None:
+        print("\n=== PPO Training ({} Episode) ===".format(EPISODES))
+    else:
+        print("\n=== PPO Policy Table ({} Episode, no training) ===".format(EPISODES))
+    tel = telemetry.start("ppo", STEP_LENGTH)
+    decisions = switches = 0
 
     for ep in range(1, EPISODES + 1):
         print("\n--- Episode {}/{} ---".format(ep, EPISODES))
@@ -299,13 +373,13 @@ def main():
             pass
 
         # 初始主方向：NS
-        current_group = "NS"
-        current_phase_idx = NS_GROUP_PHASES[0]
+        current_group = NS_GROUP
+        current_phase_idx = int(PLAN.group_start[current_group])
         steps_in_phase = 0
+        green_timer = ActuatedPhase(PLAN, NET, STEP_LENGTH) if PPO_ACTUATED else None
+        zone = StopBarZone(traci, NET) if PPO_ACTUATED else None
 
-        traci.trafficlight.setRedYellowGreenState(
-            TLS_ID, PHASE_CYCLE[current_phase_idx]["state"]
-        )
+        traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
 
         # 統計變數（與 Max-Pressure 相同格式）
         sum_qEB = sum_qSB = 0.0
@@ -321,15 +395,21 @@ def main():
         eb_green_steps = 0
         sb_green_steps = 0
 
+        wall_start = time.perf_counter()
+        monitor = RunMonitor(TOTAL_STEPS, STEP_LENGTH)
         for step in range(TOTAL_STEPS):
+            monitor.tick(step)
             # 每秒強制一次車道紀律
             if step % int(1.0 / STEP_LENGTH) == 0:
+                prof.mark("lane_discipline")
                 enforce_lane_discipline()
 
             # 推進 SUMO
+            prof.mark("step")
             traci.simulationStep()
 
             # 讀取 queue / halting
+            prof.mark("observe")
             stats = get_queues_and_halting()
             q_EB = stats["q_EB"]
             q_SB = stats["q_SB"]
@@ -341,6 +421,7 @@ def main():
             h_NB = stats["h_NB"]
 
             # 累計
+            prof.mark("record")
             sum_qEB += q_EB
             sum_qSB += q_SB
             sum_hEB += h_EB
@@ -354,82 +435,96 @@ def main():
             cumulative_reward += reward
 
             # 目前 state（用 PHASE_CYCLE index 當作 phase）
-            state = get_state(current_phase_idx)
+            prof.mark("observe")
+            state = get_state(current_phase_idx) if decider is None else None
 
             # phase 統計
-            phase_name = PHASE_CYCLE[current_phase_idx]["name"]
+            prof.mark("record")
+            phase_name = PLAN.names[current_phase_idx]
             phase_counts[phase_name] += 1
 
-            if current_phase_idx in [1, 3, 5, 7]:
+            if PLAN.is_yellow[current_phase_idx]:
                 yellow_steps += 1
 
-            if current_phase_idx in [0, 2]:
+            if NS_GREEN[current_phase_idx]:
                 sb_green_steps += 1
-            if current_phase_idx in [4, 6]:
+            if EW_GREEN[current_phase_idx]:
                 eb_green_steps += 1
 
-            # 存入 PPO buffer
-            states_buffer.append(np.array(state, dtype=np.float32))
-            actions_buffer.append(0)  # 先暫存，後面會覆蓋成實際 action index
-            rewards_buffer.append(reward)
-            old_logprobs_buffer.append(0.0)
-            values_buffer.append(0.0)
-
-            # 每 100 step 印一次
-            if step % 100 == 0:
+            # 存入 PPO buffer（查表模式不訓練）
+            if decider is None:
+                states_buffer.append(np.array(state, dtype=np.float32))
+                actions_buffer.append(0)  # 先暫存，後面會覆蓋成實際 action index
+                rewards_buffer.append(reward)
+                old_logprobs_buffer.append(0.0)
+                values_buffer.append(0.0)
+
+            if tel.due(step):
+                tel.observe(step, {"EB": q_EB, "SB": q_SB, "WB": q_WB, "NB": q_NB},
+                            current_phase_idx, phase_name, episode=ep,
+                            cumulative_reward=cumulative_reward, decisions_total=decisions,
+                            switches_total=switches, ppo_updates_total=updates_done,
+                            ppo_buffer_size=len(states_buffer))
+
+            # 每 PROGRESS_EVERY 模擬秒印一次
+            if step % PROGRESS_STEPS == 0:
                 sim_time = step * STEP_LENGTH
                 print(f"[t={sim_time:4.1f}s] Phase: {phase_name} | "
                       f"qEB={q_EB:3d}, qWB={q_WB:3d}, qSB={q_SB:3d}, qNB={q_NB:3d}")
 
-            # 取得 PPO action（每一步都算，但只在 group 邊界生效）
-            action, logprob, value = get_action_from_policy(state)
+            # 取得 PPO action（每一步都算，但只在 group 邊界生效；查表模式只在 group 邊界查）
+            prof.mark("decide")
+            if decider is None:
+                action, logprob, value = get_action_from_policy(state)
 
-            # 覆蓋最後一筆 buffer 的 action / logprob / value
-            actions_buffer[-1] = ACTIONS.index(action)
-            old_logprobs_buffer[-1] = logprob
-            values_buffer[-1] = value
+                # 覆蓋最後一筆 buffer 的 action / logprob / value
+                actions_buffer[-1] = ACTIONS.index(action)
+                old_logprobs_buffer[-1] = logprob
+                values_buffer[-1] = value
 
             # Phase 時間更新
             steps_in_phase += 1
-            phase_duration = PHASE_CYCLE[current_phase_idx]["duration"]
+            if green_timer is not None and green_timer.is_green(current_phase_idx):
+                phase_done = green_timer.poll(current_phase_idx, steps_in_phase, zone)
+            else:
+                phase_done = steps_in_phase >= PLAN.durations[current_phase_idx]
 
-            if steps_in_phase >= phase_duration:
+            if phase_done:
                 steps_in_phase = 0
 
                 # group 結尾（NS Left (Y) 或 EW Left (Y)）
-                if current_phase_idx in [3, 7]:
+                if PLAN.group_end[current_phase_idx]:
+                    if decider is not None:
+                        action = ACTIONS[decider.decide(get_state(current_phase_idx), get_greedy_action)]
+                    decisions += 1
+                    switches += action == 1
                     # action = 0 → 保持 current_group；1 → 切換
                     if action == 1:
-                        current_group = "EW" if current_group == "NS" else "NS"
+                        current_group = EW_GROUP if current_group == NS_GROUP else NS_GROUP
 
                     # 根據 current_group 決定新的 phase index
-                    if current_group == "NS":
-                        current_phase_idx = NS_GROUP_PHASES[0]
-                    else:
-                        current_phase_idx = EW_GROUP_PHASES[0]
+                    current_phase_idx = int(PLAN.group_start[current_group])
                 else:
                     # group 內部，照順序
-                    if current_group == "NS":
-                        group = NS_GROUP_PHASES
-                    else:
-                        group = EW_GROUP_PHASES
-
-                    pos = group.index(current_phase_idx)
-                    next_pos = (pos + 1) % len(group)
-                    current_phase_idx = group[next_pos]
+                    current_phase_idx = int(PLAN.group_next[current_phase_idx])
 
-                traci.trafficlight.setRedYellowGreenState(
-                    TLS_ID, PHASE_CYCLE[current_phase_idx]["state"]
-                )
+                prof.mark("actuate")
+                traci.trafficlight.setRedYellowGreenState(TLS_ID, PLAN.states[current_phase_idx])
 
             # 依照 buffer 大小更新一次 PPO（簡化版）
             if len(states_buffer) >= PPO_UPDATE_INTERVAL:
-                ppo_update()
+                prof.mark("update")
+                ppo_update(episode_base + ep)
 
         # Episode 結束後，做最後一次 update
+        prof.mark("update")
         if len(states_buffer) > 0:
-            ppo_update()
+            ppo_update(episode_base + ep)
+        prof.mark("teardown")
 
+        monitor.finish()
+        tel.reset(total_steps)
+        wall_time = time.perf_counter() - wall_start
         traci.close()
         print("\nSimulation completed.\n")
 
@@ -481,8 +576,57 @@ def main():
         print(f"Avg Delay Time      = {avg_delay_time:.2f} sec/veh")
         print(f"Total Waiting Time  = {total_waiting_time:.2f} veh·sec")
         print(f"Cumulative reward   = {cumulative_reward:.2f}")
+        if green_timer is not None:
+            print(f"Gap-out / Max-out   = {green_timer.gap_outs} / {green_timer.max_outs}")
+        if decider is not None:
+            decider.report("PPO")
         print("========================================================================\n")
 
+        if RECORD_RESULTS:
+            summary = {
+                "episode": ep,
+                "avg_qEB": avg_qEB, "avg_qSB": avg_qSB,
+                "avg_hEB": avg_hEB, "avg_hSB": avg_hSB,
+                "avg_queue_total": avg_queue_total,
+                "eb_green_ratio": eb_green_ratio, "sb_green_ratio": sb_green_ratio,
+                "yellow_ratio": yellow_ratio,
+                "total_arrived": total_arrived_vehicles,
+                "avg_delay_time": avg_delay_time,
+                "total_waiting_time": total_waiting_time,
+                "cumulative_reward": cumulative_reward,
+            }
+            summary.update(monitor.summary())
+            if decider is not None:
+                summary.update(decider.summary())
+            config = {
+                "sim_time": SIM_TIME, "step_length": STEP_LENGTH,
+                "phase_cycle": PHASE_CYCLE, "episodes": EPISODES,
+                "gamma": GAMMA, "lambda": LAMBDA,
+                "policy_lr": POLICY_LR, "value_lr": VALUE_LR,
+                "ppo_epochs": PPO_EPOCHS, "ppo_batch_size": PPO_BATCH_SIZE,
+                "ppo_update_interval": PPO_UPDATE_INTERVAL,
+                "init_weights": PPO_WEIGHTS or None,
+                "policy_table": decider.path if decider is not None else None,
+            }
+            if green_timer is not None:
+                summary["gap_outs"] = green_timer.gap_outs
+                summary["max_outs"] = green_timer.max_outs
+                config["green_actuated"] = {"min_green": green_timer.min_green.tolist(),
+                                            "max_green": green_timer.max_green.tolist(),
+                                            "gap": green_timer.gap, "stopbar_zone": zone.zone}
+            run_id = results_store.episode_run_id(RUN_ID, ep, EPISODES)
+            results_store.record_run(
+                "ppo" if decider is None else "ppo_table", summary, config, seed=SEED, wall_time=wall_time,
+                sim_steps=total_steps, run_id=run_id, scenario=SCENARIO,
+            )
+
+    tel.finish()
+    if archive is not None:
+        archive.close()
+        print(f"rollouts → {ROLLOUT_ARCHIVE} ({len(archive)} transitions)")
+    if PPO_SAVE:
+        save_networks(PPO_SAVE)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+統一的 headless 執行入口
+
+    python -m traci_run <controller> [--seed N] [--gui] [--no-record] ...
+    python -m traci_run list
+
+- 只 import 被選到的控制器模組（以及它自己的依賴），其他控制器的
+  numpy / google.generativeai 等都不會被載入
+- 預設使用 headless 的 sumo；--gui 改用 sumo-gui
+- 結束時在 stderr 印出 import / startup / run 時間
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+_T0 = time.perf_counter()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# controller 名稱 → (腳本檔名, 說明)
+CONTROLLERS = {
+    "fixed_4phase": ("traci.fixed_4phase.py", "固定時制 4 相位（含左轉保護）"),
+    "webster": ("traci_Webster.py", "Webster 固定時制"),
+    "max_pressure": ("traci.maxpreesure.py", "Max-Pressure"),
+    "ppo": ("traci_ppo_signal_control.py", "PPO（numpy）"),
+    "llm": ("traci.LLM.RAP.compare.py", "LLM（Gemini）選擇下一個 group"),
+    "tod": ("tod_scheduler.py", "時段計畫（SUMO 原生 program 切換）"),
+    "actuated": ("traci_actuated.py", "感應式（最短 / 最長綠燈 + gap-out，每秒評估）"),
+    "mpc": ("traci_mpc.py", "MPC（saveState 快照 + 平行 worker SUMO 預測）"),
+}
+
+
+def controller_path(name):
+    return os.path.join(SCRIPT_DIR, CONTROLLERS[name][0])
+
+
+def load_controller(name):
+    """
+    以檔案路徑載入控制器模組（腳本檔名含 '.'，無法直接 import）。
+    模組名稱為 traci_ctrl_<name>。
+    """
+    module_name = f"traci_ctrl_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    spec = importlib.util.spec_from_file_location(module_name, controller_path(name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def apply_run_env(args):
+    """把 CLI 參數寫進 run_config 讀取的環境變數（必須在載入控制器之前）。"""
+    if args.gui:
+        os.environ["TRACI_SUMO_BINARY"] = "sumo-gui"
+    elif args.sumo_binary:
+        os.environ["TRACI_SUMO_BINARY"] = args.sumo_binary
+    else:
+        # 入口預設 headless（呼叫端已設定環境變數時沿用）
+        os.environ.setdefault("TRACI_SUMO_BINARY", "sumo")
+    if args.seed is not None:
+        os.environ["TRACI_SEED"] = str(args.seed)
+    if args.run_id:
+        os.environ["TRACI_RUN_ID"] = args.run_id
+    if args.scenario:
+        os.environ["TRACI_SCENARIO"] = args.scenario
+    if args.no_record:
+        os.environ["TRACI_RECORD"] = "0"
+    if args.db:
+        os.environ["TRACI_RESULTS_DB"] = args.db
+    if args.output_prefix:
+        os.environ["TRACI_OUTPUT_PREFIX"] = args.output_prefix
+    if args.route_file:
+        os.environ["TRACI_ROUTE_FILE"] = os.path.abspath(args.route_file)
+    if args.sim_time is not None:
+        os.environ["TRACI_SIM_TIME"] = str(args.sim_time)
+    if args.progress_every is not None:
+        os.environ["TRACI_PROGRESS_EVERY"] = str(args.progress_every)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m traci_run",
+        description="Run one traffic-signal controller headless",
+    )
+    parser.add_argument("controller", choices=sorted(CONTROLLERS) + ["list"])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--gui", action="store_true", help="使用 sumo-gui")
+    parser.add_argument("--sumo-binary", default=None, help="預設 sumo（headless）")
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--scenario", default=None)
+    parser.add_argument("--no-record", action="store_true", help="不寫入 results store")
+    parser.add_argument("--db", default=None, help="results store 路徑")
+    parser.add_argument("--output-prefix", default=None, help="SUMO --output-prefix")
+    parser.add_argument("--route-file", "-r", default=None,
+                        help="取代 Traci.rou.xml 的 route 檔（scenario_gen.py 產生）")
+    parser.add_argument("--sim-time", type=float, default=None,
+                        help="模擬總時間（秒），預設 1800；全天 86400")
+    parser.add_argument("--progress-every", type=float, default=None,
+                        help="狀態列印間隔（模擬秒）")
+    parser.add_argument("--import-only", action="store_true",
+                        help="只載入控制器並回報 import 時間（不啟動 SUMO）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.controller == "list":
+        for name in sorted(CONTROLLERS):
+            script, desc = CONTROLLERS[name]
+            print(f"{name:14s} {script:32s} {desc}")
+        return 0
+
+    apply_run_env(args)
+
+    t_import = time.perf_counter()
+    module = load_controller(args.controller)
+    import_time = time.perf_counter() - t_import
+
+    traci_time = 0.0
+    if not args.import_only:
+        # 先載入 traci，讓 startup 時間與模擬時間分開計算
+        from run_config import load_traci
+
+        t_traci = time.perf_counter()
+        load_traci()
+        traci_time = time.perf_counter() - t_traci
+
+    startup_time = time.perf_counter() - _T0
+    print(f"[traci_run] {args.controller}: import={import_time * 1000:.1f} ms, "
+          f"traci={traci_time * 1000:.1f} ms, startup={startup_time * 1000:.1f} ms",
+          file=sys.stderr)
+    if args.import_only:
+        return 0
+
+    t_run = time.perf_counter()
+    module.main()
+    print(f"[traci_run] {args.controller}: run={time.perf_counter() - t_run:.2f} s",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Webster 號誌時制計算
+
+- 週期：C0 = (1.5 L + 5) / (1 - Y)，限制在 [MIN_CYCLE, MAX_CYCLE]
+- 綠燈分配：有效綠 g_i = (C - L) · y_i / Y，顯示綠 = g_i + 每階段損失 - 黃燈
+- y_i：階段 i 的臨界車道流量比（車道流量 / 飽和流率，取該階段服務車道的最大值）
+
+階段（stage）= 相位計畫中的綠燈 phase；車道屬於哪個階段由 network_index 推導
+（左轉車道看左轉 link，其餘車道看直行 link）。
+
+AdaptiveWebster 在控制迴圈中以偵測器計數做滾動視窗流量估計，
+每 K 個週期檢查一次，流量比變化超過門檻才重新計算並換上新的 duration。
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from network_index import MOVEMENTS
+from phase_plan import PhasePlanError
+
+SAT_FLOW = 1800.0        # 飽和流率 veh/h/車道
+LOST_PER_STAGE = 4.0     # 每階段損失時間 (s)：起動損失 + 清道損失
+MIN_GREEN = 5.0          # s
+MIN_CYCLE = 40.0         # s
+MAX_CYCLE = 150.0        # s
+Y_MAX = 0.95             # Y 超過此值視為過飽和，週期取 MAX_CYCLE
+
+# 自適應模式預設值
+WINDOW_CYCLES = 4        # 滾動視窗長度（週期數）
+RECOMPUTE_EVERY = 2      # 每 K 個週期檢查一次
+RATIO_THRESHOLD = 0.02   # 任一階段 y 變化超過此值才重新計算
+
+
+@dataclass(frozen=True)
+class WebsterTiming:
+    """一次 Webster 計算的結果（秒）。"""
+
+    cycle: float             # 週期（含黃燈）
+    greens: tuple            # 各階段顯示綠燈
+    flow_ratios: tuple       # 各階段 y_i
+    Y: float
+    lost_time: float
+    saturated: bool          # Y >= Y_MAX
+
+
+def webster_cycle(Y, lost_time, min_cycle=MIN_CYCLE, max_cycle=MAX_CYCLE):
+    """Webster 最佳週期 (s)。"""
+    if Y >= Y_MAX:
+        return max_cycle
+    c0 = (1.5 * lost_time + 5.0) / (1.0 - Y)
+    return float(min(max(c0, min_cycle), max_cycle))
+
+
+_SOLVE_CACHE = {}
+
+
+def solve(flow_ratios, yellows, lost_per_stage=LOST_PER_STAGE, min_green=MIN_GREEN,
+          min_cycle=MIN_CYCLE, max_cycle=MAX_CYCLE):
+    """
+    flow_ratios: 各階段 y_i；yellows: 各階段黃燈秒數（不變）。
+    y 四捨五入到 1e-4 後作為快取 key。
+    """
+    y = tuple(round(max(float(v), 0.0), 4) for v in flow_ratios)
+    yellows = tuple(float(v) for v in yellows)
+    if len(y) != len(yellows):
+        raise ValueError("flow_ratios and yellows must have the same length")
+    key = (y, yellows, lost_per_stage, min_green, min_cycle, max_cycle)
+    cached = _SOLVE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    n = len(y)
+    lost = lost_per_stage * n
+    Y = sum(y)
+    cycle = webster_cycle(Y, lost, min_cycle, max_cycle)
+    effective = cycle - lost
+    if Y > 0:
+        g_eff = [effective * yi / Y for yi in y]
+    else:
+        g_eff = [effective / n] * n
+    greens = [max(g + lost_per_stage - yl, min_green) for g, yl in zip(g_eff, yellows)]
+    timing = WebsterTiming(
+        cycle=sum(greens) + sum(yellows),
+        greens=tuple(greens),
+        flow_ratios=y,
+        Y=Y,
+        lost_time=lost,
+        saturated=Y >= Y_MAX,
+    )
+    _SOLVE_CACHE[key] = timing
+    return timing
+
+
+# -------------------------
+# 相位計畫 ↔ 車道
+# -------------------------
+
+def stage_phases(plan):
+    """綠燈 phase 的 index（即 Webster 的階段）。"""
+    return np.flatnonzero(plan.is_green)
+
+
+def stage_yellows(plan, step_length=0.1):
+    """各階段後接的黃燈秒數（沒有黃燈則為 0）。"""
+    out = []
+    for p in stage_phases(plan):
+        nxt = int(plan.next_phase[p])
+        out.append(float(plan.durations[nxt]) * step_length if plan.is_yellow[nxt] else 0.0)
+    return tuple(out)
+
+
+def lane_primary_links(index):
+    """
+    (N_lane,) 每條車道代表的 link：左轉車道取左轉 link，其他車道取直行 link
+    （沒有直行則取第一個 link）。車道紀律讓左轉車道只留左轉車。
+    """
+    left = MOVEMENTS.index("left")
+    straight = MOVEMENTS.index("straight")
+    out = np.empty(len(index.lanes), dtype=np.int64)
+    for k, lane in enumerate(index.lanes):
+        links = np.flatnonzero(index.lane_link[k])
+        edge, lane_idx = lane.rsplit("_", 1)
+        want = left if int(lane_idx) == index.left_lane.get(edge) else straight
+        match = [i for i in links if index.link_movement[i] == want]
+        out[k] = match[0] if match else links[0]
+    return out
+
+
+def stage_lane_mask(plan, index):
+    """(S, N_lane) bool：階段 s 是否服務車道 k。"""
+    if plan.n_links != index.n_links:
+        raise PhasePlanError(f"plan has {plan.n_links} links, network has {index.n_links}")
+    primary = lane_primary_links(index)
+    return plan.link_green[stage_phases(plan)][:, primary]
+
+
+def stage_flow_ratios(lane_flows, mask, sat_flow=SAT_FLOW):
+    """lane_flows: (N_lane,) veh/h → (S,) 臨界流量比。"""
+    ratios = np.asarray(lane_flows, dtype=np.float64) / sat_flow
+    return np.where(mask, ratios[None, :], 0.0).max(axis=1)
+
+
+def apply_timing(plan, timing, step_length=0.1):
+    """把各階段綠燈換成 timing.greens（黃燈不變），回傳新的 PhasePlan。"""
+    durations = plan.durations.copy()
+    durations[stage_phases(plan)] = [max(1, int(round(g / step_length))) for g in timing.greens]
+    return plan.with_durations(durations)
+
+
+# -------------------------
+# 自適應（線上）
+# -------------------------
+
+class FlowWindow:
+    """最近 n_cycles 個週期的車道計數（環狀陣列 + 累計和）。"""
+
+    def __init__(self, n_lanes, n_cycles=WINDOW_CYCLES):
+        self.counts = np.zeros((n_cycles, n_lanes), dtype=np.float64)
+        self.seconds = np.zeros(n_cycles, dtype=np.float64)
+        self._sum_counts = np.zeros(n_lanes, dtype=np.float64)
+        self._sum_seconds = 0.0
+        self._pos = 0
+        self.filled = 0
+
+    def push(self, counts, seconds):
+        i = self._pos
+        self._sum_counts += counts - self.counts[i]
+        self._sum_seconds += seconds - self.seconds[i]
+        self.counts[i] = counts
+        self.seconds[i] = seconds
+        self._pos = (i + 1) % len(self.seconds)
+        self.filled = min(self.filled + 1, len(self.seconds))
+
+    def flows(self):
+        """(N_lane,) veh/h。"""
+        if self._sum_seconds <= 0:
+            return np.zeros_like(self._sum_counts)
+        return self._sum_counts * (3600.0 / self._sum_seconds)
+
+
+class AdaptiveWebster:
+    """
+    控制迴圈每個週期結束呼叫 end_cycle(lane_counts, seconds)；
+    回傳新的 PhasePlan（有更新時）或 None。
+    """
+
+    def __init__(self, plan, index, step_length=0.1, window_cycles=WINDOW_CYCLES,
+                 recompute_every=RECOMPUTE_EVERY, threshold=RATIO_THRESHOLD,
+                 sat_flow=SAT_FLOW, lost_per_stage=LOST_PER_STAGE):
+        self.plan = plan
+        self.step_length = step_length
+        self.mask = stage_lane_mask(plan, index)
+        self.yellows = stage_yellows(plan, step_length)
+        self.window = FlowWindow(len(index.lanes), window_cycles)
+        self.recompute_every = recompute_every
+        self.threshold = threshold
+        self.sat_flow = sat_flow
+        self.lost_per_stage = lost_per_stage
+        self.cycles = 0
+        self.updates = 0
+        self.timing = None
+        self._last_ratios = None
+
+    def end_cycle(self, lane_counts, seconds):
+        self.window.push(lane_counts, seconds)
+        self.cycles += 1
+        if self.cycles % self.recompute_every or self.window.filled < self.recompute_every:
+            return None
+        ratios = stage_flow_ratios(self.window.flows(), self.mask, self.sat_flow)
+        if (self._last_ratios is not None
+                and np.abs(ratios - self._last_ratios).max() <= self.threshold):
+            return None
+        self._last_ratios = ratios
+        timing = solve(ratios, self.yellows, self.lost_per_stage)
+        new_plan = apply_timing(self.plan, timing, self.step_length)
+        self.timing = timing
+        if np.array_equal(new_plan.durations, self.plan.durations):
+            return None
+        self.plan = new_plan
+        self.updates += 1
+        return new_plan
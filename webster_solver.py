@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+離線 Webster 時制求解：route 檔需求 → 最佳週期 / 綠燈分配 → 編譯好的 PhasePlan
+
+1. 讀 route 檔的 <flow>（vehsPerHour / period / probability / number）與 <trip>，
+   取「設計小時」的需求：預設為總需求最高的 1 小時（peak），或全時段平均（mean）
+2. (from, to) 經 network_index 對應到 TLS 的 link → 轉向與車道
+   （依車道紀律：左轉只走左轉車道，直行不走左轉車道，同一轉向平均分到可用車道）
+3. 各階段臨界流量比 y_i → webster.solve() → 換上新的綠燈 duration
+
+結果以「route 檔內容 + 路網索引 + 計畫 + 參數」的 sha1 為 key，
+存在 .cache/webster/<key>.json；同一情境在整個 sweep 中只求解一次。
+
+用法：
+    python webster_solver.py                                  # Traci.rou.xml
+    python webster_solver.py scenarios/*.rou.xml --window mean
+    TRACI_WEBSTER_MODE=offline python traci_Webster.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import webster
+from network_index import CACHE_DIR, MOVEMENTS, load_index
+from phase_plan import DEFAULT_PLAN
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTE_FILE = os.path.join(SCRIPT_DIR, "Traci.rou.xml")
+SOLVER_CACHE_DIR = os.path.join(CACHE_DIR, "webster")
+
+# 求解邏輯有變動時加 1
+SOLVER_VERSION = 1
+
+WINDOWS = ("peak", "mean")
+DESIGN_HOUR = 3600.0
+
+
+# -------------------------
+# route 檔 → (from, to) 需求
+# -------------------------
+
+def _flow_rate(elem):
+    """<flow> 的 veh/h；無法判斷時回傳 None。"""
+    begin = float(elem.get("begin", 0.0))
+    end = float(elem.get("end", 3600.0))
+    if elem.get("vehsPerHour") is not None:
+        return float(elem.get("vehsPerHour"))
+    if elem.get("period") is not None:
+        period = elem.get("period")
+        if period.startswith("exp("):        # Poisson：exp(rate/s)
+            return float(period[4:-1]) * 3600.0
+        return 3600.0 / float(period)
+    if elem.get("probability") is not None:
+        return float(elem.get("probability")) * 3600.0
+    if elem.get("number") is not None and end > begin:
+        return float(elem.get("number")) * 3600.0 / (end - begin)
+    return None
+
+
+def read_demand(route_path):
+    """
+    回傳 (intervals, unknown)：
+    intervals = [(from, to, begin, end, veh/h)]；<trip> 以 1 秒區間、3600 veh/h 表示一輛。
+    unknown = 無法換算流量或沒有 from/to 的元素數。
+    """
+    intervals, unknown = [], 0
+    for _, elem in ET.iterparse(route_path):
+        if elem.tag == "flow":
+            src, dst, rate = elem.get("from"), elem.get("to"), _flow_rate(elem)
+            if src and dst and rate is not None:
+                intervals.append((src, dst, float(elem.get("begin", 0.0)),
+                                  float(elem.get("end", 3600.0)), rate))
+            else:
+                unknown += 1
+        elif elem.tag == "trip":
+            src, dst = elem.get("from"), elem.get("to")
+            if src and dst:
+                t = float(elem.get("depart", 0.0))
+                intervals.append((src, dst, t, t + 1.0, 3600.0))
+            else:
+                unknown += 1
+        elif elem.tag == "vehicle":
+            unknown += 1
+        if elem.tag != "routes":
+            elem.clear()
+    return intervals, unknown
+
+
+def design_window(intervals, window="peak", hour=DESIGN_HOUR):
+    """
+    設計時段 (begin, end)：peak = 總車數最多的 1 小時（起點取各區間邊界）；
+    window 也可直接給 (begin, end)（時段計畫用）。
+    """
+    if isinstance(window, (tuple, list)):
+        return float(window[0]), float(window[1])
+    if not intervals:
+        return 0.0, hour
+    t0 = min(iv[2] for iv in intervals)
+    t1 = max(iv[3] for iv in intervals)
+    if window == "mean" or t1 - t0 <= hour:
+        return t0, t1
+
+    def vehicles(a, b):
+        return sum(rate * max(0.0, min(end, b) - max(begin, a))
+                   for _, _, begin, end, rate in intervals)
+
+    starts = sorted({iv[2] for iv in intervals} | {iv[3] - hour for iv in intervals})
+    starts = [s for s in starts if t0 <= s <= t1 - hour]
+    best = max(starts or [t0], key=lambda s: vehicles(s, s + hour))
+    return best, best + hour
+
+
+def od_rates(intervals, begin, end):
+    """{(from, to): 時段 [begin, end) 的平均 veh/h}。"""
+    span = max(end - begin, 1e-9)
+    out = {}
+    for src, dst, b, e, rate in intervals:
+        overlap = max(0.0, min(e, end) - max(b, begin))
+        if overlap > 0:
+            out[(src, dst)] = out.get((src, dst), 0.0) + rate * overlap / span
+    return out
+
+
+# -------------------------
+# 需求 → 車道流量
+# -------------------------
+
+def lane_flows(rates, index):
+    """
+    (N_lane,) veh/h 與無法對應到 TLS link 的 (from, to) 清單。
+    左轉只走左轉車道、直行避開左轉車道（與控制器的車道紀律一致）。
+    """
+    flows = np.zeros(len(index.lanes), dtype=np.float64)
+    unmatched = []
+    left = MOVEMENTS.index("left")
+    straight = MOVEMENTS.index("straight")
+    for (src, dst), vph in sorted(rates.items()):
+        links = [i for i in range(index.n_links)
+                 if index.link_from_edge[i] == src and index.link_to_edge[i] == dst]
+        if not links:
+            unmatched.append((src, dst))
+            continue
+        lanes = sorted({int(index.link_lane[i]) for i in links})
+        mv = int(index.link_movement[links[0]])
+        left_pos = index.lanes.index(f"{src}_{index.left_lane[src]}") if src in index.left_lane else None
+        if mv == left and left_pos in lanes:
+            lanes = [left_pos]
+        elif mv == straight and left_pos in lanes and len(lanes) > 1:
+            lanes = [k for k in lanes if k != left_pos]
+        flows[lanes] += vph / len(lanes)
+    return flows, unmatched
+
+
+# -------------------------
+# 求解 + 快取
+# -------------------------
+
+_MEMO = {}
+
+
+def _solve_key(route_path, index, plan, window, sat_flow, lost_per_stage):
+    h = hashlib.sha1()
+    with open(route_path, "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps({
+        "v": SOLVER_VERSION, "net": index.source, "states": plan.states,
+        "durations": plan.durations.tolist(),
+        "window": list(window) if isinstance(window, (tuple, list)) else window,
+        "sat_flow": sat_flow, "lost": lost_per_stage,
+        "min_green": webster.MIN_GREEN, "cycle": [webster.MIN_CYCLE, webster.MAX_CYCLE],
+    }, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def solve_routes(route_path=ROUTE_FILE, plan=DEFAULT_PLAN, index=None, window="peak",
+                 sat_flow=webster.SAT_FLOW, lost_per_stage=webster.LOST_PER_STAGE,
+                 step_length=0.1, cache_dir=SOLVER_CACHE_DIR):
+    """
+    回傳 (PhasePlan, info dict)。info 含 cycle / greens / flow_ratios / Y / 設計時段。
+    window: WINDOWS 之一或 (begin, end) 秒。
+    同一 key 在 process 內 memo，跨 process 讀 cache_dir 的 JSON。
+    """
+    if not isinstance(window, (tuple, list)) and window not in WINDOWS:
+        raise ValueError(f"window must be one of {WINDOWS} or (begin, end)")
+    index = index or load_index()
+    key = _solve_key(route_path, index, plan, window, sat_flow, lost_per_stage)
+    if key in _MEMO:
+        return _MEMO[key]
+
+    cache_path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+    info = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+
+    if info is None:
+        intervals, unknown = read_demand(route_path)
+        begin, end = design_window(intervals, window)
+        flows, unmatched = lane_flows(od_rates(intervals, begin, end), index)
+        ratios = webster.stage_flow_ratios(flows, webster.stage_lane_mask(plan, index), sat_flow)
+        timing = webster.solve(ratios, webster.stage_yellows(plan, step_length), lost_per_stage)
+        durations = webster.apply_timing(plan, timing, step_length).durations
+        info = {
+            "key": key,
+            "route_file": os.path.basename(route_path),
+            "window": [begin, end],
+            "cycle": timing.cycle,
+            "greens": list(timing.greens),
+            "flow_ratios": list(timing.flow_ratios),
+            "Y": timing.Y,
+            "saturated": timing.saturated,
+            "lane_flows": dict(zip(index.lanes, flows.round(1).tolist())),
+            "unmatched": [list(od) for od in unmatched],
+            "skipped_elements": unknown,
+            "durations": durations.tolist(),
+        }
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(info, f, indent=1)
+            os.replace(tmp, cache_path)
+
+    result = (plan.with_durations(info["durations"]), info)
+    _MEMO[key] = result
+    return result
+
+
+def plan_for_routes(route_path=None, **kwargs):
+    """traci_Webster.py 用：只回傳 PhasePlan（route_path 預設 Traci.rou.xml）。"""
+    return solve_routes(route_path or ROUTE_FILE, **kwargs)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Webster timing from route demand")
+    parser.add_argument("routes", nargs="*", default=[ROUTE_FILE])
+    parser.add_argument("--window", choices=WINDOWS, default="peak",
+                        help="peak: 需求最高的 1 小時；mean: 全時段平均")
+    parser.add_argument("--sat-flow", type=float, default=webster.SAT_FLOW, help="veh/h/車道")
+    parser.add_argument("--lost", type=float, default=webster.LOST_PER_STAGE, help="每階段損失 (s)")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    index = load_index()
+    names = [DEFAULT_PLAN.names[p] for p in webster.stage_phases(DEFAULT_PLAN)]
+    print("| route file | window (s) | cycle (s) | Y | " + " | ".join(names) + " |")
+    print("|---|---|---:|---:|" + "---:|" * len(names))
+    for path in args.routes:
+        _, info = solve_routes(path, index=index, window=args.window, sat_flow=args.sat_flow,
+                               lost_per_stage=args.lost,
+                               cache_dir=None if args.no_cache else SOLVER_CACHE_DIR)
+        greens = " | ".join(f"{g:.0f}" for g in info["greens"])
+        flag = " (saturated)" if info["saturated"] else ""
+        print(f"| {info['route_file']} | {info['window'][0]:.0f}-{info['window'][1]:.0f} "
+              f"| {info['cycle']:.0f}{flag} | {info['Y']:.2f} | {greens} |")
+        if info["unmatched"]:
+            print(f"  warning: {len(info['unmatched'])} from/to pairs not through {index.tls_id}",
+                  file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()